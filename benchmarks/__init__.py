@@ -0,0 +1,15 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-20"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+"""
+Benchmarks of jsonvc, run with python -m benchmarks.run
+"""
+
+
+if __name__ == '__main__': pass
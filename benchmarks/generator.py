@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-20"
+__version__ = "0.0.0"
+
+__all__ = ('Profile', 'value', 'history', 'write_repo',)
+
+"""
+Synthetic histories of jsonvc repos for benchmarks
+"""
+
+from jsonvc import JSONVC
+from jsonvc.tools import get_nested_diff
+from jsonvc.entry import Entry
+from jsonvc.storage import open_storage
+from random import Random
+from pathlib import Path
+
+from typing import Any, Union, Dict, List
+
+
+class Profile:
+    """Shape of a synthetic history"""
+
+    entries: int
+    keys: int
+    value_size: int
+    depth: int
+    churn: float
+    seed: int
+
+    __slots__ = ('entries', 'keys', 'value_size', 'depth', 'churn', 'seed',)
+
+    def __init__(self,
+                 entries: int = 1_000,
+                 keys: int = 100,
+                 value_size: int = 16,
+                 depth: int = 1,
+                 churn: float = 0.05,
+                 seed: int = 0):
+        """
+        :param entries: Number of entries
+        :param keys: Number of top-level keys
+        :param value_size: Length of the strings at the leaves
+        :param depth: Nesting depth of the values, 0 for flat strings
+        :param churn: Share of the keys changed by each entry
+        :param seed: Seed of the random numbers, the same profile always generates the same history
+        """
+        self.entries = entries
+        self.keys = keys
+        self.value_size = value_size
+        self.depth = depth
+        self.churn = churn
+        self.seed = seed
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        """
+        Get the profile as a json serializable dict.
+
+        :return: dict
+        """
+        return dict((name, getattr(self, name),) for name in self.__slots__)
+
+    def __repr__(self) -> str: return f'Profile[{", ".join(f"{k}={v}" for k, v in self.as_dict().items())}]'
+
+
+def value(random: Random, size: int, depth: int) -> Any:
+    """
+    Get a random value.
+
+    :param random: Random numbers
+    :param size: Length of the strings at the leaves
+    :param depth: Nesting depth, 0 for a string
+    :return: str, or a dict holding a list at every other level
+    """
+    if depth <= 0: return ''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(size))
+    if depth % 2: return dict((f'k{index}', value(random, size, depth - 1),) for index in range(3))
+    return [value(random, size, depth - 1) for _ in range(3)]
+
+
+def history(profile: Profile) -> List[List[Union[int, Dict[Any, Any], List[Any]]]]:
+    """
+    Generate the entries of a repo, starting with all keys set and changing or deleting some of them per entry.
+
+    :param profile: Shape of the history
+    :return: Entries in their json serializable format
+    """
+    random = Random(profile.seed)
+    data = dict((f'key{index}', value(random, profile.value_size, profile.depth),) for index in range(profile.keys))
+    records = [Entry(1_500_000_000, dict(data)).history_entry()]
+    keys = list(data)
+    changed = min(max(int(profile.keys * profile.churn), 1), profile.keys)
+    for number in range(1, profile.entries):
+        new = dict(data)
+        for key in random.sample(keys, changed):  # deleted keys come back later
+            if key in new and random.random() < 0.1: del new[key]
+            else: new[key] = value(random, profile.value_size, profile.depth)
+        diff = get_nested_diff(data, new)
+        if diff is not None:
+            records.append(Entry(1_500_000_000 + number, diff.changes, diff.deletions,
+                                 patches=diff.patches).history_entry())
+        data = new
+    return records
+
+
+def write_repo(path: Union[Path, str], profile: Profile, checkpoint_interval: int = JSONVC.CHECKPOINT_INTERVAL) -> int:
+    """
+    Write a synthetic history to a repo file, with checkpoints like committed repos have.
+
+    :param path: Repo file, SQLite for its suffixes
+    :param profile: Shape of the history
+    :param checkpoint_interval: Store the full state every n entries, 0 to disable
+    :return: Number of entries written
+    """
+    repo = JSONVC(data=history(profile), checkpoint_interval=checkpoint_interval)
+    for index, entry in enumerate(repo.entries):
+        if checkpoint_interval and index and not index % checkpoint_interval: entry.checkpoint = dict()
+    repo.rebuild_checkpoints()
+    storage = open_storage(path)
+    storage.rewrite([entry.history_entry() for entry in repo.entries])
+    storage.close()
+    return len(repo.entries)
+
+
+if __name__ == '__main__': pass
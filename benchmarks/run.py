@@ -0,0 +1,225 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-20"
+__version__ = "0.0.0"
+
+__all__ = ('Case', 'cases', 'measure', 'run', 'compare',)
+
+"""
+Benchmarks of loading, building, committing, resetting and diffing repos
+
+Every case runs on a synthetic history (see benchmarks.generator) and gets
+repeated, with its setup (copying repo files, opening repos) left out of the
+timings. Results can be written as json and compared against a baseline:
+
+    python -m benchmarks.run --entries 10000 --output baseline.json
+    python -m benchmarks.run --entries 10000 --baseline baseline.json
+"""
+
+from jsonvc import JSONVC
+from jsonvc.tools import get_diff, get_nested_diff
+from jsonvc.cli import main as cli
+from benchmarks.generator import Profile, write_repo
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from statistics import mean
+from pathlib import Path
+from shutil import copyfile
+from time import perf_counter
+from io import StringIO
+from json import dump, load
+import platform
+import sys
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+Result = Dict[str, Union[float, List[float]]]
+
+
+class Case:
+    """Benchmark case, setup runs before every repetition without being timed"""
+
+    name: str
+    setup: Callable[[], Any]
+    action: Callable[[Any], Any]
+
+    __slots__ = ('name', 'setup', 'action',)
+
+    def __init__(self, name: str, action: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None):
+        """
+        :param name: Name of the case in the results
+        :param action: Timed function, gets what setup returned
+        :param setup: Untimed function preparing the action
+        """
+        self.name = name
+        self.setup = setup
+        self.action = action
+
+    def __repr__(self) -> str: return f'Case[{self.name}]'
+
+
+def command(*argv: str) -> None:
+    """
+    Run the command line interface without its output.
+
+    :param argv: Arguments, without the program name
+    :return: Nothing
+    """
+    arguments = sys.argv
+    sys.argv = ['jsonvc', '-ni', '-nd', *argv]  # timing the command itself, not a daemon
+    try:
+        with redirect_stdout(StringIO()): cli()
+    finally: sys.argv = arguments
+
+
+def cases(directory: Path, profile: Profile, commits: int = 100) -> List[Case]:
+    """
+    Write the repos of a profile and get the cases running on them.
+
+    :param directory: Directory for the repo files
+    :param profile: Shape of the history
+    :param commits: Number of auto-commits of the commit cases
+    :return: list of Case
+    """
+    base = directory / 'base.jsonvc'
+    database = directory / 'base.db'
+    work = directory / 'work.jsonvc'
+    write_repo(base, profile)
+    write_repo(database, profile)
+
+    def fresh() -> JSONVC:
+        copyfile(str(base), str(work))
+        return JSONVC(work)
+
+    def behind() -> JSONVC:
+        copyfile(str(base), str(work))
+        return JSONVC(work, write_behind=True)
+
+    def setting(repo: JSONVC) -> None:
+        for number in range(commits): repo[f'benchmark{number}'] = number
+        repo.close()  # waits for the writes behind
+
+    def states() -> Tuple[Dict[Any, Any], Dict[Any, Any]]:
+        repo = JSONVC(base)
+        return repo.state(len(repo.entries) // 2), dict(repo)
+
+    size = profile.entries
+    result = [
+        Case('load', lambda _: JSONVC(base)),
+        Case('load_lazy', lambda _: JSONVC(base, lazy=True)),
+        Case('load_sqlite', lambda _: JSONVC(database).close()),
+    ]
+    for percent in (0, 25, 50, 100,):
+        result.append(Case(f'build_{percent}', lambda repo, index=max(size * percent // 100 - 1, 0): repo.build(index),
+                           lambda: JSONVC(base)))
+    result += [
+        Case('commit', setting, fresh),
+        Case('commit_write_behind', setting, behind),
+        Case('reset', lambda repo: repo.reset(size // 2), fresh),
+        Case('strip', lambda repo: repo.strip(size // 2), fresh),
+        Case('get_diff', lambda data: get_diff(*data), states),
+        Case('get_nested_diff', lambda data: get_nested_diff(*data), states),
+        Case('cli_log', lambda _: command('log', str(base))),
+        Case('cli_diff', lambda _: command('diff', str(base), '--from', '0')),
+        Case('cli_commit', lambda _: command('commit', str(work), '{"benchmark": 1}'),
+             lambda: copyfile(str(base), str(work))),
+    ]
+    return result
+
+
+def measure(case: Case, repeat: int = 5) -> Result:
+    """
+    Time a case.
+
+    :param case: Case to run
+    :param repeat: Number of repetitions
+    :return: dict of the best and mean duration and all durations in seconds
+    """
+    runs = list()
+    for _ in range(repeat):
+        prepared = case.setup()
+        start = perf_counter()
+        case.action(prepared)
+        runs.append(perf_counter() - start)
+    return dict(best=min(runs), mean=mean(runs), runs=runs)
+
+
+def run(profile: Profile, repeat: int = 5, commits: int = 100, only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Run the benchmarks of a profile.
+
+    :param profile: Shape of the history
+    :param repeat: Number of repetitions per case
+    :param commits: Number of auto-commits of the commit cases
+    :param only: Names of the cases to run, all if None
+    :return: json serializable dict of the meta data and the results by case
+    """
+    results = dict()
+    with TemporaryDirectory() as directory:
+        for case in cases(Path(directory), profile, commits):
+            if only is None or case.name in only: results[case.name] = measure(case, repeat)
+    return dict(meta=dict(python=platform.python_version(), platform=platform.platform(),
+                          profile=profile.as_dict(), repeat=repeat, commits=commits),
+                results=results)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2) -> Dict[str, float]:
+    """
+    Compare results against a baseline by their best durations.
+
+    :param results: Results of run()
+    :param baseline: Earlier results of run()
+    :param tolerance: Share a case may get slower before it counts as regression
+    :return: dict of the regressed cases and their durations relative to the baseline
+    """
+    if results['meta']['profile'] != baseline['meta']['profile']:
+        print('Warning: the baseline was measured with another profile!', file=sys.stderr)
+    regressions = dict()
+    for name, result in results['results'].items():
+        if name not in baseline['results']: continue
+        ratio = result['best'] / baseline['results'][name]['best']
+        if ratio > 1 + tolerance: regressions[name] = ratio
+    return regressions
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Benchmarks of jsonvc repos with synthetic histories.')
+    parser.add_argument('-e', '--entries', type=int, default=1_000, help='Number of entries.')
+    parser.add_argument('-k', '--keys', type=int, default=100, help='Number of top-level keys.')
+    parser.add_argument('-s', '--value-size', dest='value_size', type=int, default=16,
+                        help='Length of the strings at the leaves.')
+    parser.add_argument('-d', '--depth', type=int, default=1, help='Nesting depth of the values.')
+    parser.add_argument('-c', '--churn', type=float, default=0.05, help='Share of the keys changed by each entry.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic history.')
+    parser.add_argument('-r', '--repeat', type=int, default=5, help='Number of repetitions per case.')
+    parser.add_argument('--commits', type=int, default=100, help='Number of auto-commits of the commit cases.')
+    parser.add_argument('--only', type=str, nargs='*', default=None, help='Names of the cases to run.')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Write the results as json to this file.')
+    parser.add_argument('-b', '--baseline', type=str, default=None, help='Compare against results of an earlier run.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.2,
+                        help='Share a case may get slower than the baseline before it fails.')
+    args = parser.parse_args()
+
+    profile = Profile(args.entries, args.keys, args.value_size, args.depth, args.churn, args.seed)
+    results = run(profile, args.repeat, args.commits, args.only)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file: baseline = load(file)
+    print(profile)
+    for name, result in results['results'].items():
+        line = f'{name:>20}: {result["best"] * 1_000:>10.2f} ms best {result["mean"] * 1_000:>10.2f} ms mean'
+        if baseline and name in baseline['results']:
+            line += f' {result["best"] / baseline["results"][name]["best"]:>6.2f}x baseline'
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as file: dump(results, file, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for name, ratio in regressions.items(): print(f'Regression: {name} takes {ratio:.2f}x the baseline')
+        if regressions: sys.exit(1)
+
+
+if __name__ == '__main__': main()
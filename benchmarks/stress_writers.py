@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-18"
+__version__ = "0.0.0"
+
+__all__ = ('stress',)
+
+"""
+Stress test of several processes committing to the same repo file
+
+Every process commits its own keys with locking enabled, afterwards the repo
+has to hold every entry and key, otherwise commits got lost.
+"""
+
+from jsonvc import JSONVC
+from multiprocessing import Process, Barrier
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from typing import Dict, Union
+
+
+def write(path: str, worker: int, commits: int, barrier: Barrier) -> None:
+    """
+    Commit a key per commit to a repo.
+
+    :param path: Repo file
+    :param worker: Number of the process
+    :param commits: Number of commits
+    :param barrier: Barrier to start all processes at once
+    :return: Nothing
+    """
+    repo = JSONVC(path, locking=True)
+    barrier.wait()
+    for commit in range(commits): repo[f'{worker}-{commit}'] = commit
+    repo.close()
+
+
+def stress(path: Union[Path, str], workers: int = 4, commits: int = 100) -> Dict[str, Union[int, float]]:
+    """
+    Let processes commit to the same repo at once and check that no entries got lost.
+
+    :param path: Repo file, SQLite for its suffixes
+    :param workers: Number of processes
+    :param commits: Number of commits per process
+    :return: dict of the numbers of commits expected and found and the commits per second
+    :raises AssertionError: If entries got lost
+    """
+    JSONVC.init(path)
+    barrier = Barrier(workers + 1)
+    processes = [Process(target=write, args=(str(path), worker, commits, barrier,)) for worker in range(workers)]
+    for process in processes: process.start()
+    barrier.wait()
+    start = perf_counter()
+    for process in processes: process.join()
+    duration = perf_counter() - start
+    if any(process.exitcode for process in processes): raise AssertionError('A writer failed!')
+    repo = JSONVC(path)
+    expected = dict((f'{worker}-{commit}', commit,) for worker in range(workers) for commit in range(commits))
+    result = dict(workers=workers, commits=workers * commits, entries=len(repo.entries),
+                  throughput=workers * commits / duration)
+    if len(repo.entries) != workers * commits or dict(repo) != expected:
+        raise AssertionError(f'Entries got lost: {result}')
+    return result
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Stress test of processes committing to the same jsonvc repo.')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='Number of writer processes.')
+    parser.add_argument('-c', '--commits', type=int, default=100, help='Number of commits per process.')
+    parser.add_argument('-s', '--suffix', type=str, default='.jsonvc', help="Suffix of the repo file, e.g. '.db'.")
+    args = parser.parse_args()
+    with TemporaryDirectory() as directory:
+        result = stress(Path(directory) / f'stress{args.suffix}', args.workers, args.commits)
+    print(f'{result["commits"]} commits of {result["workers"]} processes, {result["entries"]} entries, '
+          f'{result["throughput"]:.0f} commits/s')
+
+
+if __name__ == '__main__': main()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-19"
+__version__ = "0.0.0"
+
+__all__ = ('contention',)
+
+"""
+Contention of threads sharing a thread-safe repo
+
+Every thread runs the same mix of reads and commits, the throughput gets
+measured for growing numbers of threads.
+"""
+
+from jsonvc.threadsafe import ThreadSafeJSONVC
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+from typing import Dict, Union, Sequence, List
+
+THREADS: Sequence[int] = (1, 4, 16,)
+
+
+def work(repo: ThreadSafeJSONVC, worker: int, operations: int, writes: float) -> None:
+    """
+    Read and commit keys of a repo.
+
+    :param repo: Shared repo
+    :param worker: Number of the thread
+    :param operations: Number of operations
+    :param writes: Share of the operations which commit
+    :return: Nothing
+    """
+    every = max(int(1 / writes), 1) if writes else 0
+    for operation in range(operations):
+        if every and not operation % every: repo[f'{worker}-{operation % 10}'] = operation
+        else: repo.get(f'{worker}-{operation % 10}')
+
+
+def contention(path: Union[Path, str], threads: int, operations: int = 1_000, writes: float = 0.1) -> Dict[str, float]:
+    """
+    Measure the throughput of threads sharing a repo.
+
+    :param path: Repo file
+    :param threads: Number of threads
+    :param operations: Number of operations per thread
+    :param writes: Share of the operations which commit
+    :return: dict of the number of threads, the duration and the operations per second
+    """
+    repo = ThreadSafeJSONVC(path)
+    start = perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(work, repo, worker, operations, writes) for worker in range(threads)]:
+            future.result()
+    duration = perf_counter() - start
+    repo.close()
+    return dict(threads=threads, duration=duration, throughput=threads * operations / duration)
+
+
+def main() -> None:
+    parser = ArgumentParser(description='Contention of threads sharing a thread-safe jsonvc repo.')
+    parser.add_argument('-t', '--threads', type=int, nargs='*', default=list(THREADS), help='Numbers of threads.')
+    parser.add_argument('-o', '--operations', type=int, default=1_000, help='Number of operations per thread.')
+    parser.add_argument('-w', '--writes', type=float, default=0.1, help='Share of the operations which commit.')
+    args = parser.parse_args()
+    results: List[Dict[str, float]] = list()
+    with TemporaryDirectory() as directory:
+        for threads in args.threads:
+            results.append(contention(Path(directory) / f'contention-{threads}.jsonvc', threads, args.operations,
+                                      args.writes))
+    for result in results:
+        print(f'{result["threads"]:>3} threads: {result["throughput"]:>10.0f} operations/s')
+
+
+if __name__ == '__main__': main()
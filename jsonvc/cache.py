@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-15"
+__version__ = "0.0.0"
+
+__all__ = ('VersionCache',)
+
+"""
+Cache of built versions of jsonvc repos
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+from typing import Any, Optional, Tuple, Dict
+
+
+class VersionCache:
+    """
+    Size-bounded LRU cache of the data at entry indices.
+
+    Besides exact hits, it finds the nearest cached version below an index,
+    which replaying can start from instead of a checkpoint. It can be used
+    by several threads at once.
+    """
+
+    maxsize: int
+    versions: 'OrderedDict[int, Dict[Any, Any]]'
+    hits: int
+    misses: int
+    evictions: int
+    lock: Lock
+
+    __slots__ = ('maxsize', 'versions', 'hits', 'misses', 'evictions', 'lock',)
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.versions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+    def get(self, index: int) -> Optional[Dict[Any, Any]]:
+        """
+        Get the data at an index, counting a hit or miss.
+
+        :param index: Entry index
+        :return: dict (not to be changed), None if it is not cached
+        """
+        with self.lock:
+            data = self.versions.get(index)
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.versions.move_to_end(index)
+            return data
+
+    def nearest(self, index: int) -> Tuple[int, Optional[Dict[Any, Any]]]:
+        """
+        Get the cached version closest to an index, at or below it.
+
+        :param index: Entry index
+        :return: Index and data (not to be changed) of the version, -1 and None if there is none
+        """
+        with self.lock:
+            below = [cached for cached in self.versions if cached <= index]
+            if not below: return -1, None
+            nearest = max(below)
+            self.versions.move_to_end(nearest)
+            return nearest, self.versions[nearest]
+
+    def put(self, index: int, data: Dict[Any, Any]) -> None:
+        """
+        Cache the data at an index, evicting the least recently used version if the cache is full.
+
+        :param index: Entry index
+        :param data: dict, which must not be changed afterwards
+        :return: Nothing
+        """
+        if self.maxsize <= 0: return
+        with self.lock:
+            self.versions[index] = data
+            self.versions.move_to_end(index)
+            while len(self.versions) > self.maxsize:
+                self.versions.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, start: int = 0) -> None:
+        """
+        Drop the versions at and above an index, e.g. after the history changed there.
+
+        :param start: First entry index to drop
+        :return: Nothing
+        """
+        with self.lock:
+            for index in [index for index in self.versions if index >= start]: del self.versions[index]
+
+    def info(self) -> Dict[str, int]:
+        """
+        Get the counters and size of the cache.
+
+        :return: dict
+        """
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    size=len(self.versions), maxsize=self.maxsize)
+
+    def __len__(self) -> int: return len(self.versions)
+
+    def __contains__(self, index: int) -> bool: return index in self.versions
+
+
+if __name__ == '__main__': pass
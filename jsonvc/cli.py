@@ -5,16 +5,24 @@ __author__ = "Robin 'r0w' Weiland"
 __date__ = "2020-08-25"
 __version__ = "0.0.0"
 
-__all__ = ('main',)
+__all__ = ('main', 'command_parser', 'run', 'execute', 'DAEMON_COMMANDS',)
 
 from jsonvc.repo import JSONVC
-from jsonvc.tools import get_diff
-from argparse import ArgumentParser
-from json import loads
-from sys import stderr
+from jsonvc.tools import get_nested_diff
+from jsonvc.storage import open_storage, convert
+from jsonvc.server import Server, Repos, Response, request, SOCKET
+from jsonvc.ingest import documents
+from jsonvc.entry import Entry
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+from json import loads, dumps
+from io import StringIO
+import sys
+from os import getcwd
 from re import sub
+import signal
 
-from typing import Union, List
+from typing import Optional, Union, Callable, List, TextIO
 
 # no pyfiglet for the dependency
 intro: str = r"""
@@ -30,17 +38,23 @@ _________ _______  _______  _                 _______
 
 PARSE_REGEX: str = r"""(\w+):\s*(-?\d[\d/.]*)"""
 
+DAEMON_COMMANDS: List[str] = ['commit', 'diff', 'log', 'reset', 'strip']  # commands a running daemon takes over
+
 
 def parse_data(data: Union[List[str], str]) -> str:
     return sub(PARSE_REGEX, r'"\1": "\2"', ''.join(data) if isinstance(data, list) else data)
 
 
-def main():
+def command_parser() -> ArgumentParser:
     parser = ArgumentParser(prog='jsonvc', description='Tiny version control for json files',
                             epilog=f'jsonvc v{__version__} [{__date__}] by {__author__}')
 
     parser.add_argument('-ni', '--no-intro', dest='no_intro', action='store_true',
                         help='Do not show the intro.')
+    parser.add_argument('-nd', '--no-daemon', dest='no_daemon', action='store_true',
+                        help='Run in this process, even if a daemon is running.')
+    parser.add_argument('-s', '--socket', type=str, default=SOCKET,
+                        help='Socket of the daemon [Defaults to $JSONVC_SOCKET, else $XDG_RUNTIME_DIR or temp dir].')
 
     commands = parser.add_subparsers(dest='command', help='Subcommands')
 
@@ -51,6 +65,13 @@ def main():
             type=str,
             help='The path to the jsonvc repo.'
         )
+    init.add_argument(
+        '-c',
+        '--codec',
+        type=str,
+        default=None,
+        help="Codec to compress the repo with, optionally with a level, e.g. 'zlib:1' or 'lzma:9'."
+    )
 
     commit = commands.add_parser('commit', help='Commit changes to a jsonvc repo.')
     commit.add_argument(
@@ -77,6 +98,38 @@ def main():
         type=str,
         help='The new data; must be json serialized string!'
     )
+    diff.add_argument(
+        '-f',
+        '--from',
+        dest='start',
+        type=int,
+        default=None,
+        help='Index of the repo entry to compare from instead of comparing new data.'
+    )
+    diff.add_argument(
+        '-t',
+        '--to',
+        dest='stop',
+        type=int,
+        default=None,
+        help='Index of the repo entry to compare to [Defaults to the latest entry].'
+    )
+    diff.add_argument(
+        '-ft',
+        '--from-timestamp',
+        dest='start_timestamp',
+        type=float,
+        default=None,
+        help='Timestamp of the repo entry to compare from instead of comparing new data.'
+    )
+    diff.add_argument(
+        '-tt',
+        '--to-timestamp',
+        dest='stop_timestamp',
+        type=float,
+        default=None,
+        help='Timestamp of the repo entry to compare to [Defaults to the latest entry].'
+    )
 
     log = commands.add_parser('log', help='Show the history of the jsonvc repo.')
     log.add_argument(
@@ -129,54 +182,320 @@ def main():
         help='Timestamp for the repo entries to strip to.'
     )
 
+    compact = commands.add_parser('compact', help='Fold old history into a single entry, keeping the data.')
+    compact.add_argument(
+        'path',
+        type=str,
+        help='The path to the jsonvc repo.'
+    )
+    compact.add_argument(
+        '-i',
+        '--index',
+        type=int,
+        default=None,
+        help='Index of the first repo entry to keep.'
+    )
+    compact.add_argument(
+        '-t',
+        '--timestamp',
+        type=int,
+        default=None,
+        help='Timestamp of the first repo entry to keep.'
+    )
+    compact.add_argument(
+        '-k',
+        '--keep',
+        type=int,
+        default=None,
+        help='Number of latest repo entries to keep.'
+    )
+    compact.add_argument(
+        '-a',
+        '--max-age',
+        dest='max_age',
+        type=float,
+        default=None,
+        help='Maximum age of the repo entries to keep in seconds.'
+    )
+    compact.add_argument(
+        '-w',
+        '--window',
+        type=float,
+        default=None,
+        help='Squash repo entries committed within this many seconds into one.'
+    )
+
+    conversion = commands.add_parser('convert', help='Copy a jsonvc repo into another file, e.g. an SQLite database.')
+    conversion.add_argument(
+        'source',
+        type=str,
+        help='The path to the jsonvc repo.'
+    )
+    conversion.add_argument(
+        'target',
+        type=str,
+        help='The path to copy the repo to, SQLite for the suffixes .db, .sqlite and .sqlite3.'
+    )
+    conversion.add_argument(
+        '-c',
+        '--codec',
+        type=str,
+        default=None,
+        help="Codec to compress the copy with, optionally with a level, e.g. 'zlib:1' or 'lzma:9'."
+    )
+
+    importing = commands.add_parser('import', help='Commit newline-delimited json documents as versions of a repo.')
+    importing.add_argument(
+        'path',
+        type=str,
+        help='The path to the jsonvc repo.'
+    )
+    importing.add_argument(
+        'file',
+        type=str,
+        nargs='?',
+        default='-',
+        help='File holding a json object or a [timestamp, object] pair per line [Defaults to stdin].'
+    )
+    importing.add_argument(
+        '-e',
+        '--every',
+        type=int,
+        default=None,
+        help='Write the repo after every n documents as well as at the end.'
+    )
+    importing.add_argument(
+        '-w',
+        '--workers',
+        type=int,
+        default=None,
+        help='Number of processes parsing the documents.'
+    )
+
+    export = commands.add_parser('export', help='Write every version of a jsonvc repo to stdout.')
+    export.add_argument(
+        'path',
+        type=str,
+        help='The path to the jsonvc repo.'
+    )
+    export.add_argument(
+        '--format',
+        type=str,
+        choices=('jsonl',),
+        default='jsonl',
+        help='Format of the versions: a [timestamp, data] pair per line, which jsonvc import reads.'
+    )
+    export.add_argument(
+        '-d',
+        '--diffs',
+        action='store_true',
+        help='Only write the differences of each version, as a [timestamp, changes, deletions, extras] record.'
+    )
+    export.add_argument(
+        '-f',
+        '--from',
+        dest='start',
+        type=int,
+        default=0,
+        help='Index of the first repo entry to write.'
+    )
+    export.add_argument(
+        '-t',
+        '--to',
+        dest='stop',
+        type=int,
+        default=None,
+        help='Index of the repo entry to stop at [Defaults to after the latest entry].'
+    )
+
+    commands.add_parser('serve', help='Keep repos in memory for the other commands, until interrupted.')
+
     branch = commands.add_parser('branch', help='Branches, yeah!')
     branch.add_argument(
         '_',
         nargs='*'
     )
 
-    args = parser.parse_args()
+    return parser
 
-    if not args.no_intro: print(intro, flush=True)
 
-    if args.command == 'branch': stderr.write('NICE TRY!')
+def run(args: Namespace,
+        out: Optional[TextIO] = None,
+        err: Optional[TextIO] = None,
+        repo: Callable[..., JSONVC] = JSONVC) -> int:
+    """
+    Run a command.
+
+    :param args: Parsed command line arguments
+    :param out: Stream for the output [Defaults to the current sys.stdout]
+    :param err: Stream for the error output [Defaults to the current sys.stderr]
+    :param repo: Function opening a repo by its path, e.g. taking it from memory
+    :return: Exit code
+    """
+    out = sys.stdout if out is None else out
+    err = sys.stderr if err is None else err
+    if args.command == 'branch':
+        err.write('NICE TRY!')
+        return 1
+    elif args.command == 'init':
+        try:
+            JSONVC.init(args.path[0], codec=args.codec)
+            print('Created repo.', file=out)
+        except ValueError as error:
+            err.write(str(error))
+            return 1
     elif args.command == 'log':
-        repo = JSONVC(args.path)
-        print(repo.info)
-        for entry in repo.entries:
-            print('\t', entry, sep='')
+        # only the record headers get read, the repo itself is not built
+        storage = open_storage(args.path)
+        if not storage.exists():
+            err.write(f'No repo at {args.path}!')
+            return 1
+        entries = storage.entries()
+        print(f'jsonvc-repo[{len(entries)} entries]', file=out)
+        for entry in entries:
+            print('\t', entry, sep='', file=out)
     elif args.command == 'diff':
-        updates, deletions, = get_diff(JSONVC(args.path), loads(parse_data(args.data)))
-        print('Differences:')
-        if diff is None:
-            print('Nothing')
-            return
-        print('\tUpdates:')
-        for key, value, in updates.items(): print(f'\t\t{key}: {value}')
-        print()
-        print('\tDeletions:')
-        for key in deletions: print(f'\t\t{key}')
+        if all(value is None for value in (args.start, args.stop, args.start_timestamp, args.stop_timestamp,)):
+            differences = get_nested_diff(repo(args.path), loads(parse_data(args.data)))
+        else:
+            # nothing gets built, the differences are composed from the entries in between
+            try:
+                differences = repo(args.path, keys=()).diff_between(
+                    args.start, args.stop, args.start_timestamp, args.stop_timestamp) or None
+            except IndexError:
+                err.write('Index or timestamp out of range')
+                return 1
+        print('Differences:', file=out)
+        if differences is None:
+            print('Nothing', file=out)
+            return 0
+        print('\tUpdates:', file=out)
+        for key, value, in differences.changes.items(): print(f'\t\t{key}: {value}', file=out)
+        print(file=out)
+        print('\tDeletions:', file=out)
+        for key in differences.deletions: print(f'\t\t{key}', file=out)
+        print(file=out)
+        print('\tPatches:', file=out)
+        for operation, path, *value in differences.patches: print(f'\t\t{operation} {path}', *value, file=out)
     elif args.command == 'commit':
-        JSONVC(args.path).update(loads(parse_data(args.data)))
-        print('Repo updtated and committed.')
+        repo(args.path).update(loads(parse_data(args.data)))
+        print('Repo updtated and committed.', file=out)
     elif args.command == 'reset':
         try:
-            JSONVC(args.path).reset(args.index, args.timestamp)
-            print('Reset repo.')
+            repo(args.path).reset(args.index, args.timestamp)
+            print('Reset repo.', file=out)
         except ValueError:
-            stderr.write('Provide index or timestamp!')
-            parser.print_help()
+            err.write('Provide index or timestamp!')
+            command_parser().print_help(out)
+            return 1
         except IndexError:
-            stderr.write('Index or timestamp out of range')
+            err.write('Index or timestamp out of range')
+            return 1
     elif args.command == 'strip':
         try:
-            JSONVC(args.path).strip(args.index, args.timestamp)
-            print('Striped repo.')
+            repo(args.path).strip(args.index, args.timestamp)
+            print('Striped repo.', file=out)
         except ValueError:
-            stderr.write('Provide index or timestamp!')
-            parser.print_help()
+            err.write('Provide index or timestamp!')
+            command_parser().print_help(out)
+            return 1
         except IndexError:
-            stderr.write('Index or timestamp out of range')
+            err.write('Index or timestamp out of range')
+            return 1
+    elif args.command == 'compact':
+        compacted = repo(args.path)
+        size = len(compacted.entries)
+        saved = compacted.compact(args.index, args.timestamp, args.keep, args.max_age, args.window)
+        print(f'Compacted repo from {size} to {len(compacted.entries)} entries, saving {saved} bytes.', file=out)
+    elif args.command == 'convert':
+        print(f'Converted repo with {convert(args.source, args.target, args.codec)} entries.', file=out)
+    elif args.command == 'import':
+        file = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+        try: added = repo(args.path).ingest(documents(file, args.workers), args.every)
+        except ValueError as error:
+            err.write(str(error))
+            return 1
+        finally:
+            if file is not sys.stdin: file.close()
+        print(f'Imported {added} entries.', file=out)
+    elif args.command == 'export':
+        # only the record headers get read up front, each record gets decoded when it is written
+        exported = repo(args.path, lazy=True, keys=())
+        try:
+            if args.diffs:
+                stop = len(exported.entries) if args.stop is None else args.stop
+                if not 0 <= args.start <= stop <= len(exported.entries): raise IndexError
+                for entry in exported.entries[args.start:stop]:
+                    diffs = entry.peek()
+                    record = Entry(entry.timestamp, diffs.changes, diffs.deletions, patches=diffs.patches)
+                    out.write(dumps(record.history_entry()) + '\n')
+            else:
+                for _, timestamp, data, in exported.iter_versions(args.start, args.stop):
+                    out.write(dumps([timestamp, dict(data)]) + '\n')
+        except IndexError:
+            err.write('Index out of range')
+            return 1
+        finally: exported.close()
+    return 0
+
+
+def execute(argv: List[str], cwd: str, repos: Repos) -> Response:
+    """
+    Run a command sent to the daemon, using the repos it keeps in memory.
+
+    :param argv: Command line arguments
+    :param cwd: Working directory of the client
+    :param repos: Repos in memory
+    :return: Exit code, output and error output
+    """
+    try: args = command_parser().parse_args(argv)
+    except SystemExit as error: return error.code or 0, '', 'Invalid arguments!'  # the client parsed them already
+    if args.command not in DAEMON_COMMANDS: return 2, '', f'The daemon does not run {args.command}!'
+    args.path = str(Path(cwd) / args.path)
+    out, err, = StringIO(), StringIO()
+    with repos.locked(args.path):
+        try: code = run(args, out, err, repos.open)
+        except BaseException:
+            repos.discard(args.path)  # it might be half-changed
+            raise
+    return code, out.getvalue(), err.getvalue()
+
+
+def serve(path: str) -> None:
+    """
+    Run the daemon until it gets interrupted or terminated.
+
+    :param path: Socket file
+    :return: Nothing
+    """
+    server = Server(path, execute)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f'Serving on {path}.', flush=True)
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
+    finally: server.server_close()
+
+
+def main():
+    parser = command_parser()
+    args = parser.parse_args()
+
+    if not args.no_intro and args.command != 'export': print(intro, flush=True)  # export writes data to stdout
+
+    if args.command == 'serve':
+        try: serve(args.socket)
+        except RuntimeError as error: sys.stderr.write(str(error))
+        return
+    if args.command in DAEMON_COMMANDS and not args.no_daemon:
+        response = request(sys.argv[1:], getcwd(), args.socket)
+        if response is not None:
+            code, output, errors, = response
+            sys.stdout.write(output)
+            sys.stderr.write(errors)
+            if code: sys.exit(code)
+            return
+    code = run(args)
+    if code: sys.exit(code)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-10"
+__version__ = "0.0.0"
+
+__all__ = ('Codec', 'register', 'get_codec', 'detect_codec', 'CODECS', 'DEFAULT_CODEC',)
+
+"""
+Registry of the compression codecs jsonvc repo files can use
+"""
+
+import gzip
+import zlib
+import bz2
+import lzma
+
+from typing import Any, Optional, Union, Callable, Tuple, Dict
+
+DEFAULT_CODEC: str = 'gzip'
+
+
+class Compressor:
+    """Functions and defaults of a registered codec"""
+
+    compress: Callable[[bytes, Optional[int]], bytes]
+    decompress: Callable[[bytes], bytes]
+    default: Optional[int]
+    magic: Tuple[bytes, ...]
+
+    __slots__ = ('compress', 'decompress', 'default', 'magic',)
+
+    def __init__(self,
+                 compress: Callable[[bytes, Optional[int]], bytes],
+                 decompress: Callable[[bytes], bytes],
+                 default: Optional[int],
+                 magic: Tuple[bytes, ...]):
+        self.compress = compress
+        self.decompress = decompress
+        self.default = default
+        self.magic = magic
+
+
+CODECS: Dict[str, Compressor] = dict()
+
+
+def register(name: str,
+             compress: Callable[[bytes, Optional[int]], bytes],
+             decompress: Callable[[bytes], bytes],
+             default: Optional[int] = None,
+             magic: Tuple[bytes, ...] = ()) -> None:
+    """
+    Register a codec, making it available to repo files.
+
+    :param name: Name of the codec, as stored in the header of repo files
+    :param compress: Function compressing bytes at a level
+    :param decompress: Function decompressing bytes
+    :param default: Level to use if none is given, None if the codec has no levels
+    :param magic: Bytes compressed data starts with, to detect the codec of files without header
+    :return: Nothing
+    """
+    if not name or any(char in name for char in ': \n'): raise ValueError(f'Invalid codec name {name!r}!')
+    CODECS[name] = Compressor(compress, decompress, default, magic)
+
+
+register('none', lambda data, level: data, lambda data: data)
+register('gzip', lambda data, level: gzip.compress(data, level), gzip.decompress, 9, (b'\x1f\x8b',))
+register('zlib', zlib.compress, zlib.decompress, 6, (b'\x78\x01', b'\x78\x5e', b'\x78\x9c', b'\x78\xda',))
+register('bz2', bz2.compress, bz2.decompress, 9, (b'BZh',))
+register('lzma', lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6, (b'\xfd7zXZ\x00',))
+
+
+class Codec:
+    """
+    Codec at a certain level, e.g. a low one for frequently written repos
+    and a high one for archives.
+    """
+
+    name: str
+    level: Optional[int]
+
+    __slots__ = ('name', 'level',)
+
+    def __init__(self, name: str, level: Optional[int] = None):
+        if name not in CODECS: raise ValueError(f'Unknown codec {name}!')
+        self.name = name
+        self.level = CODECS[name].default if level is None or CODECS[name].default is None else level
+
+    def compress(self, data: bytes) -> bytes: return CODECS[self.name].compress(data, self.level)
+
+    def decompress(self, data: bytes) -> bytes: return CODECS[self.name].decompress(data)
+
+    @property
+    def spec(self) -> str:
+        """Name and level of the codec, as stored in the header of repo files"""
+        return self.name if self.level is None else f'{self.name}:{self.level}'
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Codec) and (self.name, self.level,) == (other.name, other.level,)
+
+    def __hash__(self) -> int: return hash((self.name, self.level,))
+
+    def __bool__(self) -> bool: return self.name != 'none'
+
+    def __repr__(self) -> str: return f'Codec[{self.spec}]'
+
+
+def get_codec(codec: Union[bool, str, Codec, None]) -> Codec:
+    """
+    Get a codec from its spec, e.g. 'zlib:1', 'lzma' or whether to compress at all.
+
+    :param codec: Codec, spec str or bool
+    :return: Codec
+    """
+    if isinstance(codec, Codec): return codec
+    if codec is None or isinstance(codec, bool): return Codec(DEFAULT_CODEC if codec else 'none')
+    name, _, level, = codec.partition(':')
+    return Codec(name, int(level) if level else None)
+
+
+def detect_codec(data: bytes) -> Codec:
+    """
+    Detect the codec of compressed data from its first bytes.
+
+    :param data: Compressed data, or at least its start
+    :return: Codec, 'none' if no codec matched
+    """
+    for name, compressor in CODECS.items():
+        if compressor.magic and data.startswith(compressor.magic): return Codec(name)
+    return Codec('none')
+
+
+if __name__ == '__main__': pass
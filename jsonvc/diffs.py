@@ -11,20 +11,33 @@ __all__ = ('Diff',)
 Differences in jsonvc repos
 """
 
-from typing import Any, Optional, Union, Tuple, Dict, Set, Iterator, KeysView
+from jsonvc.patches import apply_patch, key_of
+from itertools import chain
+
+from typing import Any, Optional, Union, Tuple, Dict, Set, List, Iterator, KeysView, AbstractSet
 
 
 class Diff:
-    """jsonvc difference container"""
+    """
+    jsonvc difference container
+
+    Top-level keys are either changed, deleted or patched (nested changes as
+    json pointer operations), but never more than one of those at once.
+    """
 
     changes: Dict[Any, Any]
     deletions: Set[Any]
+    patches: List[List[Any]]
 
-    __slots__ = ('changes', 'deletions',)
+    __slots__ = ('changes', 'deletions', 'patches',)
 
-    def __init__(self, changes: Optional[Dict[Any, Any]] = None, deletions: Optional[Set[Any]] = None):
+    def __init__(self,
+                 changes: Optional[Dict[Any, Any]] = None,
+                 deletions: Optional[Set[Any]] = None,
+                 patches: Optional[List[List[Any]]] = None):
         self.changes = changes or dict()
         self.deletions = deletions or set()
+        self.patches = patches or list()
 
     def merge(self, other: 'Diff') -> None:
         """
@@ -37,17 +50,112 @@ class Diff:
         self.deletions.update(other.deletions)
         self.changes.update(other.changes)
         [self.changes.pop(key, None) for key in self.deletions]
+        self.drop_patches(other.changes.keys() | other.deletions)
+        [self.patch(operation) for operation in other.patches]
+
+    def apply(self,
+              data: Dict[Any, Any],
+              inverse: Optional['Diff'] = None,
+              keys: Optional[AbstractSet[Any]] = None) -> Dict[Any, Any]:
+        """
+        Apply the differences to a dict in-place.
+
+        Overridden methods of dict subclasses (e.g. repos) get bypassed.
+
+        :param data: dict to apply the differences to
+        :param inverse: Diff to add the differences undoing these ones to
+        :param keys: Only apply the differences of these top-level keys
+        :return: dict
+        """
+        if keys is not None: return self.select(keys).apply(data, inverse)
+        if inverse is not None:
+            for key in chain(self.changes, self.deletions):
+                if key in data: inverse.changes[key] = dict.__getitem__(data, key)
+                else: inverse.deletions.add(key)
+        dict.update(data, self.changes)
+        for key in self.deletions: dict.pop(data, key, None)
+        if self.patches:
+            patched = dict((key, dict.__getitem__(data, key),) for key in self.patched() if key in data)
+            apply_patch(patched, self.patches, None if inverse is None else inverse.patches)
+            dict.update(data, patched)
+        return data
+
+    def invert(self, data: Dict[Any, Any]) -> 'Diff':
+        """
+        Get the differences undoing these ones.
+
+        :param data: The data these differences get applied to, only the affected keys are needed
+        :return: Diff
+        """
+        inverse = Diff()
+        keys = chain(self.changes, self.deletions, self.patched())
+        self.apply(dict((key, dict.__getitem__(data, key),) for key in keys if key in data), inverse)
+        return inverse
+
+    def patched(self) -> Set[Any]:
+        """
+        Get the top-level keys with nested changes.
+
+        :return: set
+        """
+        return set(key_of(operation) for operation in self.patches)
+
+    def select(self, keys: AbstractSet[Any]) -> 'Diff':
+        """
+        Get the differences of some top-level keys only.
+
+        :param keys: Top-level keys
+        :return: Diff
+        """
+        return Diff(dict((key, value,) for key, value in self.changes.items() if key in keys),
+                    self.deletions & keys,
+                    [operation for operation in self.patches if key_of(operation) in keys])
+
+    def keys(self) -> Set[Any]:
+        """
+        Get the top-level keys which are changed, deleted or have nested changes.
+
+        :return: set
+        """
+        return set(chain(self.changes, self.deletions, self.patched()))
+
+    def patch(self, operation: List[Any], copies: Optional[Dict[int, Any]] = None) -> None:
+        """
+        Add a nested change, which gets folded into a changed value if there is one.
+
+        :param operation: Patch operation
+        :param copies: Copies made by earlier patches, see apply_patch()
+        :return: Nothing
+        """
+        key = key_of(operation)
+        if key in self.changes:
+            self.changes[key] = apply_patch({key: self.changes[key]}, [operation], None, copies)[key]
+        else: self.patches.append(operation)
+
+    def drop_patches(self, keys: Union[Set[Any], KeysView]) -> None:
+        """
+        Drop nested changes of top-level keys.
+
+        :param keys: Top-level keys
+        :return: Nothing
+        """
+        if self.patches and keys:
+            self.patches = [operation for operation in self.patches if key_of(operation) not in keys]
 
     def __bool__(self) -> bool: return bool(len(self))
 
-    def __str__(self) -> str: return f'Diff[{len(self.changes)} changes, {len(self.deletions)} deletions]'
+    def __str__(self) -> str:
+        return f'Diff[{len(self.changes)} changes, {len(self.deletions)} deletions, {len(self.patches)} patches]'
 
     def __repr__(self) -> str: return str(self)
 
-    def __len__(self) -> int: return len(self.changes) + len(self.deletions)
+    def __len__(self) -> int: return len(self.changes) + len(self.deletions) + len(self.patches)
 
     def __eq__(self, other: 'Diff') -> bool:
-        return isinstance(other, Diff) and self.changes == other.changes and self.deletions == other.deletions
+        return isinstance(other, Diff) \
+            and self.changes == other.changes \
+            and self.deletions == other.deletions \
+            and self.patches == other.patches
 
     def __iter__(self) -> Iterator[Union[dict, set]]: return iter((self.changes, self.deletions,))
 
@@ -59,22 +167,26 @@ class Diff:
         """
         self.changes.clear()
         self.deletions.clear()
+        self.patches.clear()
 
     # Methods to change diffs, by mimicing a dict
 
     def __setitem__(self, key: Any, value: Any) -> None:
         self.changes[key] = value
         self.deletions.discard(key)
+        self.drop_patches({key})
 
     def __delitem__(self, key: Any) -> None:
         self.changes.pop(key, None)
         self.deletions.add(key)
+        self.drop_patches({key})
 
     def update(self, current: Dict[Any, Any], updates: Dict[Any, Any]) -> None: pass
 
     def pop(self, k: Any) -> None:
         self.changes.pop(k, None)
         self.deletions.add(k)
+        self.drop_patches({k})
 
     # popitem() gets handled by pop()
 
@@ -83,6 +195,7 @@ class Diff:
 
     def clear(self, keys: Union[KeysView, Tuple[Any, ...]]) -> None:
         self.changes.clear()
+        self.patches.clear()
         self.deletions.update(keys)
 
 
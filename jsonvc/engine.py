@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-14"
+__version__ = "0.0.0"
+
+__all__ = ('merge_diffs', 'reduce_diffs', 'CHUNK_SIZE', 'PROCESS_SIZE',)
+
+"""
+Build engine reducing long histories of diffs in parallel
+
+Merging diffs is associative, so the diffs of many entries can be merged in
+chunks independently and the results combined pairwise, applying only the
+single diff left at the end. Repos decide when to do so themselves (see
+JSONVC.PARALLEL_THRESHOLD).
+"""
+
+from jsonvc.diffs import Diff
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from typing import Optional, Iterable, Sequence, List
+
+CHUNK_SIZE: int = 1_000  # number of diffs merged by a single task
+PROCESS_SIZE: int = 100_000  # number of operations from which diffs get merged in processes rather than threads
+
+
+def merge_diffs(diffs: Sequence[Diff]) -> Diff:
+    """
+    Merge diffs sequentially into a new one, leaving them as they are.
+
+    :param diffs: Diffs in the order of their entries
+    :return: Diff
+    """
+    merged = Diff()
+    for diff in diffs: merged.merge(diff)
+    return merged
+
+
+def reduce_diffs(diffs: Iterable[Diff],
+                 workers: Optional[int] = None,
+                 chunk_size: int = CHUNK_SIZE,
+                 threshold: int = 0,
+                 processes: Optional[bool] = None) -> Diff:
+    """
+    Merge diffs into one, in parallel as a tree reduction if there are enough of them.
+
+    Small payloads get merged in threads, as starting processes and pickling
+    the diffs for them would take longer than merging.
+
+    :param diffs: Diffs in the order of their entries
+    :param workers: Maximum number of workers [Defaults to the executor's default]
+    :param chunk_size: Number of diffs merged by a single task
+    :param threshold: Number of diffs below which they get merged sequentially
+    :param processes: Whether to merge in processes rather than threads [Defaults to PROCESS_SIZE operations or more]
+    :return: Diff, the same as merging them sequentially
+    """
+    diffs = list(diffs)
+    if len(diffs) < max(threshold, 2): return merge_diffs(diffs)
+    if processes is None: processes = sum(map(len, diffs)) >= PROCESS_SIZE
+    executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(workers)
+    with executor:
+        merged: List[Diff] = list(executor.map(merge_diffs, (diffs[start:start + chunk_size]
+                                                             for start in range(0, len(diffs), chunk_size))))
+        while len(merged) > 1:
+            merged = list(executor.map(merge_diffs, (merged[start:start + 2] for start in range(0, len(merged), 2))))
+    return merged[0]
+
+
+if __name__ == '__main__': pass
@@ -15,21 +15,31 @@ from jsonvc.diffs import Diff
 from functools import total_ordering
 from datetime import datetime
 
-from typing import Any, Union, Dict, List, Set
+from typing import Any, Optional, Union, Tuple, Dict, List, Set, AbstractSet
 
 
 @total_ordering
 class Entry:
     """Entries of commits in jsonvc repos."""
 
-    timestamp: int
+    timestamp: Union[int, float]
     diffs: Diff
-
-    __slots__ = ('timestamp', 'diffs',)
-
-    def __init__(self, timestamp: Union[int, datetime], changes: Dict[Any, Any] = None, deletions: Set[Any] = None):
+    checkpoint: Optional[Dict[Any, Any]]
+    inverse: Optional[Diff]
+
+    __slots__ = ('timestamp', 'diffs', 'checkpoint', 'inverse',)
+
+    def __init__(self,
+                 timestamp: Union[int, datetime],
+                 changes: Dict[Any, Any] = None,
+                 deletions: Set[Any] = None,
+                 checkpoint: Optional[Dict[Any, Any]] = None,
+                 patches: Optional[List[List[Any]]] = None,
+                 inverse: Optional[Diff] = None):
         self.timestamp = timestamp.timestamp() if isinstance(timestamp, datetime) else timestamp
-        self.diffs = Diff(changes, deletions)
+        self.diffs = Diff(changes, deletions, patches)
+        self.checkpoint = checkpoint
+        self.inverse = inverse
 
     @property
     def changes(self) -> Dict[Any, Any]: return self.diffs.changes
@@ -43,6 +53,12 @@ class Entry:
     @deletions.setter
     def deletions(self, value: Set[Any]): self.diffs.deletions = value
 
+    @property
+    def patches(self) -> List[List[Any]]: return self.diffs.patches
+
+    @patches.setter
+    def patches(self, value: List[List[Any]]) -> None: self.diffs.patches = value
+
     def __eq__(self, other: 'Entry') -> bool:
         return self.timestamp == other.timestamp
 
@@ -51,7 +67,9 @@ class Entry:
         return self.timestamp < other.timestamp
 
     def __str__(self) -> str:
-        return f'[{self.timestr()}; {len(self.changes)} changes, {len(self.deletions)} deletions]'
+        changes, deletions, patches, = self.summary()
+        patches = f', {patches} patches' if patches else ''
+        return f'[{self.timestr()}; {changes} changes, {deletions} deletions{patches}]'
 
     def __repr__(self) -> str:
         return str(self)
@@ -61,6 +79,22 @@ class Entry:
 
     def __hash__(self) -> int: return hash(self.timestamp + hash(dict))
 
+    def summary(self) -> Tuple[int, int, int]:
+        """
+        Get the number of changes, deletions and patches.
+
+        :return: tuple
+        """
+        return len(self.changes), len(self.deletions), len(self.patches)
+
+    def peek(self) -> Diff:
+        """
+        Get the differences without keeping them decoded, which only matters for lazy entries.
+
+        :return: Diff
+        """
+        return self.diffs
+
     def timestr(self) -> str:
         """
         Get humanly readable time from timestamp.
@@ -69,24 +103,50 @@ class Entry:
         """
         return str(datetime.fromtimestamp(self.timestamp)).replace(' ', '--')
 
-    def history_entry(self) -> List[Union[int, Dict[Any, Any], List[Any]]]:
+    def history_entry(self, inverse: bool = False) -> List[Union[int, Dict[Any, Any], List[Any]]]:
         """
         Get entry as a json serializable format.
 
+        Optional data (e.g. a checkpoint) gets stored in a fourth element,
+        which is left out if there is none to stay compatible with older repos.
+
+        :param inverse: Whether to store the inverse differences if known
         :return: list
         """
-        return [self.timestamp, self.changes, list(self.deletions)]
+        entry = [self.timestamp, self.changes, list(self.deletions)]
+        extras = self.extras(inverse)
+        if extras: entry.append(extras)
+        return entry
+
+    def extras(self, inverse: bool = False) -> Dict[str, Any]:
+        """
+        Get the optional data of an entry.
 
-    def apply(self, data: Dict[Any, Any]) -> Dict[Any, Any]:
+        :param inverse: Whether to include the inverse differences if known
+        :return: dict
+        """
+        extras = dict()
+        if self.patches: extras['patches'] = self.patches
+        if self.checkpoint is not None: extras['checkpoint'] = self.checkpoint
+        if inverse and self.inverse is not None:
+            extras['inverse'] = [self.inverse.changes, list(self.inverse.deletions), self.inverse.patches]
+        return extras
+
+    def apply(self,
+              data: Dict[Any, Any],
+              invert: bool = False,
+              keys: Optional[AbstractSet[Any]] = None) -> Dict[Any, Any]:
         """
         Apply changes from an entry to a dict.
 
         :param data: dict to apply the changes to
+        :param invert: Whether to store the differences undoing this entry on the way
+        :param keys: Only apply the changes of these top-level keys (not to be combined with invert)
         :return: dict
         """
-        data = data.copy()
-        data.update(self.changes)
-        for d in self.deletions: data.pop(d, None)
+        inverse = Diff() if invert else None
+        data = self.diffs.apply(dict(data), inverse, keys)
+        if invert: self.inverse = inverse
         return data
 
     @classmethod
@@ -97,7 +157,21 @@ class Entry:
         :param diff: Differences between commits
         :return: Entry
         """
-        return cls(int(datetime.now().timestamp()), *diff)
+        return cls(int(datetime.now().timestamp()), dict(diff.changes), set(diff.deletions), patches=list(diff.patches))
+
+    @classmethod
+    def from_history_entry(cls, entry: List[Union[int, Dict[Any, Any], List[Any]]]) -> 'Entry':
+        """
+        Get Entry from its json serializable format.
+
+        :param entry: Entry as stored in the repo file
+        :return: Entry
+        """
+        timestamp, changes, deletions, *extras = entry
+        extras = extras[0] if extras else dict()
+        inverse = extras.get('inverse')
+        if inverse is not None: inverse = Diff(inverse[0], set(inverse[1]), inverse[2])
+        return cls(timestamp, changes, set(deletions), extras.get('checkpoint'), extras.get('patches'), inverse)
 
 
 if __name__ == '__main__': pass
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-23"
+__version__ = "0.0.0"
+
+__all__ = ('document', 'parse', 'documents', 'CHUNK_SIZE',)
+
+"""
+Parsing of newline-delimited json documents to import into jsonvc repos
+
+Every line holds either a json object or a [timestamp, object] pair, empty
+lines get skipped. Chunks of lines can be parsed in a process pool, which
+only gets a few chunks ahead of the documents used, so the input is streamed.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from itertools import islice
+from json import loads
+
+from typing import Any, Optional, Union, Tuple, Dict, List, Iterable, Iterator
+
+Document = Tuple[Optional[Union[int, float]], Dict[Any, Any]]
+
+CHUNK_SIZE: int = 1_000  # number of lines parsed by a single task
+
+
+def document(line: str) -> Document:
+    """
+    Parse a single line.
+
+    :param line: json object or [timestamp, object] pair
+    :return: Timestamp (None if the line has none) and the document
+    :raises ValueError: If the line holds anything else
+    """
+    data = loads(line)
+    if isinstance(data, dict): return None, data
+    if isinstance(data, list) and len(data) == 2 and isinstance(data[0], (int, float,)) \
+            and not isinstance(data[0], bool) and isinstance(data[1], dict): return data[0], data[1]
+    raise ValueError(f'Expected a json object or a [timestamp, object] pair, got {line.strip()[:50]!r}!')
+
+
+def parse(lines: List[str]) -> List[Document]:
+    """
+    Parse lines, skipping empty ones.
+
+    :param lines: Lines of newline-delimited json
+    :return: list of timestamps and documents
+    """
+    return [document(line) for line in lines if line.strip()]
+
+
+def documents(lines: Iterable[str], workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE) -> Iterator[Document]:
+    """
+    Parse newline-delimited json documents, in order.
+
+    :param lines: Lines of newline-delimited json, e.g. a file
+    :param workers: Number of processes parsing chunks of lines, None or 0 to parse in this process
+    :param chunk_size: Number of lines parsed by a single task
+    :return: Iterator of timestamps (None if a line has none) and documents
+    """
+    lines = iter(lines)
+    chunks = iter(lambda: list(islice(lines, chunk_size)), list())
+    if not workers:
+        for chunk in chunks: yield from parse(chunk)
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque(executor.submit(parse, chunk) for chunk in islice(chunks, 2 * workers))
+        while pending:
+            parsed = pending.popleft().result()
+            for chunk in islice(chunks, 1): pending.append(executor.submit(parse, chunk))
+            yield from parsed
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-08"
+__version__ = "0.0.0"
+
+__all__ = ('LogFile', 'LazyEntry', 'load_entries',)
+
+"""
+Lazy, random-access loading of jsonvc repo files
+"""
+
+from jsonvc.entry import Entry
+from jsonvc.diffs import Diff
+from jsonvc.codecs import Codec
+from jsonvc.tools import load, log_version, parse_header, frames, decompression, CHECKPOINT_FLAG, INVERSE_FLAG
+from jsonvc.stats import current
+from jsonvc.locking import ConflictError
+from json import loads
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from os import fstat
+
+from typing import Any, Optional, Union, Tuple, Dict, List
+
+# the slots of Entry, which LazyEntry wraps in properties
+DIFFS = Entry.diffs
+CHECKPOINT = Entry.checkpoint
+INVERSE = Entry.inverse
+
+
+class LogFile:
+    """
+    Memory-mapped append-only log, giving access to single records.
+
+    Every record is compressed on its own, so a record can be decoded
+    without touching the rest of the file. A closed log gets mapped again on
+    its next read, as long as the file was not replaced in the meantime.
+    """
+
+    path: Path
+    data: Optional[mmap]
+    identity: Optional[Tuple[int, int]]
+    start: int
+    version: int
+    codec: Codec
+
+    __slots__ = ('path', 'data', 'identity', 'start', 'version', 'codec',)
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        self.data = None
+        self.identity = None
+        self.open()
+        self.start = self.data.find(b'\n') + 1
+        self.version, self.codec, = parse_header(self.data[:self.start])
+
+    def open(self) -> None:
+        """
+        Map the file, again to also cover the records appended since.
+
+        :return: Nothing
+        :raises ConflictError: If the file was replaced in the meantime, where the records are not at their offsets
+        """
+        with self.path.open('rb') as file:
+            status = fstat(file.fileno())
+            if self.identity not in (None, (status.st_dev, status.st_ino,),):
+                raise ConflictError('The log was replaced in the meantime!')
+            data = mmap(file.fileno(), 0, access=ACCESS_READ)
+        if self.data is not None: self.data.close()
+        self.data, self.identity, = data, (status.st_dev, status.st_ino,),
+
+    def adopt(self) -> None:
+        """
+        Take over the file replacing the log, which starts with the same records (see tools.truncate()).
+
+        :return: Nothing
+        """
+        status = self.path.stat()
+        self.identity = (status.st_dev, status.st_ino,)
+
+    def entries(self) -> List[Entry]:
+        """
+        Get the entries of the log, decoding them only if the record headers lack their timestamps.
+
+        :return: list of entries
+        """
+        if self.version < 2: return [Entry.from_history_entry(self.read(offset, fields[0]))
+                                     for offset, fields in frames(self.data, self.start, self.version)]
+        return [LazyEntry(self, offset, *fields) for offset, fields in frames(self.data, self.start, self.version)]
+
+    def read(self, offset: int, size: int) -> List[Union[int, Dict[Any, Any], List[Any]]]:
+        """
+        Decode a single record.
+
+        :param offset: Offset of the payload
+        :param size: Size of the payload
+        :return: Entry in its json serializable format
+        """
+        if self.data.closed: self.open()
+        stats = current()
+        if stats is None: return loads(decompression(self.data[offset:offset + size], self.codec))
+        with stats.timer('decompress'): text = decompression(self.data[offset:offset + size], self.codec)
+        with stats.timer('decode'): record = loads(text)
+        stats.count('bytes_read', size)
+        stats.count('raw_bytes_read', len(text))
+        stats.count('entries_read')
+        return record
+
+    def close(self) -> None:
+        """Unmap the file until its next read."""
+        self.data.close()
+
+
+class LazyEntry(Entry):
+    """Entry of a log file, which gets decoded as soon as its changes are needed."""
+
+    source: LogFile
+    offset: int
+    size: int
+    counts: Tuple[int, int, int]
+    flags: int
+    loaded: bool
+
+    __slots__ = ('source', 'offset', 'size', 'counts', 'flags', 'loaded',)
+
+    def __init__(self,
+                 source: LogFile,
+                 offset: int,
+                 size: int,
+                 timestamp: float,
+                 changes: int,
+                 deletions: int,
+                 patches: int,
+                 flags: int):
+        self.timestamp = int(timestamp) if timestamp.is_integer() else timestamp
+        self.source = source
+        self.offset = offset
+        self.size = size
+        self.counts = (changes, deletions, patches,)
+        self.flags = flags
+        self.loaded = False
+        INVERSE.__set__(self, None)
+
+    def load(self) -> None:
+        """Decode the record of the entry, if that did not happen yet."""
+        if self.loaded: return
+        entry = Entry.from_history_entry(self.source.read(self.offset, self.size))
+        DIFFS.__set__(self, entry.diffs)
+        CHECKPOINT.__set__(self, entry.checkpoint)
+        if INVERSE.__get__(self) is None: INVERSE.__set__(self, entry.inverse)
+        self.loaded = True
+
+    @property
+    def diffs(self) -> Diff:
+        self.load()
+        return DIFFS.__get__(self)
+
+    @diffs.setter
+    def diffs(self, value: Diff) -> None:
+        self.load()
+        DIFFS.__set__(self, value)
+
+    @property
+    def checkpoint(self) -> Optional[Dict[Any, Any]]:
+        if not (self.loaded or self.flags & CHECKPOINT_FLAG): return None
+        self.load()
+        return CHECKPOINT.__get__(self)
+
+    @checkpoint.setter
+    def checkpoint(self, value: Optional[Dict[Any, Any]]) -> None:
+        self.load()
+        CHECKPOINT.__set__(self, value)
+
+    @property
+    def inverse(self) -> Optional[Diff]:
+        if not self.loaded and self.flags & INVERSE_FLAG: self.load()
+        return INVERSE.__get__(self)
+
+    @inverse.setter
+    def inverse(self, value: Optional[Diff]) -> None: INVERSE.__set__(self, value)
+
+    def peek(self) -> Diff:
+        if self.loaded: return DIFFS.__get__(self)
+        return Entry.from_history_entry(self.source.read(self.offset, self.size)).diffs
+
+    def summary(self) -> Tuple[int, int, int]: return super(LazyEntry, self).summary() if self.loaded else self.counts
+
+
+def load_entries(path: Union[Path, str]) -> List[Entry]:
+    """
+    Load the entries of a repo file, lazily if its format allows to.
+
+    :param path: File location
+    :return: list of entries
+    """
+    if log_version(path) >= 2: return LogFile(path).entries()
+    return [Entry.from_history_entry(entry) for entry in load(path)]
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-18"
+__version__ = "0.0.0"
+
+__all__ = ('FileLock', 'ConflictError',)
+
+"""
+Locking of jsonvc repo files shared by several processes
+"""
+
+from pathlib import Path
+
+try: import fcntl
+except ImportError: fcntl = None  # no advisory locks (e.g. on windows), locking does nothing
+
+from typing import Any, Optional, Union, Iterable, FrozenSet, IO
+
+
+class ConflictError(Exception):
+    """Commit conflicting with the entries another process committed in the meantime"""
+
+    keys: FrozenSet[Any]
+
+    def __init__(self, message: str, keys: Iterable[Any] = ()):
+        super(ConflictError, self).__init__(message)
+        self.keys = frozenset(keys)
+
+
+class FileLock:
+    """
+    Exclusive advisory lock (fcntl.flock) on a file next to a repo file.
+
+    The lock file is separate, since repo files get replaced when rewritten.
+    Locks can be entered again by the same instance.
+    """
+
+    path: Path
+    file: Optional[IO[bytes]]
+    depth: int
+
+    __slots__ = ('path', 'file', 'depth',)
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        self.file = None
+        self.depth = 0
+
+    def acquire(self) -> None:
+        """Wait for the lock and take it."""
+        if not self.depth:
+            self.file = self.path.open('ab')
+            try:
+                if fcntl is not None: fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            except BaseException:
+                self.file.close()
+                self.file = None
+                raise
+        self.depth += 1
+
+    def release(self) -> None:
+        """Give the lock back."""
+        self.depth -= 1
+        if self.depth: return
+        try:
+            if fcntl is not None: fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self) -> 'FileLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.release()
+        return False
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-03"
+__version__ = "0.0.0"
+
+__all__ = ('get_patch', 'apply_patch', 'shares', 'key_of', 'to_pointer', 'from_pointer', 'ADD', 'REPLACE', 'REMOVE',)
+
+"""
+Path-level changes of nested json values
+
+Patches are lists of operations in the spirit of RFC 6902, stored as
+compact lists: [op, path] or [op, path, value], where path is a json pointer
+(RFC 6901) whose first token is a top-level key of the repo.
+"""
+
+from itertools import chain
+
+from typing import Any, Optional, Union, Dict, List
+
+ADD: str = 'add'
+REPLACE: str = 'replace'
+REMOVE: str = 'remove'
+
+Operation = List[Any]
+
+
+def to_pointer(tokens: List[Union[str, int]]) -> str:
+    """
+    Get a json pointer from path tokens.
+
+    :param tokens: Keys and indices along the path
+    :return: str
+    """
+    return ''.join('/' + str(token).replace('~', '~0').replace('/', '~1') for token in tokens)
+
+
+def from_pointer(pointer: str) -> List[str]:
+    """
+    Get path tokens from a json pointer.
+
+    :param pointer: json pointer
+    :return: list of str
+    """
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer.split('/')[1:]]
+
+
+def key_of(operation: Operation) -> str:
+    """
+    Get the top-level key an operation changes.
+
+    :param operation: Patch operation
+    :return: str
+    """
+    return from_pointer(operation[1])[0]
+
+
+def get_patch(old: Any, new: Any, path: Optional[List[Union[str, int]]] = None) -> List[Operation]:
+    """
+    Get the operations needed to turn one json value into another.
+
+    Dictionaries get compared by key, lists by their common start and end
+    with the differing part in between spliced in.
+
+    :param old: The value to compare to
+    :param new: The value that gets compared
+    :param path: Path of the values
+    :return: list of operations
+    """
+    path = path or list()
+    if type(old) != type(new): return [[REPLACE, to_pointer(path), new]]
+    if isinstance(old, dict):
+        if not all(isinstance(key, str) for key in chain(old, new)): return [[REPLACE, to_pointer(path), new]]
+        operations = [[REMOVE, to_pointer(path + [key])] for key in old.keys() - new.keys()]
+        for key, value in new.items():
+            if key not in old: operations.append([ADD, to_pointer(path + [key]), value])
+            elif old[key] != value: operations.extend(get_patch(old[key], value, path + [key]))
+        return operations
+    if isinstance(old, list):
+        start = 0
+        while start < min(len(old), len(new)) and old[start] == new[start]: start += 1
+        end = 0
+        while end < min(len(old), len(new)) - start and old[-end - 1] == new[-end - 1]: end += 1
+        old_middle, new_middle, = old[start:len(old) - end], new[start:len(new) - end]
+        common = min(len(old_middle), len(new_middle))
+        operations = list()
+        for index in range(common):
+            operations.extend(get_patch(old_middle[index], new_middle[index], path + [start + index]))
+        operations.extend([REMOVE, to_pointer(path + [start + common])] for _ in range(len(old_middle) - common))
+        operations.extend([ADD, to_pointer(path + [start + index]), new_middle[index]]
+                          for index in range(common, len(new_middle)))
+        return operations
+    return [] if old == new else [[REPLACE, to_pointer(path), new]]
+
+
+def apply_patch(data: Dict[Any, Any],
+                operations: List[Operation],
+                inverse: Optional[List[Operation]] = None,
+                copies: Optional[Dict[int, Any]] = None) -> Dict[Any, Any]:
+    """
+    Apply operations to a dict in-place.
+
+    Nested values along the paths get copied before being changed, so
+    values shared with other versions of the data stay untouched.
+
+    :param data: dict to apply the operations to
+    :param operations: Patch operations
+    :param inverse: List to add the operations undoing the patch to
+    :param copies: Copies made by earlier patches by their ids, which get changed in-place and added to
+    :return: dict
+    """
+    copies = dict() if copies is None else copies  # keeps the copies alive, so their ids stay unique
+    undo: List[Operation] = list()
+    for operation in operations:
+        tokens = from_pointer(operation[1])
+        parent = data
+        for token in tokens[:-1]:
+            key = index_of(parent, token)
+            child = parent[key]
+            if id(child) not in copies:
+                child = child.copy()
+                copies[id(child)] = child
+                parent[key] = child
+            parent = child
+        kind, key, = operation[0], tokens[-1]
+        if inverse is not None: undo.append(invert(parent, tokens, operation))
+        if kind == REMOVE: del parent[index_of(parent, key)]
+        elif kind == ADD and isinstance(parent, list):
+            if key == '-': parent.append(operation[2])
+            else: parent.insert(index_of(parent, key), operation[2])
+        elif kind in (ADD, REPLACE,): parent[index_of(parent, key)] = operation[2]
+        else: raise ValueError(f'Unknown patch operation {kind}!')
+    if inverse is not None: inverse.extend(reversed(undo))
+    return data
+
+
+def shares(value: Any, copies: Dict[int, Any]) -> bool:
+    """
+    Determine whether a value is or contains one of the copies made by earlier patches.
+
+    :param value: json value
+    :param copies: Copies by their ids
+    :return: bool
+    """
+    if not isinstance(value, (dict, list,)): return False
+    if id(value) in copies: return True
+    return any(shares(item, copies) for item in (value.values() if isinstance(value, dict) else value))
+
+
+def invert(parent: Union[Dict[str, Any], List[Any]], tokens: List[str], operation: Operation) -> Operation:
+    """
+    Get the operation undoing another one, before the latter gets applied.
+
+    :param parent: The container the operation changes
+    :param tokens: Path tokens of the operation
+    :param operation: Patch operation
+    :return: operation
+    """
+    kind, key, = operation[0], tokens[-1]
+    if isinstance(parent, list):
+        if kind == ADD:
+            index = len(parent) if key == '-' else int(key)
+            return [REMOVE, to_pointer(tokens[:-1] + [index])]
+        kind = REPLACE if kind == REPLACE else ADD
+        return [kind, operation[1], parent[int(key)]]
+    if key in parent: return [ADD if kind == REMOVE else REPLACE, operation[1], parent[key]]
+    return [REMOVE, operation[1]]
+
+
+def index_of(container: Union[Dict[str, Any], List[Any]], token: str) -> Union[str, int]:
+    """
+    Get the key or index a path token stands for within a container.
+
+    :param container: dict or list
+    :param token: Path token
+    :return: key or index
+    """
+    return int(token) if isinstance(container, list) else token
+
+
+if __name__ == '__main__': pass
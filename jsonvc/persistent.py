@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-16"
+__version__ = "0.0.0"
+
+__all__ = ('PersistentMap', 'apply_diff',)
+
+"""
+Immutable, structurally shared mappings for versions of jsonvc repos
+
+PersistentMap is a hash array mapped trie (HAMT): changing a key copies only
+the nodes along its path, every other node is shared with the previous map.
+"""
+
+from jsonvc.diffs import Diff
+from jsonvc.patches import apply_patch
+from collections.abc import Mapping
+
+from typing import Any, Optional, Union, Tuple, Iterator
+
+BITS: int = 5
+MASK: int = (1 << BITS) - 1
+HASH_MASK: int = (1 << 64) - 1
+
+MISSING: object = object()
+
+
+def popcount(value: int) -> int: return bin(value).count('1')
+
+
+class Leaf:
+    """Single key and value"""
+
+    hash: int
+    key: Any
+    value: Any
+
+    __slots__ = ('hash', 'key', 'value',)
+
+    def __init__(self, hash: int, key: Any, value: Any):
+        self.hash = hash
+        self.key = key
+        self.value = value
+
+
+class Collision:
+    """Keys and values sharing the same hash"""
+
+    hash: int
+    items: Tuple[Tuple[Any, Any], ...]
+
+    __slots__ = ('hash', 'items',)
+
+    def __init__(self, hash: int, items: Tuple[Tuple[Any, Any], ...]):
+        self.hash = hash
+        self.items = items
+
+
+class Node:
+    """Inner node, holding a child for each bit set in its bitmap"""
+
+    bitmap: int
+    children: Tuple[Union['Node', Leaf, Collision], ...]
+
+    __slots__ = ('bitmap', 'children',)
+
+    def __init__(self, bitmap: int, children: Tuple[Union['Node', Leaf, Collision], ...]):
+        self.bitmap = bitmap
+        self.children = children
+
+    def get(self, hash: int, key: Any, shift: int) -> Any:
+        """
+        Look up a key.
+
+        :param hash: Hash of the key
+        :param key: The key
+        :param shift: Number of hash bits used by the nodes above
+        :return: The value, MISSING if the key is not there
+        """
+        node = self
+        while True:
+            bit = 1 << ((hash >> shift) & MASK)
+            if not node.bitmap & bit: return MISSING
+            child = node.children[popcount(node.bitmap & (bit - 1))]
+            if isinstance(child, Node):
+                node, shift, = child, shift + BITS
+                continue
+            if isinstance(child, Leaf): return child.value if child.hash == hash and child.key == key else MISSING
+            if child.hash == hash:
+                for item_key, value in child.items:
+                    if item_key == key: return value
+            return MISSING
+
+    def set(self, hash: int, key: Any, value: Any, shift: int) -> Tuple['Node', bool]:
+        """
+        Get a node with a key set, sharing every other child.
+
+        :param hash: Hash of the key
+        :param key: The key
+        :param value: The value
+        :param shift: Number of hash bits used by the nodes above
+        :return: The new node and whether the key was added
+        """
+        bit = 1 << ((hash >> shift) & MASK)
+        index = popcount(self.bitmap & (bit - 1))
+        if not self.bitmap & bit:
+            children = self.children[:index] + (Leaf(hash, key, value),) + self.children[index:]
+            return Node(self.bitmap | bit, children), True
+        child = self.children[index]
+        added = True
+        if isinstance(child, Node):
+            child, added, = child.set(hash, key, value, shift + BITS)
+            if child is self.children[index]: return self, False
+        elif isinstance(child, Leaf):
+            if child.hash == hash and child.key == key:
+                if child.value is value: return self, False
+                child, added, = Leaf(hash, key, value), False
+            elif child.hash == hash: child = Collision(hash, ((child.key, child.value,), (key, value,),))
+            else: child = merge(child, Leaf(hash, key, value), shift + BITS)
+        elif child.hash == hash:
+            items = tuple(item for item in child.items if item[0] != key)
+            added = len(items) == len(child.items)
+            child = Collision(hash, items + ((key, value,),))
+        else: child = merge(child, Leaf(hash, key, value), shift + BITS)
+        return Node(self.bitmap, self.children[:index] + (child,) + self.children[index + 1:]), added
+
+    def delete(self, hash: int, key: Any, shift: int) -> Tuple[Optional[Union['Node', Leaf, Collision]], bool]:
+        """
+        Get a node without a key, sharing every other child.
+
+        :param hash: Hash of the key
+        :param key: The key
+        :param shift: Number of hash bits used by the nodes above
+        :return: The new node (None if it is empty, the only leaf if there is one) and whether the key was removed
+        """
+        bit = 1 << ((hash >> shift) & MASK)
+        if not self.bitmap & bit: return self, False
+        index = popcount(self.bitmap & (bit - 1))
+        child = self.children[index]
+        if isinstance(child, Node):
+            child, removed, = child.delete(hash, key, shift + BITS)
+            if not removed: return self, False
+        elif isinstance(child, Leaf):
+            if child.hash != hash or child.key != key: return self, False
+            child = None
+        else:
+            if child.hash != hash: return self, False
+            items = tuple(item for item in child.items if item[0] != key)
+            if len(items) == len(child.items): return self, False
+            child = Leaf(hash, *items[0]) if len(items) == 1 else Collision(hash, items)
+        if child is not None:
+            return Node(self.bitmap, self.children[:index] + (child,) + self.children[index + 1:]), True
+        if self.bitmap == bit: return None, True
+        children = self.children[:index] + self.children[index + 1:]
+        if len(children) == 1 and not isinstance(children[0], Node): return children[0], True
+        return Node(self.bitmap & ~bit, children), True
+
+    def __iter__(self) -> Iterator[Tuple[Any, Any]]:
+        for child in self.children:
+            if isinstance(child, Node): yield from child
+            elif isinstance(child, Leaf): yield child.key, child.value
+            else: yield from child.items
+
+
+def merge(first: Union[Leaf, Collision], second: Union[Leaf, Collision], shift: int) -> Node:
+    """
+    Get a node holding two leaves with different hashes.
+
+    :param first: Leaf or collision
+    :param second: Leaf or collision
+    :param shift: Number of hash bits used by the nodes above
+    :return: Node
+    """
+    first_index, second_index, = (first.hash >> shift) & MASK, (second.hash >> shift) & MASK
+    if first_index == second_index: return Node(1 << first_index, (merge(first, second, shift + BITS),))
+    children = (first, second,) if first_index < second_index else (second, first,)
+    return Node((1 << first_index) | (1 << second_index), children)
+
+
+class PersistentMap(Mapping):
+    """
+    Immutable mapping, whose changes return new maps sharing all unchanged parts.
+
+    Keys get iterated in the order of their hashes, not in insertion order.
+    """
+
+    root: Node
+    size: int
+
+    __slots__ = ('root', 'size',)
+
+    def __init__(self, root: Optional[Node] = None, size: int = 0):
+        self.root = Node(0, ()) if root is None else root
+        self.size = size
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping) -> 'PersistentMap':
+        """
+        Get a map holding the items of another mapping.
+
+        :param mapping: dict or other mapping
+        :return: PersistentMap
+        """
+        return cls().update(mapping)
+
+    def set(self, key: Any, value: Any) -> 'PersistentMap':
+        """
+        Get a map with a key set.
+
+        :param key: The key
+        :param value: The value
+        :return: PersistentMap
+        """
+        root, added, = self.root.set(hash(key) & HASH_MASK, key, value, 0)
+        return self if root is self.root else PersistentMap(root, self.size + added)
+
+    def delete(self, key: Any) -> 'PersistentMap':
+        """
+        Get a map without a key.
+
+        :param key: The key
+        :return: PersistentMap
+        :raises KeyError: If the key is not there
+        """
+        root, removed, = self.root.delete(hash(key) & HASH_MASK, key, 0)
+        if not removed: raise KeyError(key)
+        if not isinstance(root, Node): root = Node(0, ()) if root is None else Node(1 << (root.hash & MASK), (root,))
+        return PersistentMap(root, self.size - 1)
+
+    def update(self, mapping: Mapping) -> 'PersistentMap':
+        """
+        Get a map with the items of another mapping set.
+
+        :param mapping: dict or other mapping
+        :return: PersistentMap
+        """
+        data = self
+        for key, value in mapping.items(): data = data.set(key, value)
+        return data
+
+    def thaw(self) -> dict:
+        """
+        Get the items as a (mutable) dict.
+
+        :return: dict
+        """
+        return dict(iter(self.root))
+
+    def __getitem__(self, key: Any) -> Any:
+        value = self.root.get(hash(key) & HASH_MASK, key, 0)
+        if value is MISSING: raise KeyError(key)
+        return value
+
+    def __contains__(self, key: Any) -> bool: return self.root.get(hash(key) & HASH_MASK, key, 0) is not MISSING
+
+    def __iter__(self) -> Iterator[Any]: return (key for key, _ in self.root)
+
+    def __len__(self) -> int: return self.size
+
+    def __repr__(self) -> str: return f'PersistentMap({self.thaw()!r})'
+
+
+def apply_diff(data: PersistentMap, diff: Diff) -> PersistentMap:
+    """
+    Apply differences to a persistent map, without changing it or the values it holds.
+
+    :param data: The map to apply the differences to
+    :param diff: Differences
+    :return: PersistentMap
+    """
+    data = data.update(diff.changes)
+    for key in diff.deletions:
+        if key in data: data = data.delete(key)
+    if diff.patches:
+        patched = dict((key, data[key],) for key in diff.patched() if key in data)
+        data = data.update(apply_patch(patched, diff.patches))
+    return data
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-04"
+__version__ = "0.0.0"
+
+__all__ = ('TrackedDict', 'TrackedList', 'track', 'untrack',)
+
+"""
+Proxies registering changes to nested values of jsonvc repos
+"""
+
+from jsonvc.patches import get_patch, to_pointer, ADD, REPLACE, REMOVE
+from collections.abc import MutableMapping, MutableSequence
+
+from typing import Any, Union, Tuple, Dict, List, Iterator, TYPE_CHECKING
+
+if TYPE_CHECKING: from jsonvc.repo import JSONVC
+
+
+def track(repo: 'JSONVC', path: List[Union[str, int]], value: Any) -> Any:
+    """
+    Wrap dicts and lists in proxies, other values get returned as they are.
+
+    :param repo: The repo the value belongs to
+    :param path: Path of the value within the repo
+    :param value: The value to wrap
+    :return: TrackedDict, TrackedList or value
+    """
+    if isinstance(value, dict): return TrackedDict(repo, path)
+    if isinstance(value, list): return TrackedList(repo, path)
+    return value
+
+
+def untrack(value: Any) -> Any:
+    """
+    Get the actual value behind a proxy, other values get returned as they are.
+
+    :param value: Proxy or value
+    :return: value
+    """
+    return value.value() if isinstance(value, (TrackedDict, TrackedList,)) else value
+
+
+class Tracked:
+    """
+    Base for proxies of nested values.
+
+    A proxy only stores the path of its value and looks it up on every access,
+    changes are passed to the repo as patch operations.
+    """
+
+    repo: 'JSONVC'
+    path: List[Union[str, int]]
+
+    __slots__ = ('repo', 'path',)
+
+    def __init__(self, repo: 'JSONVC', path: List[Union[str, int]]):
+        self.repo = repo
+        self.path = path
+
+    def value(self) -> Any:
+        """
+        Get the current value behind the proxy.
+
+        :return: dict or list
+        """
+        value = dict.__getitem__(self.repo, self.path[0])
+        for token in self.path[1:]: value = value[token]
+        return value
+
+    def pointer(self, key: Union[str, int]) -> str:
+        """
+        Get the json pointer of an item.
+
+        :param key: Key or index of the item
+        :return: str
+        """
+        return to_pointer(self.path + [key])
+
+    def replace(self, new: Any) -> None:
+        """
+        Replace the value behind the proxy, changing only what differs.
+
+        :param new: The new value
+        :return: Nothing
+        """
+        operations = get_patch(self.value(), new, self.path)
+        if operations: self.repo.patch(*operations)
+
+    def __len__(self) -> int: return len(self.value())
+
+    def __iter__(self) -> Iterator[Any]: return iter(self.value())
+
+    def __contains__(self, item: Any) -> bool: return item in self.value()
+
+    def __eq__(self, other: Any) -> bool: return self.value() == untrack(other)
+
+    def __str__(self) -> str: return str(self.value())
+
+    def __repr__(self) -> str: return repr(self.value())
+
+    def copy(self) -> Union[Dict[Any, Any], List[Any]]: return self.value().copy()
+
+
+class TrackedDict(Tracked, MutableMapping):
+    """Proxy of a dict within a jsonvc repo"""
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Any: return track(self.repo, self.path + [key], self.value()[key])
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.repo.patch([REPLACE if key in self.value() else ADD, self.pointer(key), untrack(value)])
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self.value(): raise KeyError(key)
+        self.repo.patch([REMOVE, self.pointer(key)])
+
+    def pop(self, key: str, *default: Any) -> Any:
+        if key not in self.value():
+            if default: return default[0]
+            raise KeyError(key)
+        value = self.value()[key]
+        del self[key]
+        return value
+
+    def popitem(self) -> Tuple[str, Any]:
+        if not self.value(): raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(list(self.value())))
+        return key, self.pop(key)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self.value(): self[key] = default
+        return self[key]
+
+    def update(self, __m: Any = (), **kwargs: Any) -> None:
+        new = dict(self.value())
+        new.update(__m, **kwargs)
+        self.replace(dict((key, untrack(value),) for key, value in new.items()))
+
+    def clear(self) -> None: self.replace(dict())
+
+
+class TrackedList(Tracked, MutableSequence):
+    """Proxy of a list within a jsonvc repo"""
+
+    __slots__ = ()
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice): return self.value()[index]
+        return track(self.repo, self.path + [self.position(index)], self.value()[index])
+
+    def __setitem__(self, index: Union[int, slice], value: Any) -> None:
+        if isinstance(index, slice):
+            new = self.value().copy()
+            new[index] = [untrack(item) for item in value]
+            self.replace(new)
+        else: self.repo.patch([REPLACE, self.pointer(self.position(index)), untrack(value)])
+
+    def __delitem__(self, index: Union[int, slice]) -> None:
+        if isinstance(index, slice):
+            new = self.value().copy()
+            del new[index]
+            self.replace(new)
+        else: self.repo.patch([REMOVE, self.pointer(self.position(index))])
+
+    def position(self, index: int) -> int:
+        """
+        Get a non-negative index, raising an IndexError for indices out of range.
+
+        :param index: Index into the list
+        :return: int
+        """
+        size = len(self.value())
+        if not -size <= index < size: raise IndexError('list index out of range')
+        return index % size
+
+    def pop(self, index: int = -1) -> Any:
+        index = self.position(index)
+        value = self.value()[index]
+        del self[index]
+        return value
+
+    def insert(self, index: int, value: Any) -> None:
+        size = len(self.value())
+        index = min(max(index + size if index < 0 else index, 0), size)
+        self.repo.patch([ADD, self.pointer(index), untrack(value)])
+
+    def extend(self, values: Any) -> None:
+        size = len(self.value())
+        operations = [[ADD, self.pointer(size + index), untrack(value)] for index, value in enumerate(values)]
+        if operations: self.repo.patch(*operations)
+
+    def __iadd__(self, values: Any) -> 'TrackedList':
+        self.extend(values)
+        return self
+
+    def reverse(self) -> None: self.replace(self.value()[::-1])
+
+    def sort(self, *args: Any, **kwargs: Any) -> None: self.replace(sorted(self.value(), *args, **kwargs))
+
+    def clear(self) -> None: self.replace(list())
+
+
+if __name__ == '__main__': pass
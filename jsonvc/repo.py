@@ -11,28 +11,51 @@ __all__ = ('JSONVC',)
 Module for simulating version control for json dictionaries
 """
 
-from jsonvc.tools import dump, load, index_from_timestamp, get_diff
+from jsonvc.tools import index_from_timestamp, get_nested_diff, get_value_patch, COMPRESSION
+from jsonvc.codecs import Codec, get_codec
 from jsonvc.entry import Entry
 from jsonvc.diffs import Diff
+from jsonvc.transaction import Transaction, running_task
+from jsonvc.storage import Storage, open_storage
+from jsonvc.locking import ConflictError
+from jsonvc.writer import Writer
+from jsonvc.stats import Stats, timed
+from jsonvc.engine import merge_diffs, reduce_diffs
+from jsonvc.cache import VersionCache
+from jsonvc.persistent import PersistentMap, apply_diff
+from jsonvc.patches import apply_patch, shares, key_of
+from jsonvc.proxies import track
 from pathlib import Path
 from datetime import datetime
+from json import loads, dumps
 from functools import wraps
-from operator import delitem
 
-from typing import Any, Optional, Union, List, Tuple, Dict, Mapping
+from asyncio import Lock, Task
+from concurrent.futures import Future
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from types import MappingProxyType
+
+from typing import Any, Optional, Union, List, Tuple, Dict, Mapping, Iterable, Iterator, FrozenSet, AbstractSet
 
 
 def auto_commit(method):
     """
     Automatically add and commit changes made by decorated methods if JSONVC.AUTO_CHANGE is set
+    and the repo is not within a transaction, changes of other tasks than the one within an
+    asynchronous transaction get added on their own
 
     :param method: Method to decorate
     :return: Decorator
     """
     @wraps(method)
     def wrapper(self, *args, **kwargs):
+        if self.transaction_owner is not None and self.transaction_owner is not running_task() \
+                and self.transaction_active is not None:
+            return self.transaction_active.outside(method, *args, **kwargs)
         data = method(self, *args, **kwargs)
-        if JSONVC.AUTO_COMMIT:
+        if JSONVC.AUTO_COMMIT and not self.transaction_depth:
             self.add()
             self.commit()
         return data
@@ -43,106 +66,776 @@ class JSONVC(dict):
     """jsonvc repo"""
 
     AUTO_COMMIT: bool = True
+    CHECKPOINT_INTERVAL: int = 100  # store the full state every n entries, 0 to disable
+    CHECKPOINT_SIZE: int = 10_000  # store the full state after n changes and deletions, 0 to disable
+    TRACK_NESTED: bool = False  # hand out proxies registering changes to nested dicts and lists
+    STORE_INVERSES: bool = False  # store the differences undoing entries in the repo file as well
+    WRITE_BEHIND: bool = False  # let a background thread write commits to disk
+    PARALLEL_THRESHOLD: int = 10_000  # merge the diffs of at least n entries to replay in parallel, 0 to disable
+    CACHE_SIZE: int = 0  # number of built versions to keep in memory, 0 to disable
+    CODEC: Optional[str] = None  # codec of repo files like 'zlib:1' or 'lzma:9', None keeps the one a file has
+    LOCKING: bool = False  # lock repo files while committing, taking over what other processes committed
+
+    MISSING: object = object()  # marks keys that did not exist before being changed
 
-    path: Path
+    path: Optional[Path]
+    storage: Optional[Storage]
     entries: List[Entry]
+    timestamps: 'array[float]'
+    key_index: Optional[Dict[Any, 'array[int]']]
     diff: Diff
     init_entry_size: int
+    rewrite: bool
+    truncation: Optional[int]
+    stamp: Any
+    head: Optional[int]
+    current_format: bool
+    before: Dict[Any, Any]
+    copies: Dict[int, Any]  # nested values patches copied since the last add(), which get changed in-place
+    checkpoint_interval: int
+    checkpoint_size: int
+    track_nested: bool
+    store_inverses: bool
+    lazy: bool
+    projection: Optional[FrozenSet[Any]]
+    codec: Optional[Codec]
+    cache: VersionCache
+    persistent: Optional[Tuple[int, PersistentMap]]
+    writer: Optional[Writer]
+    locking: bool
+    stats: Optional[Stats]
+    transaction_depth: int
+    transaction_lock: Optional[Lock]
+    transaction_owner: Optional[Task]
+    transaction_active: Optional[Transaction]  # the outermost one
 
-    def __init__(self, path: Optional[Union[Path, str]] = None, data: Optional[Dict[str, Any]] = None):
-        if path: self.path = Path(path)
+    def __init__(self,
+                 path: Optional[Union[Path, str, Storage]] = None,
+                 data: Optional[Dict[str, Any]] = None,
+                 checkpoint_interval: Optional[int] = None,
+                 checkpoint_size: Optional[int] = None,
+                 track_nested: Optional[bool] = None,
+                 store_inverses: Optional[bool] = None,
+                 lazy: bool = False,
+                 write_behind: Optional[bool] = None,
+                 codec: Optional[Union[str, Codec]] = None,
+                 keys: Optional[Iterable[Any]] = None,
+                 cache_size: Optional[int] = None,
+                 locking: Optional[bool] = None,
+                 stats: Optional[Stats] = None):
+        self.storage = open_storage(path) if path else None
+        self.path = self.storage.path if path else None
+        self.checkpoint_interval = JSONVC.CHECKPOINT_INTERVAL if checkpoint_interval is None else checkpoint_interval
+        self.checkpoint_size = JSONVC.CHECKPOINT_SIZE if checkpoint_size is None else checkpoint_size
+        self.track_nested = JSONVC.TRACK_NESTED if track_nested is None else track_nested
+        self.store_inverses = JSONVC.STORE_INVERSES if store_inverses is None else store_inverses
+        self.lazy = lazy
+        self.projection = None if keys is None else frozenset(keys)
+        self.cache = VersionCache(JSONVC.CACHE_SIZE if cache_size is None else cache_size)
+        self.persistent = None
+        codec = JSONVC.CODEC if codec is None else codec
+        self.codec = None if codec is None else get_codec(codec)
+        self.writer = Writer() if (JSONVC.WRITE_BEHIND if write_behind is None else write_behind) else None
+        self.locking = JSONVC.LOCKING if locking is None else locking
+        self.stats = stats
+        self.transaction_depth = 0
+        self.transaction_lock = None
+        self.transaction_owner = None
+        self.transaction_active = None
         super(JSONVC, self).__init__()
-        self.load(path, data)
+        self.load(self.storage, data)
         self.build()
 
-    def load(self, path: Optional[Union[Path, str]], data: Optional[Dict[str, Any]] = None) -> None:
+    @timed('load')
+    def load(self, path: Optional[Union[Path, str, Storage]], data: Optional[Dict[str, Any]] = None) -> None:
         """
         Load a repo either from a file or raw data.
 
-        :param path: Path to repo file
+        Lazy repos only read the record headers of their file, the records
+        themselves get decoded when they are needed.
+
+        :param path: Path to repo file, or its storage
         :param data: Raw repo data
         :return: Nothing
         """
-        if path:
-            if not Path(path).exists(): JSONVC.init(path)
-            data = load(path)
-        if not self.verify(data=data): raise Exception('Not a valid jsonvc file or dataset!')
-        self.entries = [Entry(*entry) for entry in data]
+        storage = open_storage(path) if path else None
+        if storage and not storage.exists(): storage.init(self.codec)
+        self.stamp = storage.stamp() if storage else None  # before reading, so later commits count as changes
+        if storage and self.lazy:
+            self.entries = storage.entries()
+            if not all(map(lambda previous, entry: previous.timestamp <= entry.timestamp,
+                           self.entries, self.entries[1:])):
+                raise Exception('Not a valid jsonvc file or dataset!')
+        else:
+            if storage: data = storage.records()
+            if not self.verify(data=data): raise Exception('Not a valid jsonvc file or dataset!')
+            self.entries = [Entry.from_history_entry(entry) for entry in data]
+        self.reindex()
         self.diff = Diff()
+        self.before = dict()
+        self.copies = dict()
         self.init_entry_size = len(self.entries)
+        self.rewrite = False
+        self.truncation = None
+        self.head = None
+        self.current_format = False
 
+    @timed('build')
     def build(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> None:
         """
         Build a dict from jsonvc repo either up to index or timestamp entries/commits.
 
+        Repos with a projection only build its keys.
+
         :param index: Entry index to build the dictionary up to
         :param timestamp: Timestamp to build the dictionary up to
         :return: Nothing
         """
-        if index is not None: state = index
-        elif timestamp is not None: state = index_from_timestamp(self.entries, timestamp)
-        else: state = len(self.entries) - 1
+        state = self.state_index(index, timestamp)
 
-        # TODO use JSONVC.index() above
+        super(JSONVC, self).clear()
+        self.head = -1
 
         if state < 0: return
 
-        if not 0 <= state <= len(self.entries): raise IndexError(f'State {state} was out of range [0, {len(self)}]!')
+        if not 0 <= state < len(self.entries):
+            raise IndexError(f'State {state} was out of range [0, {len(self.entries)}]!')
 
-        super(JSONVC, self).clear()
-        counter = 0
+        self.replay(self, state, self.projection, self.projection is None)
+        self.head = state
+
+    def replay(self,
+               data: Dict[Any, Any],
+               state: int,
+               keys: Optional[AbstractSet[Any]] = None,
+               invert: bool = False) -> Dict[Any, Any]:
+        """
+        Apply the entries up to an index to an empty dict in-place, starting from the nearest checkpoint.
+
+        Versions get cached without a key filter: a cached version gets copied
+        as it is, otherwise replaying starts from the nearest cached version
+        below the index if it is closer than the checkpoint.
+
+        At least JSONVC.PARALLEL_THRESHOLD entries get merged into a single diff
+        in parallel and applied at once, which leaves their inverses unknown.
+
+        :param data: Empty dict to apply the entries to
+        :param state: Entry index to apply the entries up to
+        :param keys: Only apply the changes of these top-level keys, skipping entries not touching them
+        :param invert: Whether to store the differences undoing each entry on the way
+        :return: dict
+        """
+        counter = self.checkpoint(state)
+        base = self.entries[counter].checkpoint if counter >= 0 else None
+        caching = keys is None and self.cache.maxsize > 0
+        if caching:
+            cached = self.cache.get(state)
+            if cached is not None:
+                dict.update(data, cached)
+                return data
+            nearest, version, = self.cache.nearest(state)
+            if nearest > counter: counter, base, = nearest, version
+        if base is not None:
+            if keys is not None: base = dict((key, base[key],) for key in keys if key in base)
+            dict.update(data, base)
+        numbers = list(self.touching(keys, counter + 1, state + 1))
+        if self.stats is not None: self.stats.count('entries_replayed', len(numbers))
+        if JSONVC.PARALLEL_THRESHOLD and len(numbers) >= JSONVC.PARALLEL_THRESHOLD:
+            diffs = (self.entries[number].diffs for number in numbers)
+            reduce_diffs(diffs if keys is None else (diff.select(keys) for diff in diffs),
+                         threshold=JSONVC.PARALLEL_THRESHOLD).apply(data)
+        else:
+            for number in numbers:
+                entry = self.entries[number]
+                if invert:
+                    entry.inverse = Diff()
+                    entry.diffs.apply(data, entry.inverse)
+                else: entry.diffs.apply(data, keys=keys)
+        if caching: self.cache.put(state, dict(data))
+        return data
+
+    def touching(self, keys: Optional[AbstractSet[Any]], start: int, stop: int) -> Iterator[int]:
+        """
+        Get the indices of the entries within a range that change any of some keys.
+
+        :param keys: Top-level keys, None for every key
+        :param start: First entry index
+        :param stop: Entry index to stop at
+        :return: Iterator of entry indices
+        """
+        if keys is None: return iter(range(start, stop))
+        if not keys: return iter(())
+        if self.key_index is None:
+            # the stored entries are indexed by the storage if it keeps a key index, the newer ones are not
+            stored = start if self.storage is None or self.rewrite else min(max(self.init_entry_size, start), stop)
+            numbers = self.storage.touching(keys, start, stored) if stored > start else list()
+            return iter(range(start, stop)) if numbers is None else chain(numbers, range(stored, stop))
+        histories = (self.key_index.get(key, ()) for key in keys)
+        return iter(sorted(set(chain.from_iterable(
+            history[bisect_left(history, start):bisect_left(history, stop)] for history in histories))))
+
+    def materialize(self,
+                    keys: Optional[Iterable[Any]] = None,
+                    index: Optional[int] = None,
+                    timestamp: Optional[Union[int, datetime]] = None) -> Dict[Any, Any]:
+        """
+        Get some keys at an entry as a new dict, only applying the entries changing them.
+
+        :param keys: Top-level keys [Defaults to the projection of the repo]
+        :param index: Entry index [Defaults to the latest entry]
+        :param timestamp: Timestamp in repo entries
+        :return: dict
+        """
+        state = self.state_index(index, timestamp)
+        if state >= len(self.entries): raise IndexError(f'State {state} was out of range [0, {len(self.entries)}]!')
+        if state < 0: return dict()
+        return self.replay(dict(), state, self.projection if keys is None else frozenset(keys))
+
+    def version(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> PersistentMap:
+        """
+        Get the data at an entry as an immutable map, sharing its structure with the other versions.
+
+        Every version only costs the keys changed since its predecessor, so many
+        of them can be kept at once. Versions get built from the latest one
+        handed out if it lies between the nearest checkpoint and the index.
+
+        :param index: Entry index [Defaults to the latest entry]
+        :param timestamp: Timestamp in repo entries
+        :return: PersistentMap
+        """
+        state = self.state_index(index, timestamp)
+        if state >= len(self.entries): raise IndexError(f'State {state} was out of range [0, {len(self.entries)}]!')
+        if state < 0: return PersistentMap()
+        counter = self.checkpoint(state)
+        if self.persistent is not None and counter <= self.persistent[0] <= state: counter, data, = self.persistent
+        elif counter >= 0: data = PersistentMap.from_mapping(self.entries[counter].checkpoint)
+        else: data = PersistentMap()
+        for entry in self.entries[counter + 1:state + 1]: data = apply_diff(data, entry.diffs)
+        self.persistent = (state, data,)
+        return data
+
+    def diff_between(self,
+                     start: Optional[int] = None,
+                     stop: Optional[int] = None,
+                     start_timestamp: Optional[Union[int, datetime]] = None,
+                     stop_timestamp: Optional[Union[int, datetime]] = None) -> Diff:
+        """
+        Get the differences turning the data at one entry into the data at another, without building either.
+
+        Forward, the diffs of the entries in between get merged. Backward, their
+        inverses get merged if all of them are known, otherwise only the keys
+        they touch get materialized at the target entry. Keys changed and
+        changed back within the range show up as changes nevertheless.
+
+        :param start: Entry index to compare from [Defaults to the latest entry]
+        :param stop: Entry index to compare to [Defaults to the latest entry]
+        :param start_timestamp: Timestamp in repo entries to compare from
+        :param stop_timestamp: Timestamp in repo entries to compare to
+        :return: Diff
+        """
+        start, stop, = self.state_index(start, start_timestamp), self.state_index(stop, stop_timestamp)
+        for state in (start, stop,):
+            if not -1 <= state < len(self.entries):
+                raise IndexError(f'State {state} was out of range [-1, {len(self.entries)})!')
+        if start == stop: return Diff()
+        if start < stop:
+            diffs = [entry.diffs for entry in self.entries[start + 1:stop + 1]]
+            return (reduce_diffs(diffs, threshold=JSONVC.PARALLEL_THRESHOLD)
+                    if JSONVC.PARALLEL_THRESHOLD and len(diffs) >= JSONVC.PARALLEL_THRESHOLD else merge_diffs(diffs))
+        entries = self.entries[stop + 1:start + 1]
+        if all(entry.inverse is not None for entry in entries):
+            return merge_diffs([entry.inverse for entry in reversed(entries)])
+        keys = frozenset(chain.from_iterable(entry.peek().keys() for entry in entries))
+        # replaying only the entries touching those keys, without indexing every entry first
+        data = self.replay(dict(), stop, keys) if stop >= 0 else dict()
+        return Diff(dict((key, data[key],) for key in keys if key in data), set(keys - data.keys()))
+
+    def iter_versions(self,
+                      start: int = 0,
+                      stop: Optional[int] = None) -> Iterator[Tuple[int, Union[int, float], Mapping[Any, Any]]]:
+        """
+        Iterate over the data at each entry of a range, applying one entry after another.
+
+        The data gets built for the first entry only and changed in-place
+        afterwards, so every version is the same read-only view, which changes
+        on the next step. Copy it to keep a version. The entries of lazy repos
+        get decoded without being kept, so only the current data stays in memory.
+
+        :param start: First entry index
+        :param stop: Entry index to stop at [Defaults to the number of entries]
+        :return: Iterator of the index, timestamp and data of each entry
+        :raises IndexError: If the range lies outside of the entries
+        """
+        stop = len(self.entries) if stop is None else stop
+        if not 0 <= start <= stop <= len(self.entries):
+            raise IndexError(f'Range [{start}, {stop}) was out of range [0, {len(self.entries)}]!')
+        entries = self.entries  # resetting replaces the list, the entries of the range stay as they are
+
+        def versions() -> Iterator[Tuple[int, Union[int, float], Mapping[Any, Any]]]:
+            if start == stop: return
+            data = self.replay(dict(), start)
+            view = MappingProxyType(data)
+            yield start, entries[start].timestamp, view
+            for index in range(start + 1, stop):
+                entry = entries[index]
+                entry.peek().apply(data)
+                yield index, entry.timestamp, view
+        return versions()
+
+    def state_index(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> int:
+        """
+        Get an entry index from either an index or timestamp, defaulting to the latest entry.
+
+        :param index: Index in the repo entries
+        :param timestamp: Timestamp in repo entries
+        :return: index int, -1 if there is no entry (yet)
+        """
+        if index is not None: return index
+        if timestamp is not None: return index_from_timestamp(self.timestamps, timestamp)
+        return len(self.entries) - 1
+
+    def checkout(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> None:
+        """
+        Build the dict at either an index or timestamp, starting from the current state if that is closer.
+
+        Depending on which touches fewer entries, the entries in between get
+        applied to or undone from the current state, or the dict gets built from
+        the nearest checkpoint. Undoing needs the inverse differences of the
+        entries, which get stored while building or adding them.
+
+        :param index: Index in the repo entries
+        :param timestamp: Timestamp in repo entries
+        :return: Nothing
+        """
+        state = self.index(index, timestamp)
+        rebuild = state - self.checkpoint(state)
+        if self.head is None or self.projection is not None: self.build(state)
+        elif self.head <= state and state - self.head <= rebuild:
+            for entry in self.entries[self.head + 1:state + 1]:
+                entry.inverse = Diff()
+                entry.diffs.apply(self, entry.inverse)
+        elif state < self.head and self.head - state <= rebuild \
+                and all(entry.inverse is not None for entry in self.entries[state + 1:self.head + 1]):
+            for entry in reversed(self.entries[state + 1:self.head + 1]): entry.inverse.apply(self)
+        else: self.build(state)
+        self.head = state
+
+    @timed('state')
+    def state(self, index: int) -> Dict[Any, Any]:
+        """
+        Get the data at an entry as a new dict, leaving the repo as it is.
+
+        :param index: Entry index to build the dictionary up to
+        :return: dict
+        """
+        if index < 0: return dict()
+        if index == self.head and self.projection is None and not self.diff and not self.before:  # nothing uncommitted
+            self.copies.clear()  # shared with the dict from now on
+            return dict(self)
+        return self.replay(dict(), index)
+
+    def as_of(self, timestamp: Union[int, datetime]) -> Dict[Any, Any]:
+        """
+        Get the data at a point in time as a new dict, leaving the repo as it is.
+
+        :param timestamp: Time to get the data at
+        :return: dict
+        """
+        return self.state(index_from_timestamp(self.timestamps, timestamp))
+
+    def entries_between(self, start: Union[int, datetime], end: Union[int, datetime]) -> List[Entry]:
+        """
+        Get the entries committed within a time range (including both ends).
+
+        :param start: Start of the time range
+        :param end: End of the time range
+        :return: list of entries
+        """
+        if isinstance(start, datetime): start = start.timestamp()
+        if isinstance(end, datetime): end = end.timestamp()
+        return self.entries[bisect_left(self.timestamps, start):bisect_right(self.timestamps, end)]
+
+    def value_at(self, key: Any, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> Any:
+        """
+        Get the value of a single key at an entry, without building the rest of the dict.
+
+        Only the entries since the key was last set as a whole (or since the
+        nearest checkpoint) get applied, which usually is a single one.
+
+        :param key: Top-level key
+        :param index: Entry index [Defaults to the latest entry]
+        :param timestamp: Timestamp in repo entries
+        :return: The value
+        :raises KeyError: If the key did not exist at that point
+        :raises IndexError: If the index lies outside of the entries
+        """
+        state = self.state_index(index, timestamp)
+        if not -1 <= state < len(self.entries):  # -1 is before the first entry, where no key existed
+            raise IndexError(f'State {state} was out of range [-1, {len(self.entries)})!')
+        if self.key_index is None: self.index_keys()
+        history = self.key_index.get(key, ())
+        position = bisect_right(history, state)
+        counter = self.checkpoint(state)
+        start = position - 1  # last entry setting or deleting the key as a whole
+        while start >= 0 and history[start] > counter and key in self.entries[history[start]].diffs.patched():
+            start -= 1
         data = dict()
-        while state >= counter:
-            data = self.entries[counter].apply(data)
-            counter += 1
+        if start >= 0 and history[start] > counter:
+            entry = self.entries[history[start]]
+            if key in entry.changes: data[key] = entry.changes[key]
+        elif counter >= 0 and key in self.entries[counter].checkpoint: data[key] = self.entries[counter].checkpoint[key]
+        for number in history[start + 1:position]:
+            apply_patch(data, [operation for operation in self.entries[number].patches if key_of(operation) == key])
+        if key not in data: raise KeyError(key)
+        return data[key]
 
-        super(JSONVC, self).update(data)
+    def key_history(self, key: Any) -> List[int]:
+        """
+        Get the indices of the entries which changed or deleted a key.
 
-    def dump(self, path: Union[Path, str] = None, compression=True, **kwargs) -> None:
+        :param key: Top-level key
+        :return: Sorted list of entry indices
         """
-        Store the jsonvc repo to a file.
+        if self.key_index is None: self.index_keys()
+        return list(self.key_index.get(key, ()))
+
+    def index_keys(self) -> None:
+        """Create the index of the entries changing each key, taking the one of the storage if it keeps one."""
+        stored = None if not self.lazy or self.storage is None or self.rewrite else self.storage.key_index()
+        if stored is not None:
+            key_index = dict((key, history[:bisect_left(history, self.init_entry_size)],)
+                             for key, history in stored.items())
+            start = self.init_entry_size
+        else: key_index, start, = dict(), 0
+        for index, entry in enumerate(self.entries[start:], start):
+            for key in entry.diffs.keys(): key_index.setdefault(key, array('l')).append(index)
+        self.key_index = key_index  # only complete indices get seen, e.g. by concurrent readers
+
+    def reindex(self) -> None:
+        """
+        Recreate the timestamp and key indices from the entries, e.g. after the history changed.
+
+        The key index of lazy repos gets created on its first use, as it needs every entry decoded.
+        """
+        self.timestamps = array('d', (entry.timestamp for entry in self.entries))
+        self.cache.invalidate()
+        self.persistent = None
+        if self.lazy: self.key_index = None
+        else: self.index_keys()
+
+    def checkpoint(self, index: int) -> int:
+        """
+        Get the index of the nearest entry with a checkpoint at or below index.
+
+        :param index: Entry index to start searching from
+        :return: index int, -1 if there is no checkpoint
+        """
+        while index >= 0 and self.entries[index].checkpoint is None: index -= 1
+        return index
+
+    def needs_checkpoint(self) -> bool:
+        """
+        Determine whether the last entry should store the full state.
+
+        :return: bool
+        """
+        index = len(self.entries) - 1
+        if index <= 0: return False
+        if self.checkpoint_interval and index % self.checkpoint_interval == 0: return True
+        if not self.checkpoint_size: return False
+        size = 0
+        for entry in reversed(self.entries):
+            if entry.checkpoint is not None: break
+            size += len(entry.diffs)
+        return size >= self.checkpoint_size
+
+    def rebuild_checkpoints(self) -> None:
+        """
+        Recalculate the full states stored in checkpoints, e.g. after the history changed.
+
+        Entries with checkpoints get replaced rather than changed in-place, as
+        transactions keep the previous ones to roll back to.
+        """
+        data = dict()
+        entries = list()
+        for entry in self.entries:
+            entry.diffs.apply(data)
+            if entry.checkpoint is not None:
+                entry = Entry(entry.timestamp, entry.changes, entry.deletions, dict(data), entry.patches, entry.inverse)
+            entries.append(entry)
+        self.entries = entries
+
+    @timed('dump')
+    def dump(self,
+             path: Union[Path, str] = None,
+             compression: Optional[Union[bool, str, Codec]] = None,
+             **kwargs) -> Optional[Future]:
+        """
+        Store the whole jsonvc repo to a file as an append-only log.
 
         :param path: File to store to [Defaults to JSONVC().path]
-        :param compression: Whether to compress the repo
+        :param compression: Whether to compress the repo, or its codec [Defaults to JSONVC().file_codec()]
         :param kwargs: json.dumps() kwargs
-        :return: Nothing
+        :return: Future of the write in write-behind mode, otherwise nothing
         """
         if not self.path and not path: raise Exception('Nowhere to dump to!')
-        if not self.path: self.path = Path(path)
-        dump(self.path,
-             [entry.history_entry() for entry in self.entries],
-             compression,
-             **kwargs)
+        if not self.path: self.storage, self.path, = open_storage(path), Path(path)
+        compression = self.file_codec() if compression is None else get_codec(compression)
+        records = [entry.history_entry(self.store_inverses) for entry in self.entries]
+        self.init_entry_size = len(self.entries)
+        self.rewrite = False
+        self.truncation = None
+        self.current_format = True
+        if self.writer is not None: return self.writer.submit(self.storage, records, True, codec=compression, **kwargs)
+        self.storage.rewrite(records, compression, **kwargs)
 
-    def commit(self, path: Union[Path, str] = None) -> bool:
+    @timed('commit')
+    def commit(self, path: Union[Path, str] = None) -> Union[bool, Future]:
         """
         Commit changes to the repo.
 
+        New entries get appended to the repo file and reset entries get cut
+        off of it, it only gets rewritten after the history itself was changed
+        (e.g. by strip()).
+
+        In write-behind mode the entries only get queued for the writer thread
+        and a future is returned instead, resolving to the same bool as soon as
+        they are on disk.
+
+        With locking, the repo file is locked while committing and the entries
+        other processes committed in the meantime get taken over first (see
+        rebase()). Those commits get written directly, even in write-behind mode.
+
         :param path: File to commit to [Defaults to JSONVC().path]
         :return: Whether there were chamges added
+        :raises ConflictError: If other processes committed conflicting changes in the meantime
         """
-        if len(self.entries) != self.init_entry_size:
-            self.dump(path)
-            self.build()
-            return True
-        return False
+        if not self.locking or not (self.path or path): return self.store(path)
+        if not self.path: self.storage, self.path, = open_storage(path), Path(path)
+        self.flush()
+        with self.storage.locked():
+            self.rebase()
+            writer, self.writer, = self.writer, None
+            try: result = self.store()
+            finally: self.writer = writer
+            self.stamp = self.storage.stamp()
+        return self.resolved(result)
+
+    def store(self, path: Union[Path, str] = None) -> Union[bool, Future]:
+        """
+        Write the changes to the repo file, without locking it.
+
+        :param path: File to commit to [Defaults to JSONVC().path]
+        :return: Whether there were chamges added
+        """
+        if self.rewrite:
+            future = self.dump(path)
+            if self.head != len(self.entries) - 1: self.build()
+            return True if future is None else future
+        if len(self.entries) == self.init_entry_size and self.truncation is None: return self.resolved(False)
+        if not self.path and not path: raise Exception('Nowhere to commit to!')
+        if not self.path: self.storage, self.path, = open_storage(path), Path(path)
+        if not self.current_format:
+            if self.storage.outdated(self.codec):
+                # older repo files get converted to the current log format (or codec) on their first commit
+                future = self.dump()
+                if self.head != len(self.entries) - 1: self.build()
+                return True if future is None else future
+            self.current_format = True
+        records = [entry.history_entry(self.store_inverses) for entry in self.entries[self.init_entry_size:]]
+        truncation, self.truncation, = self.truncation, None
+        self.init_entry_size = len(self.entries)
+        if self.writer is not None: future = self.writer.submit(self.storage, records, truncate=truncation)
+        else:
+            if truncation is not None: self.storage.truncate(truncation)
+            if records: self.storage.append(records)
+            future = None
+        # changes made to an older version got stored after the latest one, which is what the repo holds from now on
+        if self.head != len(self.entries) - 1: self.build()
+        return True if future is None else future
+
+    def rebase(self) -> None:
+        """
+        Take over the entries other processes committed since the repo was loaded or last committed,
+        moving the entries not committed yet after them.
+
+        :return: Nothing
+        :raises ConflictError: If those entries change keys that the uncommitted entries or changes do,
+            or the history was rewritten in the meantime
+        """
+        if self.stamp == self.storage.stamp(): return
+        stored = self.storage.entries() if self.storage.exists() else list()
+        size = self.init_entry_size
+        # the last entry both have in common, as it was stored
+        known = Entry.from_history_entry(loads(dumps(self.entries[size - 1].history_entry()))) if size else None
+        if self.rewrite or self.truncation is not None or len(stored) < size \
+                or (size and (stored[size - 1].timestamp, stored[size - 1].diffs,) != (known.timestamp, known.diffs,)):
+            raise ConflictError('The history was rewritten in the meantime!')
+        tail, pending, = stored[size:], self.entries[size:],
+        if not tail: return
+        keys = set(chain.from_iterable(entry.diffs.keys() for entry in tail))
+        conflicts = keys & set(chain(self.diff.keys(), chain.from_iterable(entry.diffs.keys() for entry in pending)))
+        if conflicts: raise ConflictError(f'Conflicting changes of {sorted(map(str, conflicts))}!', conflicts)
+        latest = self.head is not None and self.head == len(self.entries) - 1
+        for entry in pending:
+            entry.checkpoint = None  # it would lack the changes taken over
+            entry.timestamp = max(entry.timestamp, tail[-1].timestamp)
+        self.entries = self.entries[:size] + tail + pending
+        self.init_entry_size = size + len(tail)
+        if latest:
+            # the keys are disjoint, so the changes can be applied on top of the uncommitted ones
+            for entry in tail: entry.diffs.apply(self, keys=self.projection)
+            self.head = len(self.entries) - 1
+        else: self.head = None
+        self.reindex()
+
+    def file_codec(self) -> Codec:
+        """
+        Get the codec to write the repo file with.
+
+        :return: The codec of the repo, otherwise the one the file already has
+        """
+        if self.codec is not None: return self.codec
+        if self.storage is not None and self.storage.exists(): return self.storage.codec()
+        return get_codec(COMPRESSION)
+
+    def resolved(self, result: bool) -> Union[bool, Future]:
+        """
+        Get the result of a commit that did not write anything.
+
+        :param result: Result of the commit
+        :return: bool, or a resolved Future in write-behind mode
+        """
+        if self.writer is None: return result
+        future = Future()
+        future.set_result(result)
+        return future
+
+    def flush(self) -> None:
+        """
+        Wait for the commits queued in write-behind mode to be written.
+
+        :return: Nothing
+        """
+        if self.writer is not None: self.writer.flush()
+
+    def close(self) -> None:
+        """
+        Write the commits queued in write-behind mode and stop the writer thread,
+        later commits get written directly. The storage gets released as well,
+        including the log lazy entries are read from, it is reopened on its next use.
 
-    def add(self) -> bool:
+        :return: Nothing
+        """
+        writer, self.writer, = self.writer, None
+        try:
+            if writer is not None: writer.close()
+        finally:
+            if self.storage is not None: self.storage.close()
+
+    def add(self, timestamp: Optional[Union[int, float]] = None) -> bool:
         """
         Add changes to commit them.
 
+        :param timestamp: Timestamp of the entry [Defaults to now]
         :return: Whether changes are really different to already commited data
         """
         if self.diff:
-            self.entries.append(Entry.from_diff(self.diff))
+            entry = Entry.from_diff(self.diff)
+            if timestamp is not None: entry.timestamp = timestamp
+            if self.head == len(self.entries) - 1:
+                # keys outside of a projection were never built, so their previous values are unknown
+                if self.projection is None: entry.inverse = entry.diffs.invert(
+                    dict((key, value,) for key, value in self.before.items() if value is not JSONVC.MISSING))
+                self.head += 1
+            else: self.head = None  # changes were made to an older version, the dict has to be rebuilt
+            self.entries.append(entry)
+            self.timestamps.append(entry.timestamp)
+            if self.key_index is not None:
+                for key in entry.diffs.keys(): self.key_index.setdefault(key, array('l')).append(len(self.entries) - 1)
+            self.cache.invalidate(len(self.entries) - 1)
+            self.diff.reset()
+            self.before.clear()
+            self.copies.clear()
+            if self.head is not None and self.projection is None and self.needs_checkpoint():
+                entry.checkpoint = dict(self)
             return True
         return False
 
+    @timed('ingest')
+    def ingest(self,
+               documents: Iterable[Union[Dict[Any, Any], Tuple[Optional[Union[int, float]], Dict[Any, Any]]]],
+               every: Optional[int] = None) -> int:
+        """
+        Add a version per document, e.g. snapshots taken over time, and commit them at once.
+
+        Each document replaces the data like update() does, but gets diffed
+        against the previous one without committing in between.
+
+        :param documents: Documents, or pairs of a timestamp (None for now) and a document
+        :param every: Commit after every n documents as well, None to only commit at the end
+        :return: Number of entries added, documents without changes add none
+        :raises ValueError: If a timestamp is not a number or lies before the last entry, now included
+        """
+        if self.diff: raise Exception('Commit or revert the changes before importing!')
+        if self.head is None or self.head != len(self.entries) - 1: self.build()
+        added = 0
+        for number, item in enumerate(documents, 1):
+            timestamp, document, = (None, item,) if isinstance(item, dict) else item
+            if timestamp is None: timestamp = int(datetime.now().timestamp())
+            elif isinstance(timestamp, bool) or not isinstance(timestamp, (int, float,)):
+                raise ValueError(f'Timestamp {timestamp!r} of document {number} is not a number!')
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                raise ValueError(f'Timestamp {timestamp} of document {number} lies before the last entry!')
+            diff = get_nested_diff(dict(self), document)
+            if diff is not None:
+                self.remember(*diff.changes, *diff.deletions, *diff.patched())
+                self.diff.merge(diff)
+                super(JSONVC, self).update(document)
+                for key in diff.deletions: super(JSONVC, self).pop(key, None)
+                added += self.add(timestamp)
+            if every and not number % every: self.commit()
+        self.commit()
+        return added
+
+    def remember(self, *keys: Any) -> None:
+        """
+        Store the committed values of keys before they get changed.
+
+        :param keys: Keys about to change
+        :return: Nothing
+        """
+        for key in keys:
+            if key not in self.before: self.before[key] = super(JSONVC, self).get(key, JSONVC.MISSING)
+
+    def transaction(self) -> Transaction:
+        """
+        Group changes into a single entry, which gets added and committed at the end.
+
+        Typical usage example:
+
+            with repo.transaction():
+                repo['a'] = 1
+                repo['b'] = 2
+
+            async with repo.transaction():
+                repo['c'] = 3
+
+        :return: Transaction (context manager)
+        """
+        return Transaction(self)
+
     def revert(self) -> None:
         """Drop uncommited changes."""
+        for key, value in self.before.items():
+            if value is JSONVC.MISSING: super(JSONVC, self).pop(key, None)
+            else: super(JSONVC, self).__setitem__(key, value)
         self.diff.reset()
-        self.reset(self.init_entry_size)
+        self.before.clear()
+        self.copies.clear()
+        if len(self.entries) > self.init_entry_size: self.reset(self.init_entry_size)
 
+    @timed('reset')
     @auto_commit
     def reset(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> None:
         """
@@ -152,8 +845,21 @@ class JSONVC(dict):
         :param timestamp: Timestamp in repo entries
         :return: Nothing
         """
-        self.entries = self.entries[:self.index(index, timestamp)]
+        index = self.index(index, timestamp)
+        if index: self.checkout(index - 1)
+        else: self.build(-1)
+        self.entries = self.entries[:index]
+        del self.timestamps[index:]
+        if self.key_index is not None:
+            for history in self.key_index.values(): del history[bisect_left(history, index):]
+        self.cache.invalidate(index)
+        if self.persistent is not None and self.persistent[0] >= index: self.persistent = None
+        if index < self.init_entry_size:
+            # the stored entries get cut off in-place on the next commit
+            self.truncation = index if self.truncation is None else min(self.truncation, index)
+            self.init_entry_size = index
 
+    @timed('strip')
     @auto_commit
     def strip(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> None:
         """
@@ -163,7 +869,85 @@ class JSONVC(dict):
         :param timestamp: Timestamp in repo entries
         :return: Nothing
         """
-        self.entries = self.entries[self.index(index, timestamp):]
+        index = self.index(index, timestamp)
+        self.entries = self.entries[index:]
+        self.reindex()
+        self.rebuild_checkpoints()
+        self.rewrite = True
+        self.head = None
+
+    @timed('compact')
+    def compact(self,
+                index: Optional[int] = None,
+                timestamp: Optional[Union[int, datetime]] = None,
+                keep: Optional[int] = None,
+                max_age: Optional[float] = None,
+                window: Optional[float] = None) -> int:
+        """
+        Shrink the history without changing the data at the versions it keeps.
+
+        Every entry before a cut point gets folded into a single base entry
+        holding the data right before it, so that version is kept as well.
+        The cut point is either an index, a timestamp, a number of latest
+        entries to keep or a maximum age of the entries in seconds. Runs of
+        entries committed within a time window of each other can be squashed
+        into their last entry as well.
+
+        :param index: Index of the first entry to keep
+        :param timestamp: Timestamp of the first entry to keep
+        :param keep: Number of latest entries to keep
+        :param max_age: Maximum age of the entries to keep in seconds
+        :param window: Time window in seconds to squash the entries of
+        :return: Number of bytes the repo file shrank by
+        """
+        if self.diff: raise Exception('Commit or revert the changes before compacting!')
+        if index is not None: cut = index
+        elif timestamp is not None:
+            cut = bisect_left(self.timestamps, timestamp.timestamp() if isinstance(timestamp, datetime) else timestamp)
+        elif keep is not None: cut = len(self.entries) - keep
+        elif max_age is not None: cut = bisect_left(self.timestamps, datetime.now().timestamp() - max_age)
+        else: cut = 0
+        cut = min(max(cut, 0), len(self.entries))
+
+        entries = self.entries[cut:]
+        if cut > 1: entries.insert(0, Entry(self.entries[cut - 1].timestamp, self.state(cut - 1)))
+        elif cut: entries.insert(0, self.entries[0])
+        if window: entries = self.squash(entries, window)
+        if len(entries) == len(self.entries): return 0
+
+        size = self.storage.size() if self.storage is not None else 0
+        self.entries = entries
+        self.reindex()
+        self.rebuild_checkpoints()
+        self.rewrite = True
+        self.head = None
+        if not self.path: return 0
+        self.commit()
+        self.flush()
+        return size - self.storage.size()
+
+    @staticmethod
+    def squash(entries: List[Entry], window: float) -> List[Entry]:
+        """
+        Merge runs of entries committed within a time window of the first one of each run.
+
+        :param entries: Entries to squash
+        :param window: Time window in seconds
+        :return: list of entries
+        """
+        squashed = list()
+        start = None
+        for entry in entries:
+            if start is None or entry.timestamp - start >= window:
+                start = entry.timestamp
+                squashed.append(entry)
+                continue
+            last = squashed[-1]
+            diffs = Diff(dict(last.changes), set(last.deletions), list(last.patches))
+            diffs.merge(entry.diffs)
+            checkpoint = None if last.checkpoint is None and entry.checkpoint is None else dict()
+            squashed[-1] = Entry(entry.timestamp, diffs.changes, diffs.deletions, checkpoint, diffs.patches)
+        return squashed
 
     def index(self, index: Optional[int] = None, timestamp: Optional[Union[int, datetime]] = None) -> int:
         """
@@ -174,10 +958,11 @@ class JSONVC(dict):
         :return: index int
         """
         if index is not None: state = index
-        elif timestamp is not None: state = index_from_timestamp(self.entries, timestamp)
+        elif timestamp is not None: state = index_from_timestamp(self.timestamps, timestamp)
         else: raise ValueError('Either provide an index or a timestamp!')
 
-        if not 0 <= state < len(self): raise IndexError(f'State {state} was out of range [0, {len(self)}]!')
+        if not 0 <= state < len(self.entries):
+            raise IndexError(f'State {state} was out of range [0, {len(self.entries)}]!')
 
         return state
 
@@ -187,18 +972,21 @@ class JSONVC(dict):
         return f'jsonvc-repo[{len(self.entries)} entries, currently {len(self.diff)} changes]'
 
     @staticmethod
-    def init(path: Union[Path, str], ignore_exist: bool = True) -> None:
+    def init(path: Union[Path, str, Storage],
+             ignore_exist: bool = True,
+             codec: Optional[Union[bool, str, Codec]] = None) -> None:
         """
         Generate a new jsonvc repo.
 
-        :param path: path to the jsonvc repo
+        :param path: path to the jsonvc repo, SQLite databases for its suffixes (see storage.SQLITE_SUFFIXES)
         :param ignore_exist: Overwrite existing file if set
+        :param codec: Codec to compress the records with [Defaults to tools.COMPRESSION]
         :return: Nothing
         """
-        dump(path, list(), ignore_exist)
+        open_storage(path).init(codec, ignore_exist)
 
     @staticmethod
-    def verify(path: Optional[Union[Path, str]] = None,
+    def verify(path: Optional[Union[Path, str, Storage]] = None,
                data: Optional[List[List[Union[int, Dict[Any, Any], List[Any]]]]] = None) -> bool:
         """
         Determine wheter a path or data are a valid jsonvc repo.
@@ -208,42 +996,82 @@ class JSONVC(dict):
         :return: bool
         """
         try:
-            if path: data = load(path)  # path 'stronger' than data
+            if path: data = open_storage(path).records()  # path 'stronger' than data
             elif data is None: raise ValueError('Neither path nor data were provided!')
             return isinstance(data, list) \
                 and all(map(
                     lambda entry: isinstance(entry, list)
-                        and len(entry) == 3
-                        and isinstance(entry[0], int)
+                        and len(entry) in (3, 4,)
+                        and isinstance(entry[0], (int, float,)) and not isinstance(entry[0], bool)
                         and isinstance(entry[1], dict)
-                        and isinstance(entry[2], list),
+                        and isinstance(entry[2], list)
+                        and (len(entry) == 3 or isinstance(entry[3], dict)),
                         data)) \
-                and data == sorted(data)
+                and all(map(lambda previous, entry: previous[0] <= entry[0], data, data[1:]))
         except Exception as exc: return False and exc  # pycharm doesn't like just Exception
 
+    @auto_commit
+    def patch(self, *operations: List[Any]) -> None:
+        """
+        Change nested values by json pointer operations.
+
+        Typical usage example:
+
+            repo.patch(['replace', '/config/limits/0', 10], ['remove', '/config/debug'])
+
+        :param operations: Patch operations, see jsonvc.patches
+        :return: Nothing
+        """
+        for operation in operations:
+            key = key_of(operation)
+            self.remember(key)
+            if len(operation) > 2 and self.copies and shares(operation[2], self.copies): self.copies.clear()
+            value = apply_patch({key: super(JSONVC, self).__getitem__(key)}, [operation], None, self.copies)[key]
+            super(JSONVC, self).__setitem__(key, value)
+            self.diff.patch(operation, self.copies)
+
     # dict methods to override
 
+    def __getitem__(self, key: Any) -> Any:
+        value = super(JSONVC, self).__getitem__(key)
+        if self.track_nested: return track(self, [key], value)
+        self.copies.clear()  # handed out, so patches must not change it in-place anymore
+        return value
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self[key] if key in self else default
+
     @auto_commit
     def __setitem__(self, key: Any, value: Any) -> None:
-        self.diff[key] = value
+        self.copies.clear()  # the value might contain copies
+        self.remember(key)
+        # replaced dicts and lists get changed by path, if that is smaller
+        operations = get_value_patch(key, super(JSONVC, self).__getitem__(key), value) if key in self else None
+        if operations is None: self.diff[key] = value
+        else:
+            for operation in operations: self.diff.patch(operation)
         super(JSONVC, self).__setitem__(key, value)
 
     @auto_commit
     def __delitem__(self, key: Any) -> None:
+        self.remember(key)
         del self.diff[key]
         super(JSONVC, self).__delitem__(key)
 
     @auto_commit
     def update(self, __m: Mapping[Any, Any], **kwargs: Any) -> None:
-        changes, deletions, = get_diff(self, dict(__m))
-        self.diff.changes.update(changes)
-        [delitem(self.diff.changes, key) for key in deletions]
-        self.diff.deletions.update(deletions)
-        [self.diff.deletions.discard(key) for key in changes.keys()]
-        super(JSONVC, self).update(__m, **kwargs)
+        self.copies.clear()
+        new = dict(__m)
+        new.update(kwargs)
+        diff = get_nested_diff(dict(self), new) or Diff()
+        self.remember(*diff.changes, *diff.deletions, *diff.patched())
+        self.diff.merge(diff)
+        super(JSONVC, self).update(new)
+        [super(JSONVC, self).pop(key, None) for key in diff.deletions]
 
     @auto_commit
     def pop(self, k: Any) -> Any:
+        if k in self: self.remember(k)
         self.diff.pop(k)
         return super(JSONVC, self).pop(k)
 
@@ -251,16 +1079,21 @@ class JSONVC(dict):
     def popitem(self) -> Tuple[Any, Any]:
         try: item = super(JSONVC, self).popitem()
         except KeyError: raise
+        self.before.setdefault(item[0], item[1])
         self.diff.pop(item[0])
         return item
 
     @auto_commit
     def setdefault(self, __key: Any, __default: Any = ...) -> Any:
-        self.diff.setdefault(__key, __default)
+        if __key not in self:
+            self.copies.clear()
+            self.remember(__key)
+            self.diff.setdefault(__key, __default)
         return super(JSONVC, self).setdefault(__key, __default)
 
     @auto_commit
     def clear(self) -> None:
+        self.remember(*self.keys())
         self.diff.clear(self.keys())
         super(JSONVC, self).clear()
 
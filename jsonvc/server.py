@@ -0,0 +1,204 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-22"
+__version__ = "0.0.0"
+
+__all__ = ('Repos', 'Server', 'request', 'SOCKET',)
+
+"""
+Daemon keeping jsonvc repos in memory behind a unix domain socket
+
+Clients send the arguments of a command line call and get its exit code
+and output back, so repeated calls neither import jsonvc nor load and build
+the repo again. Repos get reloaded when their file was changed by others.
+
+Each connection carries a single request and response as json, the request
+ends when the client shuts its side of the connection down. The socket is
+only accessible to its user and lies in a directory others cannot write to
+(by default $XDG_RUNTIME_DIR or a private directory in the temp directory),
+clients only talk to daemons of their own user.
+"""
+
+from jsonvc.repo import JSONVC
+from socketserver import ThreadingMixIn, StreamRequestHandler, TCPServer
+from tempfile import gettempdir
+from threading import Lock
+from pathlib import Path
+from json import loads, dumps
+from struct import Struct
+import socket
+import os
+
+try: from socketserver import UnixStreamServer
+except ImportError: UnixStreamServer = TCPServer  # no unix sockets (e.g. on windows), so no daemon either
+
+from typing import Any, Optional, Union, Callable, Tuple, Dict, List
+
+Response = Tuple[int, str, str]
+
+UID: int = getattr(os, 'getuid', int)()
+SOCKET: str = os.environ.get('JSONVC_SOCKET') \
+    or str(Path(os.environ.get('XDG_RUNTIME_DIR') or Path(gettempdir()) / f'jsonvc-{UID}') / 'jsonvc.sock')
+CREDENTIALS: Struct = Struct('3i')  # pid, uid and gid of a peer (SO_PEERCRED)
+
+
+class Repos:
+    """
+    Repos kept in memory by their resolved paths, each used by one command at a time.
+
+    The repos commit with locking, so processes committing to the same files
+    without the daemon do not get overwritten.
+    """
+
+    repos: Dict[str, JSONVC]
+    locks: Dict[str, Lock]
+    lock: Lock
+
+    __slots__ = ('repos', 'locks', 'lock',)
+
+    def __init__(self):
+        self.repos = dict()
+        self.locks = dict()
+        self.lock = Lock()
+
+    def locked(self, path: Union[Path, str]) -> Lock:
+        """
+        Get the lock to hold while running a command on a repo.
+
+        :param path: Repo file
+        :return: Lock
+        """
+        with self.lock: return self.locks.setdefault(str(Path(path).resolve()), Lock())
+
+    def open(self, path: Union[Path, str], **_: Any) -> JSONVC:
+        """
+        Get the repo of a file, loading it if it is not in memory or was changed by others since.
+
+        :param path: Repo file
+        :return: Repo at its latest entry
+        """
+        key = str(Path(path).resolve())
+        repo = self.repos.get(key)
+        if repo is None or repo.stamp != repo.storage.stamp() or repo.diff or repo.head != len(repo.entries) - 1:
+            if repo is not None: repo.close()
+            repo = self.repos[key] = JSONVC(key, locking=True)
+        return repo
+
+    def discard(self, path: Union[Path, str]) -> None:
+        """
+        Drop a repo from memory, e.g. after a command failed halfway.
+
+        :param path: Repo file
+        :return: Nothing
+        """
+        repo = self.repos.pop(str(Path(path).resolve()), None)
+        if repo is not None: repo.close()
+
+    def close(self) -> None:
+        """Write and release every repo."""
+        for path in list(self.repos): self.discard(path)
+
+
+class Handler(StreamRequestHandler):
+    """Connection of a client, running its command"""
+
+    server: 'Server'
+
+    def handle(self) -> None:
+        data = self.rfile.read()
+        if not data: return  # just checking whether a daemon is listening
+        request = loads(data.decode('utf-8'))
+        try: code, output, errors, = self.server.execute(request['argv'], request['cwd'], self.server.repos)
+        except BaseException as error: code, output, errors, = 1, '', f'{type(error).__name__}: {error}'
+        self.wfile.write(dumps(dict(code=code, stdout=output, stderr=errors)).encode('utf-8'))
+
+
+class Server(ThreadingMixIn, UnixStreamServer):
+    """
+    jsonvc daemon, running each request in a thread of its own.
+
+    The commands themselves get executed by a function getting the arguments,
+    the working directory of the client and the repos in memory, returning
+    the exit code, output and error output (see cli.execute()).
+    """
+
+    daemon_threads = True
+
+    execute: Callable[[List[str], str, Repos], Response]
+    repos: Repos
+
+    def __init__(self, path: Union[Path, str], execute: Callable[[List[str], str, Repos], Response]):
+        """
+        :param path: Socket file, replaced if no daemon is listening on it
+        :param execute: Function running a command
+        :raises RuntimeError: If another daemon is listening on the socket or others could replace it
+        """
+        if UnixStreamServer is TCPServer: raise RuntimeError('Unix domain sockets are not supported here!')
+        self.execute = execute
+        self.repos = Repos()
+        path = Path(path)
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        directory = path.parent.stat()
+        if directory.st_uid != UID or directory.st_mode & 0o022:
+            raise RuntimeError(f'{path.parent} has to belong to the user and must not be writable by others!')
+        if path.exists() or path.is_symlink():
+            client = connection(path)
+            if client is not None:
+                client.close()
+                raise RuntimeError(f'Another daemon is listening on {path}!')
+            path.unlink()
+        mask = os.umask(0o177)  # the daemon commits with the rights of its user, so nobody else may connect
+        try: super(Server, self).__init__(str(path), Handler)
+        finally: os.umask(mask)
+
+    def server_close(self) -> None:
+        try:
+            super(Server, self).server_close()
+            Path(self.server_address).unlink()
+        finally: self.repos.close()
+
+
+def connection(path: Union[Path, str]) -> Optional[socket.socket]:
+    """
+    Connect to a daemon of the user.
+
+    :param path: Socket file
+    :return: Socket, None if no daemon of the user is listening
+    """
+    if not hasattr(socket, 'AF_UNIX'): return None
+    try:
+        if os.stat(str(path)).st_uid != UID: return None
+    except OSError: return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(path))
+        if hasattr(socket, 'SO_PEERCRED'):  # the socket might have been replaced in the meantime
+            credentials = client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, CREDENTIALS.size)
+            if CREDENTIALS.unpack(credentials)[1] != UID: raise ConnectionRefusedError
+    except OSError:
+        client.close()
+        return None
+    return client
+
+
+def request(argv: List[str], cwd: str, path: Union[Path, str] = SOCKET) -> Optional[Response]:
+    """
+    Run a command by the daemon.
+
+    :param argv: Command line arguments
+    :param cwd: Working directory relative paths refer to
+    :param path: Socket file of the daemon
+    :return: Exit code, output and error output, None if no daemon is running
+    """
+    client = connection(path)
+    if client is None: return None
+    with client:
+        client.sendall(dumps(dict(argv=argv, cwd=cwd)).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('rb') as file: response = loads(file.read().decode('utf-8'))
+    return response['code'], response['stdout'], response['stderr']
+
+
+if __name__ == '__main__': pass
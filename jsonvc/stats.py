@@ -0,0 +1,268 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-21"
+__version__ = "0.0.0"
+
+__all__ = ('Timing', 'Stats', 'current', 'timer', 'count', 'timed',)
+
+"""
+Opt-in instrumentation of jsonvc repos
+
+A repo given a Stats object activates it for the current thread while its
+operations run, the functions reading, decoding, encoding and writing records
+report to the active one. Without active stats nothing gets measured, the
+instrumented code only checks for them once per file or operation.
+
+Timings (in seconds):
+    load, build, state, commit, dump, ingest, ...     operations of the repo
+    read, write                                       file or database I/O
+    decompress, compress                              codecs of the records
+    decode, encode                                    json of the records
+
+Counters:
+    bytes_read, bytes_written                         as stored, i.e. compressed
+    raw_bytes_read, raw_bytes_written                 json of the records
+    entries_read, entries_written, entries_replayed
+"""
+
+from threading import local, Lock
+from functools import wraps
+from time import perf_counter
+
+from typing import Any, Optional, Callable, Dict, List, Union
+
+Callback = Callable[[str, str, float], None]
+
+active = local()  # stats of the operation running in each thread
+
+
+class Timing:
+    """Aggregated durations of an operation"""
+
+    count: int
+    total: float
+    min: float
+    max: float
+
+    __slots__ = ('count', 'total', 'min', 'max',)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        """
+        Add a duration.
+
+        :param duration: Duration in seconds
+        :return: Nothing
+        """
+        self.count += 1
+        self.total += duration
+        self.min = min(self.min, duration)
+        self.max = max(self.max, duration)
+
+    @property
+    def mean(self) -> float: return self.total / self.count if self.count else 0.0
+
+    def as_dict(self) -> Dict[str, Union[int, float]]:
+        return dict(count=self.count, total=self.total, mean=self.mean, min=self.min if self.count else 0.0,
+                    max=self.max)
+
+    def __repr__(self) -> str: return f'Timing[{self.count} times, {self.total:.6f}s]'
+
+
+class Timer:
+    """Context measuring a single duration"""
+
+    stats: 'Stats'
+    name: str
+    start: float
+
+    __slots__ = ('stats', 'name', 'start',)
+
+    def __init__(self, stats: 'Stats', name: str):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self) -> 'Timer':
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *_: Any) -> None: self.stats.timing(self.name, perf_counter() - self.start)
+
+
+class Nothing:
+    """Context measuring nothing, for code running without active stats"""
+
+    __slots__ = ()
+
+    def __enter__(self) -> None: pass
+
+    def __exit__(self, *_: Any) -> None: pass
+
+
+NOTHING: Nothing = Nothing()
+
+
+class Stats:
+    """
+    Timings and counters of the repos using it, reported to callbacks as well.
+
+    Callbacks get the kind of a measurement ('timing' or 'count'), its name
+    and its value, e.g. to forward them to StatsD. Writes in write-behind
+    mode get reported from the writer thread.
+
+    Using the stats as a context activates them for the current thread.
+    """
+
+    timings: Dict[str, Timing]
+    counters: Dict[str, int]
+    callbacks: List[Callback]
+    lock: Lock
+    previous: local
+
+    __slots__ = ('timings', 'counters', 'callbacks', 'lock', 'previous',)
+
+    def __init__(self, *callbacks: Callback):
+        """
+        :param callbacks: Functions to report every measurement to
+        """
+        self.timings = dict()
+        self.counters = dict()
+        self.callbacks = list(callbacks)
+        self.lock = Lock()  # the writer thread reports as well
+        self.previous = local()
+
+    def subscribe(self, callback: Callback) -> None:
+        """
+        Report every following measurement to a callback as well.
+
+        :param callback: Function getting the kind, name and value of each measurement
+        :return: Nothing
+        """
+        self.callbacks.append(callback)
+
+    def unsubscribe(self, callback: Callback) -> None:
+        """
+        Stop reporting to a callback.
+
+        :param callback: Subscribed function
+        :return: Nothing
+        """
+        self.callbacks.remove(callback)
+
+    def timer(self, name: str) -> Timer:
+        """
+        Measure the duration of a context.
+
+        :param name: Name of the timing
+        :return: Context manager
+        """
+        return Timer(self, name)
+
+    def timing(self, name: str, duration: float) -> None:
+        """
+        Add a duration.
+
+        :param name: Name of the timing
+        :param duration: Duration in seconds
+        :return: Nothing
+        """
+        with self.lock:
+            if name not in self.timings: self.timings[name] = Timing()
+            self.timings[name].add(duration)
+        for callback in self.callbacks: callback('timing', name, duration)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increase a counter.
+
+        :param name: Name of the counter
+        :param value: Amount to increase it by
+        :return: Nothing
+        """
+        with self.lock: self.counters[name] = self.counters.get(name, 0) + value
+        for callback in self.callbacks: callback('count', name, value)
+
+    def reset(self) -> None:
+        """Forget every measurement."""
+        with self.lock:
+            self.timings.clear()
+            self.counters.clear()
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the measurements as a json serializable dict.
+
+        :return: dict of the timings and counters by name
+        """
+        with self.lock:
+            return dict(timings=dict((name, timing.as_dict(),) for name, timing in self.timings.items()),
+                        counters=dict(self.counters))
+
+    def __enter__(self) -> 'Stats':
+        if not hasattr(self.previous, 'stack'): self.previous.stack = list()
+        self.previous.stack.append(current())
+        active.stats = self
+        return self
+
+    def __exit__(self, *_: Any) -> None: active.stats = self.previous.stack.pop()
+
+    def __repr__(self) -> str: return f'Stats[{len(self.timings)} timings, {len(self.counters)} counters]'
+
+
+def current() -> Optional[Stats]:
+    """
+    Get the stats active in the current thread.
+
+    :return: Stats, None if there are none
+    """
+    return getattr(active, 'stats', None)
+
+
+def timer(name: str) -> Union[Timer, Nothing]:
+    """
+    Measure the duration of a context, if there are active stats.
+
+    :param name: Name of the timing
+    :return: Context manager
+    """
+    stats = current()
+    return NOTHING if stats is None else Timer(stats, name)
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    Increase a counter, if there are active stats.
+
+    :param name: Name of the counter
+    :param value: Amount to increase it by
+    :return: Nothing
+    """
+    stats = current()
+    if stats is not None: stats.count(name, value)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """
+    Measure the decorated repo method and activate the stats of the repo while it runs.
+
+    :param name: Name of the timing
+    :return: Decorator
+    """
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None: return method(self, *args, **kwargs)
+            with stats, Timer(stats, name): return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,492 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-17"
+__version__ = "0.0.0"
+
+__all__ = ('Storage', 'LogStorage', 'SQLiteStorage', 'open_storage', 'convert', 'SQLITE_SUFFIXES',)
+
+"""
+Storage backends keeping the entries of jsonvc repos
+
+Repos read and write their entries through a Storage, which is either the
+append-only log file (the default) or an SQLite database with a row per entry,
+chosen by the file suffix.
+"""
+
+from jsonvc.entry import Entry
+from jsonvc.codecs import Codec, get_codec
+from jsonvc.patches import key_of
+from jsonvc.lazy import LogFile, LazyEntry, load_entries
+from jsonvc.locking import FileLock, ConflictError
+from jsonvc.stats import current, timer
+from jsonvc.tools import dump_log, append, truncate, load, log_info, log_version, LOG_VERSION, CHECKPOINT_FLAG, \
+    INVERSE_FLAG, COMPRESSION, Compression
+from json import loads, dumps
+from pathlib import Path
+from threading import RLock
+from array import array
+import sqlite3
+
+from typing import Any, Optional, Union, Tuple, Dict, List, Iterable, Iterator
+
+Record = List[Union[int, Dict[Any, Any], List[Any]]]
+
+SQLITE_SUFFIXES: Tuple[str, ...] = ('.db', '.sqlite', '.sqlite3',)
+SQLITE_MAGIC: bytes = b'SQLite format 3\x00'
+
+SCHEMA: Tuple[str, ...] = (
+    'CREATE TABLE IF NOT EXISTS entries (position INTEGER PRIMARY KEY, timestamp REAL NOT NULL, '
+    'changes INTEGER NOT NULL, deletions INTEGER NOT NULL, patches INTEGER NOT NULL, flags INTEGER NOT NULL, '
+    'record TEXT NOT NULL, generation INTEGER NOT NULL DEFAULT 0)',
+    'CREATE INDEX IF NOT EXISTS entries_timestamp ON entries (timestamp)',
+    'CREATE TABLE IF NOT EXISTS keys (key TEXT NOT NULL, position INTEGER NOT NULL, PRIMARY KEY (key, position)) '
+    'WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS keys_position ON keys (position)',
+)
+
+
+class Storage:
+    """Where the entries of a repo are kept"""
+
+    path: Path
+    file_lock: FileLock
+
+    __slots__ = ('path', 'file_lock',)
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        self.file_lock = FileLock(self.path.with_name(f'{self.path.name}.lock'))
+
+    def exists(self) -> bool: return self.path.exists()
+
+    def init(self, codec: Optional[Compression] = None, ignore_exist: bool = True) -> None:
+        """
+        Create an empty store.
+
+        :param codec: Codec to compress the records with [Defaults to tools.COMPRESSION]
+        :param ignore_exist: Overwrite an existing store if set
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def records(self) -> List[Record]:
+        """
+        Get every entry in its json serializable format.
+
+        :return: list
+        """
+        raise NotImplementedError
+
+    def entries(self) -> List[Entry]:
+        """
+        Get every entry, without decoding them if the store allows to.
+
+        :return: list of entries
+        """
+        return [Entry.from_history_entry(record) for record in self.records()]
+
+    def append(self, records: Iterable[Record]) -> None:
+        """
+        Add entries after the stored ones.
+
+        :param records: Entries in their json serializable format
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def rewrite(self, records: List[Record], codec: Optional[Compression] = None, **kwargs: Any) -> None:
+        """
+        Replace every stored entry at once.
+
+        :param records: Entries in their json serializable format
+        :param codec: Codec to compress the records with
+        :param kwargs: json.dumps() kwargs
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def truncate(self, size: int) -> None:
+        """
+        Drop the stored entries from an index on, in-place.
+
+        :param size: Number of entries to keep
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def codec(self) -> Codec:
+        """
+        Get the codec the stored records are compressed with.
+
+        :return: Codec
+        """
+        raise NotImplementedError
+
+    def outdated(self, codec: Optional[Codec] = None) -> bool:
+        """
+        Determine whether the store has to be rewritten before entries can be appended, e.g. in an old format.
+
+        :param codec: Codec the records should be compressed with, None for any
+        :return: bool
+        """
+        return False
+
+    def size(self) -> int:
+        """
+        Get the number of bytes the entries take up.
+
+        :return: int
+        """
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def stamp(self) -> Any:
+        """
+        Get a value which changes whenever the stored entries do, e.g. by commits of other processes.
+
+        :return: Comparable value, None if the store does not exist
+        """
+        if not self.path.exists(): return None
+        stat = self.path.stat()
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def locked(self) -> FileLock:
+        """
+        Get the lock keeping other processes from writing to the store, to be used as a context manager.
+
+        :return: FileLock
+        """
+        return self.file_lock
+
+    def key_index(self) -> Optional[Dict[Any, 'array[int]']]:
+        """
+        Get the indices of the entries changing each top-level key, if the store keeps them.
+
+        :return: dict, None if the store does not keep them
+        """
+        return None
+
+    def touching(self, keys: Iterable[Any], start: int, stop: int) -> Optional[List[int]]:
+        """
+        Get the indices of the stored entries within a range that change any of some keys, if the store keeps them.
+
+        :param keys: Top-level keys
+        :param start: First entry index
+        :param stop: Entry index to stop at
+        :return: Sorted list of entry indices, None if the store does not keep them
+        """
+        return None
+
+    def close(self) -> None:
+        """Release any resources of the store, it gets reopened on its next use."""
+
+    def __repr__(self) -> str: return f'{type(self).__name__}[{self.path}]'
+
+
+class LogStorage(Storage):
+    """
+    Append-only log file (see tools.dump_log())
+
+    Lazy entries read their records from memory-mapped logs, which stay valid
+    as long as the entries are used: the file only grows in place, it gets
+    replaced by rewrites and truncations.
+    """
+
+    logs: List[LogFile]
+
+    __slots__ = ('logs',)
+
+    def __init__(self, path: Union[Path, str]):
+        super(LogStorage, self).__init__(path)
+        self.logs = list()  # the latest one maps the current file
+
+    def init(self, codec: Optional[Compression] = None, ignore_exist: bool = True) -> None:
+        dump_log(self.path, list(), ignore_exist, COMPRESSION if codec is None else codec)
+
+    def records(self) -> List[Record]: return load(self.path)
+
+    def entries(self) -> List[Entry]:
+        if log_version(self.path) < 2: return load_entries(self.path)
+        if self.logs:
+            # the entries listed before share the mapping, extended to the records appended since
+            try:
+                self.logs[-1].open()
+                return self.logs[-1].entries()
+            except ConflictError: pass
+        self.logs.append(LogFile(self.path))
+        return self.logs[-1].entries()
+
+    def append(self, records: Iterable[Record]) -> None: append(self.path, records)
+
+    def rewrite(self, records: List[Record], codec: Optional[Compression] = None, **kwargs: Any) -> None:
+        dump_log(self.path, records, True, self.codec() if codec is None else codec, **kwargs)
+
+    def truncate(self, size: int) -> None:
+        truncate(self.path, size)
+        if self.logs: self.logs[-1].adopt()  # the records kept are at the same offsets
+
+    def codec(self) -> Codec: return log_info(self.path)[1] if self.path.exists() else get_codec(COMPRESSION)
+
+    def outdated(self, codec: Optional[Codec] = None) -> bool:
+        version, current, = log_info(self.path) if self.path.exists() else (0, None,)
+        return version != LOG_VERSION or codec not in (None, current,)
+
+    def close(self) -> None:
+        for log in self.logs: log.close()
+
+
+class SQLiteStorage(Storage):
+    """
+    SQLite database with a row per entry, indexed by timestamp and by the keys each entry changes.
+
+    Commits are single-row inserts in WAL mode and resets delete a range of
+    rows, so neither has to touch the other entries. The records are stored
+    as uncompressed json text.
+
+    The positions of deleted rows get reused, so every rewrite and truncation
+    starts a new generation of rows (kept as the user_version of the database).
+    Lazy entries only read the row of the generation they were listed from.
+    """
+
+    connection: Optional[sqlite3.Connection]
+    lock: RLock
+
+    __slots__ = ('connection', 'lock',)
+
+    def __init__(self, path: Union[Path, str]):
+        super(SQLiteStorage, self).__init__(path)
+        self.connection = None
+        self.lock = RLock()  # the connection is shared with the writer thread in write-behind mode
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Get the connection to the database, opening it if needed.
+
+        :return: Connection
+        """
+        if self.connection is None:
+            self.connection = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA: self.connection.execute(statement)
+            if 'generation' not in (column for _, column, *_ in self.connection.execute('PRAGMA table_info(entries)')):
+                self.connection.execute('ALTER TABLE entries ADD COLUMN generation INTEGER NOT NULL DEFAULT 0')
+        return self.connection
+
+    def execute(self, query: str, *parameters: Any) -> List[Tuple[Any, ...]]:
+        """
+        Run a single query.
+
+        :param query: SQL
+        :param parameters: Query parameters
+        :return: Rows
+        """
+        with self.lock: return self.connect().execute(query, parameters).fetchall()
+
+    def init(self, codec: Optional[Compression] = None, ignore_exist: bool = True) -> None:
+        if not ignore_exist and self.exists(): return
+        self.rewrite(list())
+
+    def records(self) -> List[Record]:
+        with timer('read'): rows = self.execute('SELECT record FROM entries ORDER BY position')
+        stats = current()
+        if stats is None: return [loads(record) for record, in rows]
+        with stats.timer('decode'): records = [loads(record) for record, in rows]
+        size = sum(len(record) for record, in rows)
+        stats.count('bytes_read', size)
+        stats.count('raw_bytes_read', size)
+        stats.count('entries_read', len(records))
+        return records
+
+    def entries(self) -> List[Entry]:
+        rows = self.execute('SELECT position, generation, timestamp, changes, deletions, patches, flags '
+                            'FROM entries ORDER BY position')
+        return [LazyEntry(self, *fields) for fields in rows]
+
+    def read(self, position: int, generation: int) -> Record:
+        """
+        Decode a single record (for lazy entries).
+
+        :param position: Entry index
+        :param generation: Generation of the row, in place of the size of the records of lazy.LogFile
+        :return: Entry in its json serializable format
+        :raises ConflictError: If the row was deleted in the meantime, even if another one took its position
+        """
+        with timer('read'):
+            rows = self.execute('SELECT record FROM entries WHERE position = ? AND generation = ?',
+                                position, generation)
+        if not rows: raise ConflictError('The history was rewritten in the meantime!')
+        record, = rows[0]
+        stats = current()
+        if stats is None: return loads(record)
+        with stats.timer('decode'): record, size, = loads(record), len(record),
+        stats.count('bytes_read', size)
+        stats.count('raw_bytes_read', size)
+        stats.count('entries_read')
+        return record
+
+    def rows(self, records: Iterable[Record], start: int, **kwargs: Any) -> Iterator[Tuple[Tuple[Any, ...], ...]]:
+        """
+        Get the rows of the entries table and the keys table for records.
+
+        :param records: Entries in their json serializable format
+        :param start: Index of the first record
+        :param kwargs: json.dumps() kwargs
+        :return: Iterator of the entry row and the key rows of each record
+        """
+        for position, record in enumerate(records, start):
+            extras = record[3] if len(record) > 3 else dict()
+            flags = (CHECKPOINT_FLAG if 'checkpoint' in extras else 0) | (INVERSE_FLAG if 'inverse' in extras else 0)
+            patches = extras.get('patches', ())
+            # keys are stored as they get loaded from json, where the keys of objects are always strings
+            keys = set(dumps(key if isinstance(key, str) else dumps(key)) for key in record[1])
+            keys.update(dumps(key) for key in record[2])
+            keys.update(dumps(key_of(operation)) for operation in patches)
+            yield ((position, record[0], len(record[1]), len(record[2]), len(patches), flags,
+                    dumps(record, **kwargs),),) + tuple((key, position,) for key in keys)
+
+    def insert(self, records: Iterable[Record], start: int, **kwargs: Any) -> None:
+        """
+        Insert records within the current transaction.
+
+        :param records: Entries in their json serializable format
+        :param start: Index of the first record
+        :param kwargs: json.dumps() kwargs
+        :return: Nothing
+        """
+        connection = self.connect()
+        generation, = connection.execute('PRAGMA user_version').fetchone()
+        stats = current()
+        if stats is None:
+            for entry, *keys in self.rows(records, start, **kwargs):
+                connection.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entry + (generation,))
+                connection.executemany('INSERT OR IGNORE INTO keys VALUES (?, ?)', keys)
+            return
+        with stats.timer('encode'): rows = list(self.rows(records, start, **kwargs))
+        with stats.timer('write'):
+            for entry, *keys in rows:
+                connection.execute('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)', entry + (generation,))
+                connection.executemany('INSERT OR IGNORE INTO keys VALUES (?, ?)', keys)
+        size = sum(len(entry[-1]) for entry, *_ in rows)
+        stats.count('bytes_written', size)
+        stats.count('raw_bytes_written', size)
+        stats.count('entries_written', len(rows))
+
+    def append(self, records: Iterable[Record]) -> None:
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.insert(records, connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0])
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def rewrite(self, records: List[Record], codec: Optional[Compression] = None, **kwargs: Any) -> None:
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM entries')
+                connection.execute('DELETE FROM keys')
+                self.renew()
+                self.insert(records, 0, **kwargs)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def truncate(self, size: int) -> None:
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.execute('DELETE FROM entries WHERE position >= ?', (size,))
+                connection.execute('DELETE FROM keys WHERE position >= ?', (size,))
+                self.renew()
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def renew(self) -> None:
+        """
+        Start a new generation of rows within the current transaction.
+
+        :return: Nothing
+        """
+        connection = self.connect()
+        generation, = connection.execute('PRAGMA user_version').fetchone()
+        connection.execute(f'PRAGMA user_version = {generation + 1}')
+
+    def codec(self) -> Codec: return get_codec(False)
+
+    def size(self) -> int:
+        if not self.exists(): return 0
+        (pages,), (free,), (page,), = (self.execute(f'PRAGMA {pragma}')[0]
+                                       for pragma in ('page_count', 'freelist_count', 'page_size',))
+        return (pages - free) * page
+
+    def stamp(self) -> Any:
+        if not self.exists(): return None
+        return tuple(self.execute('SELECT position, generation, timestamp, length(record) FROM entries '
+                                  'ORDER BY position DESC LIMIT 1'))
+
+    def key_index(self) -> Dict[Any, 'array[int]']:
+        index = dict()
+        for key, position in self.execute('SELECT key, position FROM keys ORDER BY key, position'):
+            index.setdefault(loads(key), array('l')).append(position)
+        return index
+
+    def touching(self, keys: Iterable[Any], start: int, stop: int) -> List[int]:
+        keys = [dumps(key) for key in keys]
+        if not keys: return list()
+        return [position for position, in self.execute(
+            f'SELECT DISTINCT position FROM keys WHERE key IN ({", ".join("?" * len(keys))}) '
+            'AND position >= ? AND position < ? ORDER BY position', *keys, start, stop)]
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is None: return
+            self.connection.close()
+            self.connection = None
+
+
+def open_storage(path: Union[Path, str, Storage]) -> Storage:
+    """
+    Get the storage of a repo file: SQLite for its suffixes or existing databases, otherwise a log.
+
+    :param path: File location, or a storage to use as it is
+    :return: Storage
+    """
+    if isinstance(path, Storage): return path
+    path = Path(path)
+    if path.suffix.lower() in SQLITE_SUFFIXES: return SQLiteStorage(path)
+    if path.is_file():
+        with path.open('rb') as file:
+            if file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC: return SQLiteStorage(path)
+    return LogStorage(path)
+
+
+def convert(source: Union[Path, str, Storage],
+            target: Union[Path, str, Storage],
+            codec: Optional[Compression] = None) -> int:
+    """
+    Copy the entries of a repo into another store, e.g. from a .jsonvc file into an SQLite database.
+
+    :param source: Repo file or storage to read
+    :param target: Repo file or storage to write, which gets overwritten
+    :param codec: Codec to compress the records with, if the target compresses them
+    :return: Number of entries copied
+    """
+    source, target, = open_storage(source), open_storage(target)
+    records = source.records()
+    target.rewrite(records, codec if codec is not None or not isinstance(target, LogStorage) else COMPRESSION)
+    source.close()
+    target.close()
+    return len(records)
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-19"
+__version__ = "0.0.0"
+
+__all__ = ('RWLock', 'ThreadSafeJSONVC',)
+
+"""
+jsonvc repos shared by several threads
+
+ThreadSafeJSONVC guards every method by a readers-writer lock: reading
+methods run concurrently, changing ones (including adding, committing and
+building) run one at a time and are never seen half-done by readers.
+"""
+
+from jsonvc.repo import JSONVC
+from jsonvc.transaction import Transaction
+from threading import Condition, get_ident
+from functools import wraps
+
+from typing import Any, Optional, Union, Callable, Tuple, Dict, Mapping, Iterator, KeysView, ValuesView, ItemsView
+
+
+class RWLock:
+    """
+    Readers-writer lock, re-entrant for the threads holding it.
+
+    Any number of threads can read at once, while writing is exclusive.
+    Waiting writers keep new readers out so they do not starve, the writing
+    thread can read as well, but reading threads cannot start to write.
+    """
+
+    condition: Condition
+    readers: Dict[int, int]
+    writer: Optional[int]
+    depth: int
+    waiting: int
+
+    __slots__ = ('condition', 'readers', 'writer', 'depth', 'waiting',)
+
+    def __init__(self):
+        self.condition = Condition()
+        self.readers = dict()  # reading threads and how often they entered
+        self.writer = None
+        self.depth = 0
+        self.waiting = 0
+
+    def acquire_read(self) -> None:
+        """Wait until no thread writes and start reading."""
+        thread = get_ident()
+        with self.condition:
+            if self.writer != thread and thread not in self.readers:
+                while self.writer is not None or self.waiting: self.condition.wait()
+            self.readers[thread] = self.readers.get(thread, 0) + 1
+
+    def release_read(self) -> None:
+        """Stop reading."""
+        thread = get_ident()
+        with self.condition:
+            self.readers[thread] -= 1
+            if self.readers[thread]: return
+            del self.readers[thread]
+            if not self.readers: self.condition.notify_all()
+
+    def acquire_write(self) -> None:
+        """
+        Wait until no other thread reads or writes and start writing.
+
+        :return: Nothing
+        :raises RuntimeError: If the thread is reading
+        """
+        thread = get_ident()
+        with self.condition:
+            if self.writer == thread:
+                self.depth += 1
+                return
+            if thread in self.readers: raise RuntimeError('Cannot start to write while reading!')
+            self.waiting += 1
+            try:
+                while self.writer is not None or self.readers: self.condition.wait()
+            finally: self.waiting -= 1
+            self.writer = thread
+            self.depth = 1
+
+    def release_write(self) -> None:
+        """Stop writing."""
+        with self.condition:
+            self.depth -= 1
+            if self.depth: return
+            self.writer = None
+            self.condition.notify_all()
+
+
+def reading(method: Callable) -> Callable:
+    """
+    Run the decorated method while holding the read lock of the repo.
+
+    :param method: Method to decorate
+    :return: Decorator
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.lock.acquire_read()
+        try: return method(self, *args, **kwargs)
+        finally: self.lock.release_read()
+    return wrapper
+
+
+def writing(method: Callable) -> Callable:
+    """
+    Run the decorated method while holding the write lock of the repo.
+
+    :param method: Method to decorate
+    :return: Decorator
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.lock.acquire_write()
+        try: return method(self, *args, **kwargs)
+        finally: self.lock.release_write()
+    return wrapper
+
+
+class LockedTransaction(Transaction):
+    """Transaction holding the write lock of the repo from its beginning to its end"""
+
+    __slots__ = ()
+
+    def begin(self) -> None:
+        self.repo.lock.acquire_write()
+        try: super(LockedTransaction, self).begin()
+        except BaseException:
+            self.repo.lock.release_write()
+            raise
+
+    def end(self, failed: bool) -> None:
+        try: super(LockedTransaction, self).end(failed)
+        finally: self.repo.lock.release_write()
+
+
+class ThreadSafeJSONVC(JSONVC):
+    """
+    jsonvc repo to share between threads.
+
+    Iterating over the repo itself is not guarded, iterate over keys(),
+    values(), items() or snapshot() instead, which are taken at once.
+    Transactions keep other threads from both reading and writing until
+    they end.
+    """
+
+    lock: RWLock
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        self.lock = RWLock()
+        self.lock.acquire_write()
+        try: super(ThreadSafeJSONVC, self).__init__(*args, **kwargs)
+        finally: self.lock.release_write()
+
+    @reading
+    def snapshot(self) -> Dict[Any, Any]:
+        """
+        Get the data as a new dict, taken at once.
+
+        :return: dict
+        """
+        self.copies.clear()  # handed out, so patches must not change its values in-place anymore
+        return dict.copy(self)
+
+    def transaction(self) -> LockedTransaction: return LockedTransaction(self)
+
+    @reading
+    def iter_versions(self,
+                      start: int = 0,
+                      stop: Optional[int] = None) -> Iterator[Tuple[int, Union[int, float], Mapping[Any, Any]]]:
+        """
+        Iterate over the data at each entry of a range, see JSONVC.iter_versions().
+
+        Each step holds the read lock, not the whole iteration, so other threads
+        can write in between. The range keeps the entries it was started with.
+
+        :param start: First entry index
+        :param stop: Entry index to stop at [Defaults to the number of entries]
+        :return: Iterator of the index, timestamp and data of each entry
+        :raises IndexError: If the range lies outside of the entries
+        """
+        versions = JSONVC.iter_versions(self, start, stop)
+
+        def locked() -> Iterator[Tuple[int, Union[int, float], Mapping[Any, Any]]]:
+            while True:
+                self.lock.acquire_read()
+                try: version = next(versions, None)
+                finally: self.lock.release_read()
+                if version is None: return
+                yield version
+        return locked()
+
+    # reading methods
+
+    state = reading(JSONVC.state)
+    as_of = reading(JSONVC.as_of)
+    materialize = reading(JSONVC.materialize)
+    version = reading(JSONVC.version)
+    diff_between = reading(JSONVC.diff_between)
+    entries_between = reading(JSONVC.entries_between)
+    value_at = reading(JSONVC.value_at)
+    key_history = reading(JSONVC.key_history)
+    __getitem__ = reading(JSONVC.__getitem__)
+    get = reading(JSONVC.get)
+    __contains__ = reading(dict.__contains__)
+    __len__ = reading(dict.__len__)
+    __eq__ = reading(dict.__eq__)
+    __ne__ = reading(dict.__ne__)
+    __repr__ = reading(dict.__repr__)
+    copy = snapshot
+
+    @reading
+    def keys(self) -> KeysView: return dict.copy(self).keys()
+
+    @reading
+    def values(self) -> ValuesView:
+        self.copies.clear()
+        return dict.copy(self).values()
+
+    @reading
+    def items(self) -> ItemsView:
+        self.copies.clear()
+        return dict.copy(self).items()
+
+    # changing methods
+
+    load = writing(JSONVC.load)
+    build = writing(JSONVC.build)
+    checkout = writing(JSONVC.checkout)
+    add = writing(JSONVC.add)
+    ingest = writing(JSONVC.ingest)
+    commit = writing(JSONVC.commit)
+    dump = writing(JSONVC.dump)
+    flush = writing(JSONVC.flush)
+    close = writing(JSONVC.close)
+    revert = writing(JSONVC.revert)
+    reset = writing(JSONVC.reset)
+    strip = writing(JSONVC.strip)
+    compact = writing(JSONVC.compact)
+    rebuild_checkpoints = writing(JSONVC.rebuild_checkpoints)
+    patch = writing(JSONVC.patch)
+    __setitem__ = writing(JSONVC.__setitem__)
+    __delitem__ = writing(JSONVC.__delitem__)
+    update = writing(JSONVC.update)
+    pop = writing(JSONVC.pop)
+    popitem = writing(JSONVC.popitem)
+    setdefault = writing(JSONVC.setdefault)
+    clear = writing(JSONVC.clear)
+
+
+if __name__ == '__main__': pass
@@ -5,39 +5,60 @@ __author__ = "Robin 'r0w' Weiland"
 __date__ = "2020-08-25"
 __version__ = "0.0.0"
 
-__all__ = ('load', 'dump', 'get_diff', 'index_from_timestamp', 'COMPRESSION',)
+__all__ = ('load', 'dump', 'dump_log', 'append', 'truncate', 'is_log', 'log_version', 'log_codec', 'frames',
+           'get_diff', 'get_nested_diff', 'get_value_patch', 'index_from_timestamp', 'COMPRESSION',)
 
 """
 Collection of tool functions for jsonvc
 """
 
 from jsonvc.entry import Entry
+from jsonvc.diffs import Diff
+from jsonvc.patches import get_patch
+from jsonvc.codecs import Codec, get_codec, detect_codec
+from jsonvc.stats import current, timer, count
 from json import loads, dumps
 from pathlib import Path
-from gzip import compress, decompress
-from binascii import hexlify
 from datetime import datetime
+from struct import Struct
+from os import fsync, replace
+from array import array
+from bisect import bisect_right
+from time import perf_counter
 
-from typing import Any, Union, Optional, Tuple, Set, Dict, List
+from typing import Any, Union, Optional, Tuple, Set, Dict, List, Iterable, Iterator, Sequence, BinaryIO, TYPE_CHECKING
 
-COMPRESSION: bool = True  # aka humanly readable or not
+if TYPE_CHECKING: from mmap import mmap
 
+COMPRESSION: Union[bool, str] = True  # aka humanly readable or not, or the spec of a codec like 'zlib:1'
+Compression = Union[bool, str, Codec]
 
-def compression(data: str, comp=COMPRESSION) -> bytes:
+# append-only log: a header line followed by length-prefixed, independently compressed records
+LOG_MAGIC: bytes = b'JSONVC-LOG'
+LOG_VERSION: int = 2
+# record headers by log version: the payload size and since version 2 the timestamp, the number
+# of changes, deletions and patches and flags for optional data, so logs can be listed without decoding
+FRAMES: Dict[int, Struct] = {1: Struct('>I'), 2: Struct('>IdIIIB')}
+FRAME: Struct = FRAMES[LOG_VERSION]
+CHECKPOINT_FLAG: int = 1
+INVERSE_FLAG: int = 2
+
+
+def compression(data: str, comp: Compression = COMPRESSION) -> bytes:
     """
     Compress data or just convert it to bytes.
 
     :param data: The data to compress
-    :param comp: Whether to compress or just convert to bytes
+    :param comp: Whether to compress or just convert to bytes, or the codec to compress with
     :return: bytes
     """
-    return compress(bytes(data, encoding='utf-8')) if comp else bytes(data, encoding='utf-8')
+    return get_codec(comp).compress(bytes(data, encoding='utf-8'))
 
 
 def dump(path: Union[Path, str],
          data: List[List[Union[int, Dict[Any, Any], Set[Any]]]],
          ignore_exist: bool = True,
-         comp: bool = COMPRESSION,
+         comp: Compression = COMPRESSION,
          **kwargs) -> None:
     """
     Dump repo data to a file and compress it.
@@ -52,39 +73,312 @@ def dump(path: Union[Path, str],
     kwargs.update(dict(indent=2))
     path = Path(path)
     if not ignore_exist and path.exists(): return
-    path.write_bytes(compression(dumps(data, **kwargs) if isinstance(data, list) else data, comp))
+    with timer('encode'): data = dumps(data, **kwargs) if isinstance(data, list) else data
+    with timer('compress'): payload = compression(data, comp)
+    with timer('write'): path.write_bytes(payload)
+    count('raw_bytes_written', len(data))
+    count('bytes_written', len(payload))
+
+
+def dump_log(path: Union[Path, str],
+             data: List[List[Union[int, Dict[Any, Any], Set[Any]]]],
+             ignore_exist: bool = True,
+             comp: Compression = COMPRESSION,
+             **kwargs) -> None:
+    """
+    Rewrite a whole repo file as an append-only log.
+
+    The log is written next to the file first and moved in place afterwards,
+    so an interrupted rewrite does not leave a broken repo behind.
+
+    :param path: File location
+    :param data: Data to dump
+    :param ignore_exist: Overwrite existing file if set
+    :param comp: Whether to compress the records, or the codec to compress them with
+    :param kwargs: json.dumps() arguments
+    :return: Nothing
+    """
+    path = Path(path)
+    comp = get_codec(comp)
+    if not ignore_exist and path.exists(): return
+    temp = path.with_name(f'{path.name}.tmp')
+    payload = log_header(comp) + encode(data, comp, **kwargs)
+    with timer('write'), temp.open('wb') as file:
+        file.write(payload)
+        file.flush()
+        fsync(file.fileno())
+    replace(str(temp), str(path))
+    count('bytes_written', len(payload))
+
+
+def append(path: Union[Path, str], data: Iterable[List[Union[int, Dict[Any, Any], Set[Any]]]], **kwargs) -> None:
+    """
+    Append entries to an append-only log, using the codec the log was created with.
+
+    A truncated last record (e.g. from a crash while appending) gets dropped
+    first, the new records would be misframed after it otherwise.
+
+    :param path: File location
+    :param data: Entries to append
+    :param kwargs: json.dumps() arguments
+    :return: Nothing
+    """
+    with Path(path).open('r+b') as file:
+        version, comp, = parse_header(file.readline())
+        payload = encode(data, comp, version, **kwargs)
+        with timer('write'):
+            file.seek(complete(file, version))
+            file.truncate()
+            file.write(payload)
+            file.flush()
+            fsync(file.fileno())
+    count('bytes_written', len(payload))
+
+
+def truncate(path: Union[Path, str], size: int) -> None:
+    """
+    Drop the records of an append-only log from an index on.
+
+    The records kept get copied next to the file, which is moved in place
+    afterwards without re-encoding them. Memory-mapped readers of the log
+    (see lazy.LogFile) keep the old file that way, instead of reading past
+    its end or the records appended in place of the dropped ones.
+
+    :param path: File location
+    :param size: Number of records to keep
+    :return: Nothing
+    """
+    path = Path(path)
+    temp = path.with_name(f'{path.name}.tmp')
+    with path.open('rb') as file:
+        header = FRAMES[parse_header(file.readline())[0]]
+        end = path.stat().st_size
+        for _ in range(size):
+            fields = file.read(header.size)
+            if len(fields) < header.size or file.seek(header.unpack(fields)[0], 1) >= end: return
+        remaining = file.tell()
+        file.seek(0)
+        with timer('write'), temp.open('wb') as copy:
+            while remaining:
+                chunk = file.read(min(remaining, 1 << 20))
+                copy.write(chunk)
+                remaining -= len(chunk)
+            copy.flush()
+            fsync(copy.fileno())
+    replace(str(temp), str(path))
+
+
+def complete(file: BinaryIO, version: int = LOG_VERSION) -> int:
+    """
+    Find the end of the last complete record of an append-only log by walking the record headers.
+
+    :param file: Log, positioned after its header line
+    :param version: Version of the log format
+    :return: Offset after the last complete record
+    """
+    header = FRAMES[version]
+    end = file.tell()
+    size = file.seek(0, 2)
+    file.seek(end)
+    while True:
+        fields = file.read(header.size)
+        if len(fields) < header.size or end + header.size + header.unpack(fields)[0] > size: return end
+        end = file.seek(header.unpack(fields)[0], 1)
+
+
+def log_header(comp: Compression = COMPRESSION, version: int = LOG_VERSION) -> bytes:
+    """
+    Get the first line of an append-only log.
+
+    :param comp: Whether the records are compressed, or the codec they are compressed with
+    :param version: Version of the log format
+    :return: bytes
+    """
+    return b'%s %d %s\n' % (LOG_MAGIC, version, get_codec(comp).spec.encode())
+
+
+def parse_header(header: bytes) -> Tuple[int, Codec]:
+    """
+    Read the first line of an append-only log.
+
+    :param header: The first line of the log
+    :return: Version of the log format and the codec of its records
+    """
+    magic, version, codec, = header.split()
+    if magic != LOG_MAGIC or int(version) not in FRAMES: raise Exception('Not a valid jsonvc log!')
+    return int(version), get_codec(codec.decode())
+
+
+def frame(entry: List[Union[int, Dict[Any, Any], Set[Any]]],
+          comp: Compression = COMPRESSION,
+          version: int = LOG_VERSION,
+          **kwargs) -> bytes:
+    """
+    Serialize a single entry as a log record.
+
+    :param entry: Entry to serialize
+    :param comp: Whether to compress the record, or the codec to compress it with
+    :param version: Version of the log format
+    :param kwargs: json.dumps() arguments
+    :return: bytes
+    """
+    return framed(entry, compression(dumps(entry, **kwargs), comp), version)
+
+
+def framed(entry: List[Union[int, Dict[Any, Any], Set[Any]]], payload: bytes, version: int = LOG_VERSION) -> bytes:
+    """
+    Prefix the encoded payload of an entry with its record header.
+
+    :param entry: Entry of the payload
+    :param payload: Serialized and compressed entry
+    :param version: Version of the log format
+    :return: bytes
+    """
+    if version == 1: return FRAMES[1].pack(len(payload)) + payload
+    extras = entry[3] if len(entry) > 3 else dict()
+    flags = (CHECKPOINT_FLAG if 'checkpoint' in extras else 0) | (INVERSE_FLAG if 'inverse' in extras else 0)
+    return FRAMES[version].pack(len(payload), entry[0], len(entry[1]), len(entry[2]), len(extras.get('patches', ())),
+                                flags) + payload
+
+
+def encode(data: Iterable[List[Union[int, Dict[Any, Any], Set[Any]]]],
+           comp: Compression = COMPRESSION,
+           version: int = LOG_VERSION,
+           **kwargs) -> bytes:
+    """
+    Serialize entries as log records.
+
+    :param data: Entries to serialize
+    :param comp: Whether to compress the records, or the codec to compress them with
+    :param version: Version of the log format
+    :param kwargs: json.dumps() arguments
+    :return: bytes
+    """
+    stats = current()
+    if stats is None: return b''.join(frame(entry, comp, version, **kwargs) for entry in data)
+    comp = get_codec(comp)
+    records = list()
+    encoding = compressing = 0.0
+    raw = 0
+    for entry in data:
+        start = perf_counter()
+        text = dumps(entry, **kwargs)
+        middle = perf_counter()
+        payload = compression(text, comp)
+        encoding, compressing, = encoding + middle - start, compressing + perf_counter() - middle
+        raw += len(text)
+        records.append(framed(entry, payload, version))
+    stats.timing('encode', encoding)
+    stats.timing('compress', compressing)
+    stats.count('raw_bytes_written', raw)
+    stats.count('entries_written', len(records))
+    return b''.join(records)
+
+
+def decode(data: Union[bytes, 'mmap'],
+           start: int,
+           version: int = LOG_VERSION,
+           comp: Compression = COMPRESSION,
+           **kwargs) -> List[List[Union[int, Dict[Any, Any], Set[Any]]]]:
+    """
+    Read the records of an append-only log.
+
+    :param data: Raw log data
+    :param start: Offset of the first record (after the header line)
+    :param version: Version of the log format
+    :param comp: Whether the records are compressed, or the codec they are compressed with
+    :param kwargs: json.loads() arguments
+    :return: Entries in their json serializable format
+    """
+    stats = current()
+    if stats is None: return [loads(decompression(data[offset:offset + fields[0]], comp), **kwargs)
+                              for offset, fields in frames(data, start, version)]
+    records = list()
+    decompressing = decoding = 0.0
+    raw = 0
+    for offset, fields in frames(data, start, version):
+        begin = perf_counter()
+        text = decompression(data[offset:offset + fields[0]], comp)
+        middle = perf_counter()
+        records.append(loads(text, **kwargs))
+        decompressing, decoding, = decompressing + middle - begin, decoding + perf_counter() - middle
+        raw += len(text)
+    stats.timing('decompress', decompressing)
+    stats.timing('decode', decoding)
+    stats.count('raw_bytes_read', raw)
+    stats.count('entries_read', len(records))
+    return records
 
 
-def decompression(data: bytes, use_comp=COMPRESSION) -> str:
+def frames(data: Union[bytes, 'mmap'], start: int, version: int = LOG_VERSION) -> Iterator[Tuple[int, Tuple[Any, ...]]]:
+    """
+    Iterate over the records of an append-only log without decoding them.
+
+    A truncated last record (e.g. from a crash while appending) gets ignored.
+
+    :param data: Raw log data
+    :param start: Offset of the first record (after the header line)
+    :param version: Version of the log format
+    :return: Offset of each payload and the fields of its record header (starting with the payload size)
+    """
+    header = FRAMES[version]
+    while start + header.size <= len(data):
+        fields = header.unpack_from(data, start)
+        start += header.size
+        if start + fields[0] > len(data): return
+        yield start, fields
+        start += fields[0]
+
+
+def decompression(data: bytes, use_comp: Compression = COMPRESSION) -> Union[str, bytes]:
     """
     Decompress data or just convert it to str
 
     :param data: Data to decompress
-    :param use_comp: Wheter to decompress or just convert to str
+    :param use_comp: Wheter to decompress or just convert to str, or the codec to decompress with
     :return: str
     """
-    return decompress(data) if use_comp else data.decode('utf-8')
+    codec = get_codec(use_comp)
+    return codec.decompress(data) if codec else data.decode('utf-8')
 
 
 def load(path: Union[Path, str],
-         use_comp=COMPRESSION,
+         use_comp: Compression = COMPRESSION,
          auto_detect_comp=True,
          **kwargs) -> List[List[Union[int, Dict[Any, Any], Set[Any]]]]:
     """
     Load repo data from a file and decompress it.
 
     :param path: File location
-    :param use_comp: Whether to decompress data
-    :param auto_detect_comp: Whether to auto-detect if a repo is compressed
+    :param use_comp: Whether to decompress data, or the codec to decompress it with
+    :param auto_detect_comp: Whether to auto-detect the codec of a repo
     :param kwargs: json.loads() arguments
     :return: repo data
     """
-    try: return loads(decompression(Path(path).read_bytes(), use_comp if not auto_detect_comp else is_compressed(path)),
-                      **kwargs)
+    with timer('read'): data = Path(path).read_bytes()
+    count('bytes_read', len(data))
+    if data.startswith(LOG_MAGIC): return load_log(data, **kwargs)
+    try:
+        with timer('decompress'): text = decompression(data, use_comp if not auto_detect_comp else detect_codec(data))
+        count('raw_bytes_read', len(text))
+        with timer('decode'): return loads(text, **kwargs)
     except UnicodeDecodeError:
         raise Exception('Failed to read file! Did you attempt to read a compressed file without decompression?')
 
 
+def load_log(data: bytes, **kwargs) -> List[List[Union[int, Dict[Any, Any], Set[Any]]]]:
+    """
+    Read all entries of an append-only log.
+
+    :param data: Raw log data
+    :param kwargs: json.loads() arguments
+    :return: repo data
+    """
+    start = data.index(b'\n') + 1
+    version, comp, = parse_header(data[:start])
+    return decode(data, start, version, comp, **kwargs)
+
+
 def get_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Set[Any]]]:
     """
     Get added, changed and deleted values between two dictionaries.
@@ -96,13 +390,91 @@ def get_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Tuple[Dict[st
     changes = dict()
     for key, value in new.items():
         if key not in old or old[key] == value: continue
-        print('KEY:', key)
         changes[key] = value
     for key in new.keys() - old.keys(): changes[key] = new[key]
     deletes = (old.keys() - new.keys())
     return (changes, deletes,) if len(changes) + len(deletes) else None
 
 
+def get_nested_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Optional[Diff]:
+    """
+    Get differences between two dictionaries, with nested values changed by path rather than replaced.
+
+    A changed dict or list only gets patched if that is smaller than the
+    value, otherwise it gets replaced as a whole (see get_value_patch()).
+
+    :param old: The dictionary to compare to
+    :param new: The dictionary that gets compared
+    :return: differences
+    """
+    diff = get_diff(old, new)
+    if diff is None: return None
+    changes, deletions, = diff
+    diff = Diff(dict(), set(deletions))
+    for key, value in changes.items():
+        operations = get_value_patch(key, old[key], value) if key in old else None
+        if operations is None: diff.changes[key] = value
+        else: diff.patches.extend(operations)
+    return diff
+
+
+def get_value_patch(key: Any, old: Any, new: Any) -> Optional[List[List[Any]]]:
+    """
+    Get the operations changing a top-level value by path, if they are smaller than the new value.
+
+    :param key: Top-level key of the value
+    :param old: The value to compare to
+    :param new: The value that gets compared
+    :return: list of operations, None if the value should be replaced as a whole
+    """
+    if not isinstance(key, str) or not isinstance(new, (dict, list,)) or type(old) != type(new): return None
+    operations = get_patch(old, new, [key])
+    return operations if len(dumps(operations)) < len(dumps(new)) else None
+
+
+def is_log(path: Union[Path, str]) -> bool:
+    """
+    Determine whether a repo file is an append-only log.
+
+    :param path: File location
+    :return: bool
+    """
+    with Path(path).open('rb') as file:
+        return file.read(len(LOG_MAGIC)) == LOG_MAGIC
+
+
+def log_version(path: Union[Path, str]) -> int:
+    """
+    Get the format version of an append-only log.
+
+    :param path: File location
+    :return: int, 0 if the file is not a log
+    """
+    return log_info(path)[0]
+
+
+def log_codec(path: Union[Path, str]) -> Codec:
+    """
+    Get the codec the records of a repo file are compressed with.
+
+    :param path: File location
+    :return: Codec
+    """
+    return log_info(path)[1]
+
+
+def log_info(path: Union[Path, str]) -> Tuple[int, Codec]:
+    """
+    Get both the format version and the codec of a repo file from a single read.
+
+    :param path: File location
+    :return: Version of the log format (0 if the file is not a log) and the codec
+    """
+    with Path(path).open('rb') as file:
+        header = file.readline(256)
+    return parse_header(header) if header.startswith(LOG_MAGIC) else (0, detect_codec(header),)
+
+
 def is_compressed(path: Union[Path, str]) -> bool:
     """
     Determine whether a repo file is compressed.
@@ -110,24 +482,25 @@ def is_compressed(path: Union[Path, str]) -> bool:
     :param path: File location
     :return: bool
     """
-    with Path(path).open('rb') as file:
-        return hexlify(file.read(2)) == b'1f8b'
+    return bool(log_codec(path))
 
 
-def index_from_timestamp(entries: List['Entry'], timestamp: Union[int, datetime]) -> int:
+def index_from_timestamp(entries: Union[Sequence['Entry'], 'array[float]'], timestamp: Union[int, datetime]) -> int:
     """
-    Get index for a list of repo entries from a timestamp.
+    Get index of the last entry at or before a timestamp by bisection.
 
-    :param entries: Repo entry data
+    :param entries: Repo entry data (sorted by time) or an array of their timestamps
     :param timestamp: Time to compare the entries to
-    :return: int
+    :return: int, -1 if all entries are newer
     """
     if isinstance(timestamp, datetime): timestamp = timestamp.timestamp()
-    index = -1
-    for entry in entries:
-        if entry.timestamp > timestamp: break
-        index += 1
-    return index
+    if isinstance(entries, array): return bisect_right(entries, timestamp) - 1
+    low, high, = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if timestamp < entries[middle].timestamp: high = middle
+        else: low = middle + 1
+    return low - 1
 
 
 if __name__ == '__main__': pass
@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-02"
+__version__ = "0.0.0"
+
+__all__ = ('Transaction', 'running_task',)
+
+"""
+Transactions to group changes in jsonvc repos
+"""
+
+from jsonvc.entry import Entry
+from jsonvc.diffs import Diff
+from asyncio import Lock
+
+try: from asyncio import current_task
+except ImportError: from asyncio import Task; current_task = Task.current_task  # python 3.6
+
+from typing import Any, Optional, Callable, Dict, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from asyncio import Task
+    from jsonvc.repo import JSONVC
+
+
+def running_task() -> Optional['Task']:
+    """
+    Get the task running the current code.
+
+    :return: Task, None outside of an event loop
+    """
+    try: return current_task()
+    except RuntimeError: return None
+
+
+def copied(diff: Diff) -> Diff: return Diff(dict(diff.changes), set(diff.deletions), list(diff.patches))
+
+
+class Transaction:
+    """
+    Group changes to a jsonvc repo into a single entry.
+
+    While a transaction is active, auto-commits of the repo are suspended and
+    all changes accumulate in its diff. Leaving the outermost transaction adds
+    and commits them at once, an exception rolls them back instead.
+
+    Works both as a context manager and as an asynchronous context manager,
+    the latter also keeps transactions of different tasks from interleaving.
+    Changes other tasks make without a transaction meanwhile get added as
+    entries of their own, so a rollback does not drop them.
+    """
+
+    repo: 'JSONVC'
+    data: Optional[Dict[Any, Any]]
+    diff: Optional[Diff]
+    before: Optional[Dict[Any, Any]]
+    entries: Optional[List[Entry]]
+    entry_size: int
+    rewrite: bool
+    head: Optional[int]
+    owner: bool
+
+    __slots__ = ('repo', 'data', 'diff', 'before', 'entries', 'entry_size', 'rewrite', 'head', 'owner',)
+
+    def __init__(self, repo: 'JSONVC'):
+        self.repo = repo
+        self.data = None
+        self.diff = None
+        self.before = None
+        self.entries = None
+        self.entry_size = 0
+        self.rewrite = False
+        self.head = None
+        self.owner = False
+
+    def begin(self) -> None:
+        """Suspend auto-commits and remember the state of the repo to roll back to."""
+        if not self.repo.transaction_depth:
+            self.snapshot()
+            self.repo.transaction_active = self
+        self.repo.transaction_depth += 1
+
+    def snapshot(self) -> None:
+        """Remember the state of the repo to roll back to."""
+        self.repo.copies.clear()  # shared with the snapshot from now on
+        self.data = dict(self.repo)
+        self.diff = copied(self.repo.diff)
+        self.before = dict(self.repo.before)
+        self.entries = self.repo.entries
+        self.entry_size = len(self.repo.entries)
+        self.rewrite = self.repo.rewrite
+        self.head = self.repo.head
+
+    def end(self, failed: bool) -> None:
+        """
+        Either commit or roll back the changes made during the transaction.
+
+        :param failed: Whether the transaction got left by an exception
+        :return: Nothing
+        """
+        self.repo.transaction_depth -= 1
+        if self.repo.transaction_depth or self.data is None: return
+        self.repo.transaction_active = None
+        if failed: self.rollback()
+        else:
+            self.repo.add()
+            self.repo.commit()
+
+    def outside(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Make a change of another task to the state from before the transaction and add it as an entry of its own,
+        then carry it over to the changes of the transaction.
+
+        :param method: Repo method making the change, without auto-commits
+        :param args: Arguments of the method
+        :param kwargs: Keyword arguments of the method
+        :return: Whatever the method returns
+        """
+        repo = self.repo
+        data, diff, before, depth, = dict(repo), repo.diff, repo.before, repo.transaction_depth
+        dict.clear(repo)
+        dict.update(repo, self.data)
+        repo.diff, repo.before, repo.transaction_depth, = copied(self.diff), dict(self.before), 0
+        try:
+            result = method(repo, *args, **kwargs)
+            change = copied(repo.diff)
+            if type(repo).AUTO_COMMIT:
+                repo.add()
+                repo.commit()
+            self.snapshot()
+        finally:
+            dict.clear(repo)
+            dict.update(repo, data)
+            repo.diff, repo.before, repo.transaction_depth, = diff, before, depth
+        change.apply(repo)
+        change = change.select(change.keys() & diff.keys())  # the transaction must not undo it when it ends
+        for key in change.keys(): before[key] = self.data.get(key, type(repo).MISSING)
+        diff.merge(change)
+        return result
+
+    def rollback(self) -> None:
+        """Restore the state of the repo from before the transaction."""
+        del self.entries[self.entry_size:]
+        self.repo.entries = self.entries
+        self.repo.reindex()
+        self.repo.rewrite = self.rewrite
+        self.repo.head = self.head
+        self.repo.diff = self.diff
+        self.repo.before = self.before
+        self.repo.copies.clear()
+        dict.clear(self.repo)
+        dict.update(self.repo, self.data)
+
+    def __enter__(self) -> 'JSONVC':
+        self.begin()
+        return self.repo
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.end(exc_type is not None)
+        return False
+
+    async def __aenter__(self) -> 'JSONVC':
+        task = current_task()
+        if self.repo.transaction_owner is not task:
+            if self.repo.transaction_lock is None: self.repo.transaction_lock = Lock()
+            await self.repo.transaction_lock.acquire()
+            self.repo.transaction_owner = task
+            self.owner = True
+        self.begin()
+        return self.repo
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> bool:
+        try: self.end(exc_type is not None)
+        finally:
+            if self.owner:
+                self.repo.transaction_owner = None
+                self.owner = False
+                self.repo.transaction_lock.release()
+        return False
+
+
+if __name__ == '__main__': pass
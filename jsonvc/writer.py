@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-09"
+__version__ = "0.0.0"
+
+__all__ = ('Writer',)
+
+"""
+Background thread writing the commits of jsonvc repos to their files
+"""
+
+from jsonvc.storage import Storage, open_storage
+from jsonvc.stats import Stats, current, NOTHING
+from concurrent.futures import Future
+from threading import Thread
+from queue import Queue, Empty
+from pathlib import Path
+from itertools import chain
+import atexit
+
+from typing import Any, Optional, Union, Dict, List
+
+
+class Job:
+    """Records waiting to be written to a repo file"""
+
+    storage: Storage
+    records: List[List[Union[int, Dict[Any, Any], List[Any]]]]
+    rewrite: bool
+    truncate: Optional[int]
+    kwargs: Dict[str, Any]
+    stats: Optional[Stats]
+    future: Future
+
+    __slots__ = ('storage', 'records', 'rewrite', 'truncate', 'kwargs', 'stats', 'future',)
+
+    def __init__(self,
+                 storage: Storage,
+                 records: List[List[Union[int, Dict[Any, Any], List[Any]]]],
+                 rewrite: bool,
+                 truncate: Optional[int],
+                 kwargs: Dict[str, Any],
+                 stats: Optional[Stats] = None):
+        self.storage = storage
+        self.records = records
+        self.rewrite = rewrite
+        self.truncate = truncate
+        self.kwargs = kwargs
+        self.stats = stats
+        self.future = Future()
+
+
+class Writer:
+    """
+    Single thread writing queued commits to disk (write-behind).
+
+    Everything queued while the thread was busy gets written at once: appends
+    to the same file share a single write, and a rewrite makes the queued
+    writes of that file before it unnecessary (group commit).
+    """
+
+    queue: Queue
+    thread: Thread
+    closed: bool
+    error: Optional[BaseException]
+
+    __slots__ = ('queue', 'thread', 'closed', 'error',)
+
+    def __init__(self):
+        self.queue = Queue()
+        self.closed = False
+        self.error = None
+        self.thread = Thread(target=self.run, name='jsonvc-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self,
+               path: Union[Path, str, Storage],
+               records: List[List[Union[int, Dict[Any, Any], List[Any]]]],
+               rewrite: bool = False,
+               truncate: Optional[int] = None,
+               **kwargs: Any) -> Future:
+        """
+        Queue records to be written.
+
+        The stats active while queueing get the measurements of the write.
+
+        :param path: Repo file to write to, or its storage
+        :param records: Entries in their json serializable format
+        :param rewrite: Whether the records replace the whole file instead of getting appended
+        :param truncate: Number of stored entries to keep before appending the records, None to keep all
+        :param kwargs: Storage.rewrite() kwargs
+        :return: Future, which resolves as soon as the records are on disk
+        """
+        if self.closed: raise RuntimeError('Writer was already closed!')
+        job = Job(open_storage(path), records, rewrite, truncate, kwargs, current())
+        self.queue.put(job)
+        return job.future
+
+    def run(self) -> None:
+        """Write queued jobs until the writer gets closed."""
+        running = True
+        while running:
+            jobs = [self.queue.get()]
+            while True:
+                try: jobs.append(self.queue.get_nowait())
+                except Empty: break
+            if None in jobs:  # closing, which gets queued after every job to write
+                running = False
+                jobs.remove(None)
+            try: self.write(jobs)
+            finally:
+                for _ in range(len(jobs) + (not running)): self.queue.task_done()
+
+    def write(self, jobs: List[Job]) -> None:
+        """
+        Write a batch of jobs, grouping them by file.
+
+        :param jobs: Jobs in the order they were queued
+        :return: Nothing
+        """
+        while jobs:
+            path = jobs[0].storage.path
+            group = [job for job in jobs if job.storage.path == path]
+            jobs = [job for job in jobs if job.storage.path != path]
+            try:
+                # the writes of a group count towards the stats of its first job
+                with group[0].stats or NOTHING: self.write_group(group)
+            except BaseException as error:
+                self.error = self.error or error
+                for job in group: job.future.set_exception(error)
+            else:
+                for job in group: job.future.set_result(True)
+
+    @staticmethod
+    def write_group(group: List[Job]) -> None:
+        """
+        Write the jobs of a single file.
+
+        :param group: Jobs in the order they were queued
+        :return: Nothing
+        """
+        rewrites = [index for index, job in enumerate(group) if job.rewrite]
+        if rewrites:
+            last = group[rewrites[-1]]
+            last.storage.rewrite(last.records, **last.kwargs)
+            appended = group[rewrites[-1] + 1:]
+        else: appended = group
+        # appends get written at once, unless entries were cut off in between
+        starts = [index for index, job in enumerate(appended) if not index or job.truncate is not None]
+        for start, stop in zip(starts, starts[1:] + [len(appended)]):
+            if appended[start].truncate is not None: appended[start].storage.truncate(appended[start].truncate)
+            records = list(chain.from_iterable(job.records for job in appended[start:stop]))
+            if records: appended[start].storage.append(records)
+
+    def flush(self) -> None:
+        """
+        Wait for every queued job to be written.
+
+        :return: Nothing
+        :raises: The first error of a write since the last flush
+        """
+        self.queue.join()
+        error, self.error, = self.error, None
+        if error is not None: raise error
+
+    def close(self) -> None:
+        """
+        Write every queued job and stop the thread.
+
+        :return: Nothing
+        :raises: The first error of a write since the last flush
+        """
+        if self.closed: return
+        self.closed = True
+        atexit.unregister(self.close)
+        self.queue.put(None)
+        try: self.flush()
+        finally: self.thread.join()
+
+
+if __name__ == '__main__': pass
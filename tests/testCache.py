@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-15"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+from jsonvc.cache import VersionCache
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class CacheTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc])
+
+    def test_lru(self):
+        cache = VersionCache(2)
+        cache.put(1, dict(a=1))
+        cache.put(5, dict(a=5))
+        self.assertEqual(dict(a=1), cache.get(1))
+        cache.put(7, dict(a=7))
+        self.assertNotIn(5, cache, 'The least recently used version was not evicted!')
+        self.assertEqual((1, dict(a=1),), cache.nearest(6))
+        self.assertEqual((-1, None,), cache.nearest(0))
+        self.assertIsNone(cache.get(5))
+        cache.invalidate(7)
+        self.assertEqual(dict(hits=1, misses=1, evictions=1, size=1, maxsize=2), cache.info())
+
+    def test_repo_cache(self):
+        repo = jsonvc.JSONVC('cache.jsonvc', checkpoint_interval=0, checkpoint_size=0, cache_size=3)
+        for i in range(20): repo[str(i % 7)] = i
+        versions = [repo.state(index) for index in range(len(repo.entries))]
+        repo = jsonvc.JSONVC('cache.jsonvc', checkpoint_interval=0, checkpoint_size=0, cache_size=3)
+
+        for index in (5, 12, 5, 15, 12, 3, 19,):
+            repo.build(index)
+            self.assertEqual(versions[index], repo, f'Build of {index} differs!')
+        self.assertEqual(2, repo.cache.hits)
+        self.assertEqual(3, repo.cache.evictions)
+        self.assertEqual((15, versions[15],), repo.cache.nearest(16))
+
+        repo.reset(14)
+        self.assertNotIn(19, repo.cache)
+        self.assertIn(3, repo.cache)
+        repo['x'] = 1
+        repo.build(12)
+        self.assertEqual(versions[12], repo)
+        repo.strip(2)
+        self.assertEqual([len(repo.entries) - 1], list(repo.cache.versions), 'Versions before strip() were kept!')
+
+
+if __name__ == '__main__': pass
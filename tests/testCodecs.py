@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-10"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from json import dumps
+import jsonvc
+import jsonvc.codecs
+import jsonvc.repo
+import jsonvc.tools
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class CodecsTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc])
+
+    def test_codecs(self):
+        data = bytes(dumps(dict((str(i), list(range(i))) for i in range(50))), encoding='utf-8')
+        for name in ('none', 'gzip', 'zlib', 'bz2', 'lzma',):
+            for level in (None, 1, 9,):
+                codec = jsonvc.codecs.Codec(name, level)
+                compressed = codec.compress(data)
+                self.assertEqual(data, codec.decompress(compressed), f'{codec} did not round-trip!')
+                self.assertEqual(codec, jsonvc.codecs.get_codec(codec.spec))
+                self.assertEqual(name, jsonvc.codecs.detect_codec(compressed).name, f'{codec} was not detected!')
+        self.assertLess(len(jsonvc.codecs.Codec('zlib', 9).compress(data)),
+                        len(jsonvc.codecs.Codec('zlib', 0).compress(data)))
+        self.assertEqual('none', jsonvc.codecs.get_codec(False).spec)
+        self.assertEqual('gzip:9', jsonvc.codecs.get_codec(True).spec)
+        self.assertRaises(ValueError, jsonvc.codecs.get_codec, 'snappy')
+
+    def test_repo_codec(self):
+        repo = jsonvc.JSONVC('zlib.jsonvc', codec='zlib:1')
+        repo['a'] = 1
+        self.assertEqual(b'JSONVC-LOG 2 zlib:1\n', Path('zlib.jsonvc').read_bytes().splitlines(True)[0])
+
+        reopened = jsonvc.JSONVC('zlib.jsonvc')
+        reopened['b'] = 2
+        reopened.reset(1)
+        self.assertEqual('zlib:1', jsonvc.tools.log_codec('zlib.jsonvc').spec, 'The codec of the file was not kept!')
+
+        archive = jsonvc.JSONVC('zlib.jsonvc', codec='lzma:9')
+        archive['c'] = 3
+        self.assertEqual('lzma:9', jsonvc.tools.log_codec('zlib.jsonvc').spec, 'The file was not converted!')
+        self.assertEqual(dict(a=1, c=3), jsonvc.JSONVC('zlib.jsonvc'))
+
+    def test_old_format(self):
+        jsonvc.tools.dump('old.jsonvc', [[1598787392, dict(a=1), list()]], comp='bz2')
+        self.assertEqual('bz2', jsonvc.tools.log_codec('old.jsonvc').name)
+        repo = jsonvc.JSONVC('old.jsonvc')
+        self.assertEqual(dict(a=1), repo)
+        repo['b'] = 2
+        self.assertEqual('bz2:9', jsonvc.tools.log_codec('old.jsonvc').spec)
+
+
+if __name__ == '__main__': pass
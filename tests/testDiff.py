@@ -32,6 +32,23 @@ class DiffTest(TestCase):
             diff2
         )
 
+    def test_merge_patches(self):
+        diff = Diff(dict(a=dict(b=1)), patches=[['replace', '/c/d', 1]])
+        diff.merge(Diff(patches=[['add', '/a/e', 2], ['remove', '/c/e']]))
+
+        self.assertEqual(
+            Diff(dict(a=dict(b=1, e=2)), patches=[['replace', '/c/d', 1], ['remove', '/c/e']]),
+            diff,
+            'Patches were not folded into changes!'
+        )
+
+        diff.merge(Diff(dict(c=3), {'a'}))
+        self.assertEqual(
+            Diff(dict(c=3), {'a'}),
+            diff,
+            'Patches of replaced values were kept!'
+        )
+
     def test_len(self):
         self.assertEqual(
             0,
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-14"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from random import Random
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+import jsonvc
+import jsonvc.tools
+import jsonvc.engine
+from jsonvc.diffs import Diff
+from jsonvc.entry import Entry
+
+
+def generate_diffs(size: int) -> list:
+    random = Random(size)
+    data, diffs, = dict(), list(),
+    for i in range(size):
+        new = dict(data)
+        for _ in range(random.randint(1, 3)):
+            key = f'key{random.randint(0, 20)}'
+            kind = random.random()
+            if kind < 0.2: new.pop(key, None)
+            elif kind < 0.6 or not isinstance(new.get(key), dict): new[key] = dict(value=[i], count=i)
+            else: new[key] = dict(new[key], value=new[key]['value'] + [i])
+        diffs.append(jsonvc.tools.get_nested_diff(data, new) or Diff())
+        data = new
+    return diffs
+
+
+class EngineTest(unittest.TestCase):  # process pools do not work with pyfakefs
+    def test_reduce(self):
+        diffs = generate_diffs(500)
+        self.assertTrue(any(diff.patches for diff in diffs), 'No nested changes were tested!')
+        expected = jsonvc.engine.merge_diffs(diffs).apply(dict())
+        replayed = dict()
+        for diff in diffs: diff.apply(replayed)
+        self.assertEqual(replayed, expected)
+
+        for processes in (False, True,):
+            reduced = jsonvc.engine.reduce_diffs(diffs, 2, chunk_size=30, threshold=100, processes=processes)
+            self.assertEqual(expected, reduced.apply(dict()), f'Reduction differs (processes={processes})!')
+        self.assertEqual(Diff(), jsonvc.engine.reduce_diffs(list(), threshold=0))
+
+    def test_parallel_build(self):
+        records = [Entry(1598787392 + index, diff.changes, diff.deletions, patches=diff.patches).history_entry()
+                   for index, diff in enumerate(generate_diffs(300))]
+        repo = jsonvc.JSONVC(data=records, checkpoint_interval=0, checkpoint_size=0)
+        versions = [repo.state(index) for index in (50, 299,)]
+
+        threshold = jsonvc.JSONVC.PARALLEL_THRESHOLD
+        jsonvc.JSONVC.PARALLEL_THRESHOLD = 40
+        try:
+            with mock.patch('jsonvc.engine.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+                repo = jsonvc.JSONVC(data=records, checkpoint_interval=0, checkpoint_size=0)
+                self.assertEqual(versions[-1], repo)
+                repo.build(50)
+                self.assertEqual(versions[0], repo)
+                self.assertEqual(dict((key, versions[0][key],) for key in ('key1', 'key2',) if key in versions[0]),
+                                 repo.materialize(['key1', 'key2'], 50))
+                self.assertEqual(versions[0], repo.diff_between(-1, 50).apply(dict()))
+            self.assertEqual(3, executor.call_count, 'Small payloads were not merged in threads!')  # not materialize
+        finally: jsonvc.JSONVC.PARALLEL_THRESHOLD = threshold
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-23"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from json import dumps
+import unittest
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+import jsonvc.ingest
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+SNAPSHOTS = [dict(a=i // 2, b=dict(c=[i % 3])) for i in range(20)]
+LINES = [dumps([100 + i, snapshot]) for i, snapshot in enumerate(SNAPSHOTS)]
+
+
+class DocumentsTest(unittest.TestCase):  # process pools do not work with pyfakefs
+    def test_documents(self):
+        lines = LINES[:3] + ['', dumps(dict(d=1))]
+        parsed = [(100, SNAPSHOTS[0]), (101, SNAPSHOTS[1]), (102, SNAPSHOTS[2]), (None, dict(d=1))]
+        self.assertEqual(parsed, list(jsonvc.ingest.documents(lines)))
+        self.assertEqual(parsed, list(jsonvc.ingest.documents(lines, workers=2, chunk_size=2)))
+        self.assertRaises(ValueError, list, jsonvc.ingest.documents(['[1, 2]']))
+        self.assertRaises(ValueError, list, jsonvc.ingest.documents(['[true, {}]']))
+
+
+class IngestTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc])
+
+    def test_ingest(self):
+        repo = jsonvc.JSONVC('ingest.jsonvc', checkpoint_interval=4)
+        lines = LINES + [dumps([120, SNAPSHOTS[-1]])]  # without changes
+        self.assertEqual(20, repo.ingest(jsonvc.ingest.documents(lines), every=8))
+        self.assertEqual(SNAPSHOTS[-1], repo)
+        self.assertEqual(list(range(100, 120)), list(repo.timestamps))
+
+        reloaded = jsonvc.JSONVC('ingest.jsonvc')
+        self.assertEqual(20, len(reloaded.entries))
+        for index, snapshot in enumerate(SNAPSHOTS): self.assertEqual(snapshot, reloaded.state(index))
+        self.assertEqual([4, 8, 12, 16], [index for index, entry in enumerate(reloaded.entries) if entry.checkpoint])
+
+        self.assertEqual(1, reloaded.ingest([dict(a=1)]))
+        self.assertRaises(ValueError, reloaded.ingest, [(1, dict(a=2))])
+        self.assertEqual(dict(a=1), jsonvc.JSONVC('ingest.jsonvc'))
+
+    def test_timestamps(self):
+        repo = jsonvc.JSONVC('timestamps.jsonvc')
+        self.assertEqual(2, repo.ingest([(1600000000.5, dict(a=1)), (1600000001, dict(a=2))]))
+        reloaded = jsonvc.JSONVC('timestamps.jsonvc')
+        self.assertEqual([1600000000.5, 1600000001], [entry.timestamp for entry in reloaded.entries])
+        repo['b'] = 3
+        self.assertEqual(dict(a=2, b=3), jsonvc.JSONVC('timestamps.jsonvc'))
+        self.assertRaises(ValueError, repo.ingest, [(True, dict(a=3))])
+        self.assertRaises(ValueError, repo.ingest, [(4102444800, dict(a=3)), dict(a=4)])  # now lies before
+        self.assertEqual(dict(a=2, b=3), jsonvc.JSONVC('timestamps.jsonvc'))
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-08"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import jsonvc
+import jsonvc.lazy
+import jsonvc.locking
+import jsonvc.tools
+
+
+class LazyTest(TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()  # mmap needs actual files
+        self.path = Path(self.directory.name) / 'lazy.jsonvc'
+        repo = jsonvc.JSONVC(self.path, checkpoint_interval=4, checkpoint_size=0, store_inverses=True)
+        self.versions = list()
+        for i in range(10):
+            repo.update(dict((str(j), dict(value=j),) for j in range(i + 1) if j % 3 != (i + 1) % 3))
+            self.versions.append(dict(repo))
+
+    def tearDown(self) -> None: self.directory.cleanup()
+
+    def test_headers(self):
+        entries = jsonvc.lazy.load_entries(self.path)
+        eager = jsonvc.JSONVC(self.path).entries
+        self.assertEqual([entry.timestamp for entry in eager], [entry.timestamp for entry in entries])
+        self.assertEqual([str(entry) for entry in eager], [str(entry) for entry in entries])
+        self.assertFalse(any(entry.loaded for entry in entries), 'Listing the entries decoded them!')
+        self.assertEqual([4, 8], [index for index, entry in enumerate(entries) if entry.checkpoint is not None])
+        self.assertEqual(2, sum(entry.loaded for entry in entries))
+
+    def test_lazy_repo(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True)
+        self.assertEqual(self.versions[-1], repo)
+        repo.checkout(5)
+        self.assertEqual(self.versions[5], repo)
+        self.assertFalse(any(entry.loaded for entry in repo.entries[:4]), 'Entries before a checkpoint got decoded!')
+
+        self.assertEqual(self.versions[2]['2'], repo.value_at('2', 2))
+        self.assertEqual([2, 4, 5, 7, 8], repo.key_history('2'))
+
+        repo.checkout(9)
+        repo['x'] = 1
+        self.assertEqual(dict(self.versions[-1], x=1), jsonvc.JSONVC(self.path))
+
+    def test_iter_versions(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True, keys=())
+        loaded = [index for index, entry in enumerate(repo.entries) if entry.loaded]
+        self.assertEqual(self.versions[3:], [dict(data) for _, _, data, in repo.iter_versions(3)])
+        self.assertEqual(sorted({*loaded, 0, 1, 2, 3}),  # replaying the start decodes its entries like state()
+                         [index for index, entry in enumerate(repo.entries) if entry.loaded],
+                         'Iterating kept the entries decoded!')
+
+    def test_no_keys(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True, keys=())
+        self.assertEqual(dict(), repo)
+        self.assertEqual(list(), list(repo.touching(set(), 0, len(repo.entries))))
+        self.assertEqual(dict(), repo.materialize((), 7))
+        self.assertEqual([4, 8], [index for index, entry in enumerate(repo.entries) if entry.loaded],  # checkpoints
+                         'Entries were decoded without any key to replay!')
+
+    def test_diff_between(self):
+        path = Path(self.directory.name) / 'no_inverses.jsonvc'
+        repo = jsonvc.JSONVC(path, checkpoint_interval=4, checkpoint_size=0)
+        for version in self.versions: repo.update(version)
+        repo = jsonvc.JSONVC(path, lazy=True, keys=())
+        self.assertEqual(self.versions[6], repo.diff_between(9, 6).apply(dict(self.versions[9])))
+        self.assertIsNone(repo.key_index, 'Every entry got indexed!')
+        self.assertFalse(any(entry.loaded for entry in repo.entries[:4]), 'Entries before a checkpoint got decoded!')
+
+    def test_truncated(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True)
+        writer = jsonvc.JSONVC(self.path, lazy=True)
+        writer.reset(6)
+        writer['x'] = 1
+        self.assertEqual(self.versions[7], repo.state(7), 'The records of the log were changed in place!')
+        writer.close()
+        self.assertEqual(self.versions[5], writer.state(5))  # mapped again after closing
+        self.assertEqual(dict(self.versions[5], x=1), writer.state(6))
+        repo.close()
+        self.assertRaises(jsonvc.locking.ConflictError, repo.state, 2)  # the log it was read from got replaced
+
+    def test_old_format(self):
+        jsonvc.tools.dump(self.path, [[1598787392, dict(a=1), list()], [1598787393, dict(b=2), ['a']]])
+        self.assertEqual(dict(b=2), jsonvc.JSONVC(self.path, lazy=True))
+        self.assertEqual(2, len(jsonvc.lazy.load_entries(self.path)))
+
+
+if __name__ == '__main__': pass
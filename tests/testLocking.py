@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-18"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import jsonvc
+import jsonvc.locking
+
+
+class LockingTest(TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()  # flock needs actual files
+
+    def tearDown(self) -> None: self.directory.cleanup()
+
+    def check_rebase(self, name: str) -> None:
+        path = Path(self.directory.name) / name
+        first, second, = jsonvc.JSONVC(path, locking=True), jsonvc.JSONVC(path, locking=True)
+        first['a'] = 1
+        second['b'] = 2  # would have lost the entry of the first repo without rebasing
+        first['c'] = 3
+        self.assertEqual(dict(a=1, b=2, c=3), first)
+        self.assertEqual(dict(a=1, b=2), second)
+        loaded = jsonvc.JSONVC(path)
+        self.assertEqual(dict(a=1, b=2, c=3), loaded)
+        self.assertEqual([entry.timestamp for entry in first.entries], [entry.timestamp for entry in loaded.entries])
+        self.assertEqual(3, len(loaded.entries))
+        for repo in (first, second, loaded,): repo.close()
+
+    def test_rebase(self):
+        self.check_rebase('repo.jsonvc')
+        self.check_rebase('repo.db')
+
+    def test_conflict(self):
+        path = Path(self.directory.name) / 'repo.jsonvc'
+        first, second, = jsonvc.JSONVC(path, locking=True), jsonvc.JSONVC(path, locking=True)
+        first['a'] = 1
+        with self.assertRaises(jsonvc.locking.ConflictError) as context: second['a'] = 2
+        self.assertEqual({'a'}, context.exception.keys)
+        self.assertEqual(dict(a=1), jsonvc.JSONVC(path))
+
+        second.revert()
+        second.load(path)  # takes over the entries of the first repo
+        second.build()
+        second['a'] = 2
+        second.strip(1)
+        self.assertRaises(jsonvc.locking.ConflictError, first.__setitem__, 'b', 3)
+        self.assertEqual(dict(a=2), jsonvc.JSONVC(path))
+
+    def test_lock(self):
+        lock = jsonvc.locking.FileLock(Path(self.directory.name) / 'repo.lock')
+        with lock:
+            with lock: self.assertEqual(2, lock.depth)
+            self.assertIsNotNone(lock.file)
+        self.assertIsNone(lock.file)
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-03"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from jsonvc.patches import get_patch, apply_patch, to_pointer, from_pointer
+from copy import deepcopy
+from unittest import TestCase
+
+
+class PatchesTest(TestCase):
+    def test_pointer(self):
+        tokens = ['a/b', 'c~d', '0']
+        self.assertEqual('/a~1b/c~0d/0', to_pointer(tokens))
+        self.assertEqual(tokens, from_pointer(to_pointer(tokens)))
+
+    def test_get_patch(self):
+        self.assertEqual(
+            [['replace', '/a/b/c', 2]],
+            get_patch(dict(b=dict(c=1, d=[1, 2])), dict(b=dict(c=2, d=[1, 2])), ['a']),
+            'Nested change was not stored by its path!'
+        )
+        self.assertEqual(
+            [['remove', '/a/1'], ['remove', '/a/1']],
+            get_patch([1, 2, 3, 4], [1, 4], ['a']),
+            'List was not spliced!'
+        )
+        self.assertEqual(
+            [['replace', '/a/1', 5], ['add', '/a/2', 6]],
+            get_patch([1, 2, 4], [1, 5, 6, 4], ['a']),
+            'List was not spliced!'
+        )
+        self.assertEqual(
+            [['replace', '/a', '1']],
+            get_patch(1, '1', ['a']),
+            'Different types were not replaced!'
+        )
+
+    def test_apply_patch(self):
+        values = (
+            (dict(b=dict(c=1, d=[1, 2])), dict(b=dict(d=[0, 1, 2, 3], e=None)),),
+            ([1, 2, 3, 4], [4, 3],),
+            ([dict(a=1), dict(b=2)], [dict(a=2), dict(b=2), dict(c=3)],),
+            (dict(a=[1, 2]), dict(a=[]),),
+        )
+        for old, new in values:
+            data = dict(key=old)
+            untouched = deepcopy(data)
+            patched = apply_patch(dict(data), get_patch(old, new, ['key']))
+            self.assertEqual(dict(key=new), patched, f'{old} was not patched to {new}!')
+            self.assertEqual(untouched, data, 'Original data was changed by the patch!')
+
+            inverse = list()
+            apply_patch(dict(data), get_patch(old, new, ['key']), inverse)
+            self.assertEqual(data, apply_patch(patched, inverse), f'Patch from {old} to {new} was not undone!')
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-16"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from random import Random
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+from jsonvc.persistent import PersistentMap
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class Colliding:
+    """Keys sharing few hashes"""
+
+    def __init__(self, value: int): self.value = value
+
+    def __hash__(self) -> int: return self.value % 3
+
+    def __eq__(self, other) -> bool: return isinstance(other, Colliding) and self.value == other.value
+
+
+class PersistentTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc])
+
+    def test_map(self):
+        random = Random(16)
+        keys = [str(i) for i in range(300)] + [Colliding(i) for i in range(10)] + [-1, 2 ** 70]
+        data, expected, = PersistentMap(), dict(),
+        versions = list()
+        for i in range(3_000):
+            key = random.choice(keys)
+            if random.random() < 0.3 and key in expected:
+                data = data.delete(key)
+                del expected[key]
+            else:
+                data = data.set(key, i)
+                expected[key] = i
+            versions.append((data, dict(expected),))
+        for data, expected in versions[::50]:
+            self.assertEqual(expected, data.thaw())
+            self.assertEqual(len(expected), len(data))
+            self.assertTrue(all(data[key] == value for key, value in expected.items()))
+            self.assertFalse(any(key in data for key in keys if key not in expected))
+        self.assertRaises(KeyError, PersistentMap().delete, 'missing')
+        self.assertEqual(PersistentMap(), PersistentMap.from_mapping(dict(a=1)).delete('a'))
+
+    def test_sharing(self):
+        data = PersistentMap.from_mapping(dict((str(i), i) for i in range(1_000)))
+        changed = data.set('0', 'changed')
+        self.assertEqual(0, data['0'], 'The original map was changed!')
+        shared = sum(old is new for old, new in zip(data.root.children, changed.root.children))
+        self.assertEqual(len(data.root.children) - 1, shared, 'Unchanged nodes were copied!')
+        self.assertIs(changed, changed.set('0', changed['0']))
+
+    def test_versions(self):
+        repo = jsonvc.JSONVC('versions.jsonvc', checkpoint_interval=6, checkpoint_size=0, track_nested=True)
+        for i in range(20):
+            with repo.transaction():
+                repo[f'key{i % 4}'] = dict(value=[i])
+                if i % 3: repo['key0']['value'].append(i)
+                if i % 5 == 4: del repo[f'key{(i + 1) % 4}']
+        versions = [repo.version(index) for index in range(len(repo.entries))]
+        for index, version in enumerate(versions):
+            self.assertEqual(repo.state(index), version.thaw(), f'Version {index} differs!')
+        self.assertEqual(versions[7], repo.version(7))
+        self.assertEqual(dict(), repo.version(-1))
+        repo.reset(5)
+        self.assertEqual(repo.state(4), repo.version().thaw())
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,454 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-08-30"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from asyncio import new_event_loop, gather, sleep
+from operator import setitem
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class RepoTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc])
+
+    def test_checkpoints(self):
+        repo = jsonvc.JSONVC('checkpoints.jsonvc', checkpoint_interval=5, checkpoint_size=0)
+        for i in range(12): repo[str(i)] = i
+
+        self.assertEqual(
+            [5, 10],
+            [index for index, entry in enumerate(repo.entries) if entry.checkpoint is not None],
+            'Checkpoints were not stored every 5 entries!'
+        )
+
+        reloaded = jsonvc.JSONVC('checkpoints.jsonvc')
+        self.assertEqual(dict((str(i), i) for i in range(12)), reloaded)
+        reloaded.build(index=7)
+        self.assertEqual(dict((str(i), i) for i in range(8)), reloaded)
+
+    def test_checkpoint_size(self):
+        repo = jsonvc.JSONVC('checkpoint_size.jsonvc', checkpoint_interval=0, checkpoint_size=2)
+        repo.update(dict(a=1))
+        repo.update(dict(a=1, b=2, c=3))
+        self.assertIsNotNone(repo.entries[-1].checkpoint)
+
+    def test_strip_checkpoints(self):
+        repo = jsonvc.JSONVC('strip.jsonvc', checkpoint_interval=3, checkpoint_size=0)
+        for i in range(7): repo[str(i)] = i
+        repo.strip(2)
+
+        expected = dict((str(i), i) for i in range(2, 7))
+        self.assertEqual(expected, jsonvc.JSONVC('strip.jsonvc'))
+        self.assertEqual(dict((str(i), i) for i in range(2, 4)), repo.entries[1].checkpoint)
+
+    def test_old_format(self):
+        jsonvc.tools.dump('old.jsonvc', [[1598787392, dict(a=1), list()], [1598787393, dict(b=2), ['a']]])
+        repo = jsonvc.JSONVC('old.jsonvc')
+        self.assertEqual(dict(b=2), repo)
+
+        repo['c'] = 3
+        self.assertTrue(jsonvc.tools.is_log('old.jsonvc'))
+        self.assertEqual(dict(b=2, c=3), jsonvc.JSONVC('old.jsonvc'))
+
+    def test_append(self):
+        repo = jsonvc.JSONVC('append.jsonvc')
+        repo['a'] = 1
+        size = Path('append.jsonvc').stat().st_size
+        repo['b'] = 2
+        self.assertLess(size, Path('append.jsonvc').stat().st_size)
+        self.assertEqual(
+            [[entry.timestamp, entry.changes, list(entry.deletions)] for entry in repo.entries],
+            jsonvc.tools.load('append.jsonvc')
+        )
+
+        repo.reset(1)
+        self.assertEqual(dict(a=1), repo)
+        self.assertEqual(1, len(jsonvc.tools.load('append.jsonvc')))
+
+        repo.reset(0)
+        self.assertEqual(dict(), repo)
+
+    def test_commit_after_build(self):
+        repo = jsonvc.JSONVC('commit_after_build.jsonvc')
+        for key in 'abc': repo[key] = 1
+        repo.build(0)
+        repo['x'] = 9
+        self.assertEqual(dict(a=1, b=1, c=1, x=9), repo)
+        self.assertEqual(dict(a=1, b=1, c=1, x=9), jsonvc.JSONVC('commit_after_build.jsonvc'))
+
+    def test_append_after_torn_tail(self):
+        repo = jsonvc.JSONVC('torn.jsonvc')
+        repo['a'] = 1
+        repo['b'] = 2
+        Path('torn.jsonvc').write_bytes(Path('torn.jsonvc').read_bytes()[:-3])  # crashed while appending b
+        repo = jsonvc.JSONVC('torn.jsonvc')
+        self.assertEqual(dict(a=1), repo)
+        repo['c'] = 3
+        repo['d'] = 4
+        self.assertEqual(dict(a=1, c=3, d=4), jsonvc.JSONVC('torn.jsonvc'))
+
+    def test_nested_diff(self):
+        value = dict(('key' + str(i), list(range(i))) for i in range(20))
+        repo = jsonvc.JSONVC('nested.jsonvc')
+        repo.update(dict(a=value, b=1))
+        changed = dict(value, key3=[0, 1, 5], key21=True)
+        repo.update(dict(a=changed, b=1))
+
+        self.assertEqual(
+            [['replace', '/a/key3/2', 5], ['add', '/a/key21', True]],
+            repo.entries[-1].patches
+        )
+        self.assertEqual(dict(a=value, b=1), repo.entries[0].apply(dict()))
+        self.assertEqual(dict(a=changed, b=1), jsonvc.JSONVC('nested.jsonvc'))
+
+        wrapped = dict(doc=dict(('field' + str(i), 'x' * 100) for i in range(100)))
+        repo['c'] = wrapped
+        repo['c'] = dict(doc=dict(wrapped['doc'], field0='y'))  # a single key, but a single operation as well
+        self.assertEqual([['replace', '/c/doc/field0', 'y']], repo.entries[-1].patches)
+        self.assertFalse(repo.entries[-1].changes)
+        repo['b'] = [1]
+        self.assertEqual(dict(b=[1]), repo.entries[-1].changes, 'Patched a value of another type!')
+        self.assertEqual(dict(repo), jsonvc.JSONVC('nested.jsonvc'))
+
+    def test_tracking(self):
+        repo = jsonvc.JSONVC('tracking.jsonvc', track_nested=True)
+        repo['a'] = dict(b=dict(c=[1, 2, 3]), d=1)
+        original = repo.entries[0].changes['a']
+
+        repo['a']['b']['c'].append(4)
+        repo['a']['b']['c'][0] = 0
+        del repo['a']['d']
+        repo['a'].setdefault('e', list()).extend([5, 6])
+        self.assertEqual(4, repo['a']['b']['c'].pop())
+
+        expected = dict(a=dict(b=dict(c=[0, 2, 3]), e=[5, 6]))
+        self.assertEqual(expected, repo)
+        self.assertEqual(
+            [['add', '/a/b/c/3', 4]],
+            repo.entries[1].patches
+        )
+        self.assertEqual(dict(b=dict(c=[1, 2, 3]), d=1), original, 'Stored value was changed in-place!')
+        self.assertEqual(expected, jsonvc.JSONVC('tracking.jsonvc'))
+
+        with repo.transaction(): repo['a']['e'].sort(reverse=True)
+        self.assertEqual([6, 5], repo['a']['e'])
+        self.assertEqual(
+            [['replace', '/a/e/0', 6], ['replace', '/a/e/1', 5]],
+            repo.entries[-1].patches
+        )
+
+    def test_tracking_copies(self):
+        repo = jsonvc.JSONVC('tracking_copies.jsonvc', track_nested=True)
+        repo['a'] = dict(b=[1, 2])
+        original = repo.entries[0].changes['a']
+        with repo.transaction():
+            repo['a']['b'].append(3)
+            copied = dict.__getitem__(repo, 'a')['b']
+            repo['a']['b'].append(4)
+            self.assertIs(copied, dict.__getitem__(repo, 'a')['b'], 'Copied more than once per transaction!')
+            repo['a']['c'] = repo['a']['b']
+            repo['a']['c'].append(5)
+        self.assertEqual(dict(b=[1, 2]), original, 'Stored value was changed in-place!')
+        self.assertEqual(dict(a=dict(b=[1, 2, 3, 4], c=[1, 2, 3, 4, 5])), repo)
+        self.assertEqual(dict(a=dict(b=[1, 2, 3, 4], c=[1, 2, 3, 4, 5])), jsonvc.JSONVC('tracking_copies.jsonvc'))
+        self.assertEqual(dict(a=dict(b=[1, 2])), repo.state(0))
+
+    def test_setdefault(self):
+        repo = jsonvc.JSONVC('setdefault.jsonvc')
+        repo['a'] = 1
+        repo.setdefault('a', 2)
+        self.assertEqual(1, len(repo.entries))
+        self.assertEqual(dict(a=1), jsonvc.JSONVC('setdefault.jsonvc'))
+
+    def test_checkout(self):
+        repo = jsonvc.JSONVC('checkout.jsonvc', checkpoint_interval=0, checkpoint_size=0, track_nested=True)
+        versions = list()
+        for i in range(10):
+            with repo.transaction():
+                repo[str(i)] = dict(value=[i])
+                if i: repo[str(i - 1)]['value'].append(i)
+                if i > 1: del repo[str(i - 2)]
+            versions.append(dict(repo))
+
+        for index in (8, 3, 4, 0, 9, 5, 5):
+            repo.checkout(index)
+            self.assertEqual(versions[index], repo, f'Checkout of {index} failed!')
+
+        reloaded = jsonvc.JSONVC('checkout.jsonvc')
+        self.assertTrue(all(entry.inverse is not None for entry in reloaded.entries[1:]))
+        reloaded.checkout(2)
+        self.assertEqual(versions[2], reloaded)
+
+    def test_value_at(self):
+        repo = jsonvc.JSONVC('value_at.jsonvc', checkpoint_interval=4, checkpoint_size=0, track_nested=True)
+        for i in range(12):
+            with repo.transaction():
+                repo[str(i % 3)] = dict(value=[i])
+                if i % 2 and str((i + 1) % 3) in repo: repo[str((i + 1) % 3)]['value'].append(i)
+                if i % 5 == 4 and str((i + 2) % 3) in repo: del repo[str((i + 2) % 3)]
+
+        for index in range(len(repo.entries)):
+            state = repo.state(index)
+            for key in ('0', '1', '2', 'x',):
+                if key in state: self.assertEqual(state[key], repo.value_at(key, index), f'{key} at {index} differs!')
+                else: self.assertRaises(KeyError, repo.value_at, key, index)
+        self.assertEqual(repo['0'], repo.value_at('0'))
+        self.assertEqual(repo['0'], repo.value_at('0', timestamp=repo.entries[-1].timestamp))
+        self.assertRaises(KeyError, repo.value_at, '0', -1)
+        self.assertRaises(IndexError, repo.value_at, '0', -2)
+        self.assertRaises(IndexError, repo.value_at, '0', len(repo.entries))
+        self.assertTrue(any(entry.patches for entry in repo.entries), 'No nested changes were tested!')
+
+    def test_key_history(self):
+        repo = jsonvc.JSONVC('key_history.jsonvc')
+        repo['a'] = 1
+        repo['b'] = 2
+        repo['a'] = 3
+        del repo['b']
+        self.assertEqual([0, 2], repo.key_history('a'))
+        self.assertEqual([1, 3], repo.key_history('b'))
+        self.assertEqual([], repo.key_history('c'))
+        self.assertEqual(jsonvc.JSONVC('key_history.jsonvc').key_history('b'), repo.key_history('b'))
+
+        repo.reset(3)
+        self.assertEqual([1], repo.key_history('b'))
+        repo.strip(1)
+        self.assertEqual([1], repo.key_history('a'))
+
+    def test_diff_between(self):
+        repo = jsonvc.JSONVC('diff_between.jsonvc', checkpoint_interval=4, checkpoint_size=0, track_nested=True)
+        for i in range(10):
+            with repo.transaction():
+                repo[str(i % 3)] = dict(value=[i])
+                if i % 2 and str((i + 1) % 3) in repo: repo[str((i + 1) % 3)]['value'].append(i)
+                if i % 4 == 3 and str((i + 2) % 3) in repo: del repo[str((i + 2) % 3)]
+
+        # inverses are known for the built repo, but not for the loaded one
+        for current in (repo, jsonvc.JSONVC('diff_between.jsonvc', keys=()),):
+            for start in range(-1, len(repo.entries)):
+                for stop in range(-1, len(repo.entries)):
+                    data = current.diff_between(start, stop).apply(repo.state(start))
+                    self.assertEqual(repo.state(stop), data, f'{start} to {stop} differs!')
+        self.assertFalse(repo.diff_between(3, 3))
+        self.assertEqual(repo.diff_between(0), repo.diff_between(0, stop_timestamp=repo.entries[-1].timestamp))
+        self.assertRaises(IndexError, repo.diff_between, 0, len(repo.entries))
+
+    def test_iter_versions(self):
+        repo = jsonvc.JSONVC('iter_versions.jsonvc', checkpoint_interval=4, checkpoint_size=0, track_nested=True)
+        for i in range(10):
+            with repo.transaction():
+                repo[str(i % 3)] = dict(value=[i])
+                if i % 2 and str((i + 1) % 3) in repo: repo[str((i + 1) % 3)]['value'].append(i)
+                if i % 4 == 3 and str((i + 2) % 3) in repo: del repo[str((i + 2) % 3)]
+
+        versions = [(index, timestamp, dict(data),) for index, timestamp, data, in repo.iter_versions()]
+        self.assertEqual([(index, entry.timestamp, repo.state(index),) for index, entry in enumerate(repo.entries)],
+                         versions)
+        self.assertEqual(versions[5:7], [(index, timestamp, dict(data),)
+                                         for index, timestamp, data, in repo.iter_versions(5, 7)])
+        self.assertEqual([], list(repo.iter_versions(3, 3)))
+        self.assertRaises(IndexError, repo.iter_versions, 0, len(repo.entries) + 1)
+        self.assertRaises(TypeError, setitem, next(repo.iter_versions())[2], 'x', 1)  # read-only
+        self.assertEqual(versions[-1][2], repo)
+
+    def test_projection(self):
+        repo = jsonvc.JSONVC('projection.jsonvc', checkpoint_interval=5, checkpoint_size=0, track_nested=True)
+        for i in range(13):
+            repo[f'key{i % 4}'] = dict(value=[i])
+            if i % 3: repo['key0']['value'].append(i)
+        versions = [repo.state(index) for index in range(len(repo.entries))]
+
+        keys = ('key0', 'key2', 'missing',)
+        projected = jsonvc.JSONVC('projection.jsonvc', keys=keys)
+        self.assertEqual(dict((key, repo[key],) for key in keys if key in repo), projected)
+        for index, version in enumerate(versions):
+            expected = dict((key, value,) for key, value in version.items() if key in keys)
+            self.assertEqual(expected, projected.materialize(index=index), f'Projection at {index} differs!')
+            self.assertEqual(dict(key1=version['key1']) if 'key1' in version else dict(),
+                             repo.materialize(['key1'], index))
+        self.assertEqual(versions[-1], projected.state(len(versions) - 1))
+
+        projected.checkout(3)
+        self.assertEqual(projected.materialize(index=3), projected)
+        projected.checkout(len(versions) - 1)
+        projected['key2'] = 'changed'
+        self.assertIsNone(projected.entries[-1].inverse)
+        self.assertEqual(dict(versions[-1], key2='changed'), jsonvc.JSONVC('projection.jsonvc'))
+
+    def test_compact(self):
+        repo = jsonvc.JSONVC('compact.jsonvc', checkpoint_interval=4, checkpoint_size=0, track_nested=True)
+        for i in range(20):
+            repo[f'key{i % 6}'] = dict(value=[i])
+            if i % 3: repo['key0']['value'].append(i)
+            if i % 7 == 6: del repo[f'key{(i + 1) % 6}']
+        versions = [repo.state(index) for index in range(len(repo.entries))]
+        for number, entry in enumerate(repo.entries): entry.timestamp = 1598787392 + number // 3 * 10 + number % 3
+
+        self.assertEqual(0, repo.compact(index=1))
+        saved = repo.compact(index=8)
+        self.assertLess(0, saved)
+        self.assertEqual(len(versions) - 7, len(repo.entries))
+        reloaded = jsonvc.JSONVC('compact.jsonvc')
+        for index in range(len(reloaded.entries)):
+            reloaded.build(index)
+            self.assertEqual(versions[index + 7], reloaded, f'Version {index + 7} changed!')
+
+        reloaded.compact(window=5)
+        self.assertEqual(len(set(number // 3 for number in range(7, len(versions)))), len(reloaded.entries))
+        self.assertEqual(versions[-1], jsonvc.JSONVC('compact.jsonvc'))
+        self.assertEqual(versions[11], reloaded.state(1))
+
+        previous = reloaded.state(len(reloaded.entries) - 2)
+        reloaded.compact(keep=2)
+        self.assertEqual(3, len(reloaded.entries), 'The base entry was not added to the entries kept!')
+        self.assertEqual([previous, versions[-1]], [reloaded.state(1), reloaded.state(2)])
+
+    def test_stored_inverses(self):
+        repo = jsonvc.JSONVC('inverses.jsonvc', store_inverses=True)
+        repo['a'] = 1
+        repo['a'] = 2
+        self.assertEqual(
+            [1598787392, dict(a=2), list(), dict(inverse=[dict(a=1), list(), list()])],
+            [1598787392] + jsonvc.tools.load('inverses.jsonvc')[1][1:]
+        )
+
+    def test_revert(self):
+        repo = jsonvc.JSONVC('revert.jsonvc')
+        repo['a'] = 1
+        jsonvc.JSONVC.AUTO_COMMIT = False
+        try:
+            repo['a'] = 2
+            repo['b'] = 3
+            repo.add()
+            del repo['a']
+            repo.revert()
+        finally: jsonvc.JSONVC.AUTO_COMMIT = True
+
+        self.assertEqual(dict(a=1), repo)
+        self.assertEqual(1, len(repo.entries))
+
+    def test_timestamps(self):
+        jsonvc.tools.dump('timestamps.jsonvc', [[10 * i, {str(i): i}, list()] for i in range(10)])
+        repo = jsonvc.JSONVC('timestamps.jsonvc')
+
+        self.assertEqual([30, 40, 50], [entry.timestamp for entry in repo.entries_between(25, 50)])
+        self.assertEqual([], repo.entries_between(91, 100))
+        self.assertEqual(dict((str(i), i) for i in range(5)), repo.as_of(45))
+        self.assertEqual(dict(), repo.as_of(-1))
+        self.assertEqual(dict((str(i), i) for i in range(10)), repo)
+
+        repo.strip(timestamp=20)
+        self.assertEqual(20, repo.timestamps[0])
+        repo.reset(timestamp=50)
+        self.assertEqual(list(range(20, 50, 10)), list(repo.timestamps))
+        repo['a'] = 1
+        self.assertEqual([entry.timestamp for entry in repo.entries], list(repo.timestamps))
+
+    def test_verify(self):
+        self.assertTrue(jsonvc.JSONVC.verify(data=[[1, dict(a=1), list()], [1, dict(b=1), list()]]))
+        self.assertFalse(jsonvc.JSONVC.verify(data=[[2, dict(a=1), list()], [1, dict(b=1), list()]]))
+
+    def test_transaction(self):
+        repo = jsonvc.JSONVC('transaction.jsonvc')
+        with repo.transaction():
+            for i in range(10): repo[str(i)] = i
+            with repo.transaction(): repo.pop('0')
+            self.assertFalse(repo.entries)
+
+        self.assertEqual(1, len(repo.entries))
+        self.assertEqual(1, len(jsonvc.tools.load('transaction.jsonvc')))
+        self.assertEqual(dict((str(i), i) for i in range(1, 10)), jsonvc.JSONVC('transaction.jsonvc'))
+
+    def test_state_uncommitted(self):
+        repo = jsonvc.JSONVC('state_uncommitted.jsonvc')
+        repo['a'] = 1
+        with repo.transaction():
+            repo['b'] = 2
+            self.assertEqual(dict(a=1), repo.state(0))
+            self.assertEqual(repo.materialize(index=0), repo.state(0))
+        self.assertEqual(dict(a=1, b=2), repo.state(1))
+
+    def test_transaction_rollback(self):
+        repo = jsonvc.JSONVC('rollback.jsonvc')
+        repo['a'] = 1
+        try:
+            with repo.transaction():
+                repo['b'] = 2
+                del repo['a']
+                raise KeyError('b')
+        except KeyError: pass
+
+        self.assertEqual(dict(a=1), repo)
+        self.assertFalse(repo.diff)
+        self.assertEqual(1, len(repo.entries))
+
+    def test_transaction_rollback_strip(self):
+        repo = jsonvc.JSONVC('rollback_strip.jsonvc', checkpoint_interval=3, checkpoint_size=0)
+        for i in range(8): repo[f'k{i}'] = i
+        versions = [repo.state(index) for index in range(8)]
+        try:
+            with repo.transaction():
+                repo.strip(2)
+                raise KeyError('k0')
+        except KeyError: pass
+        self.assertEqual(versions, [repo.materialize(index=index) for index in range(8)])
+        repo.build(5)
+        self.assertEqual(versions[5], repo)
+
+    def test_async_transaction(self):
+        repo = jsonvc.JSONVC('async.jsonvc')
+
+        async def change(key: str) -> None:
+            async with repo.transaction():
+                repo[key + '1'] = 1
+                await sleep(0)
+                repo[key + '2'] = 2
+
+        async def changes() -> None: await gather(change('a'), change('b'))
+
+        loop = new_event_loop()
+        loop.run_until_complete(changes())
+        loop.close()
+        self.assertEqual(
+            [{'a1', 'a2'}, {'b1', 'b2'}],
+            sorted(set(entry.changes) for entry in repo.entries)
+        )
+
+    def test_async_transaction_other_task(self):
+        repo = jsonvc.JSONVC('async_other.jsonvc')
+        repo['a'] = 1
+        seen = list()
+
+        async def failing() -> None:
+            async with repo.transaction():
+                repo['a'] = 2
+                await sleep(0)
+                await sleep(0)
+                seen.append(dict(repo))
+                raise KeyError('a')
+
+        async def other() -> None:
+            seen.append(repo.pop('a'))  # sees what was committed only
+            repo['b'] = 2
+
+        async def changes() -> None: await gather(failing(), other(), return_exceptions=True)
+
+        loop = new_event_loop()
+        loop.run_until_complete(changes())
+        loop.close()
+        self.assertEqual([1, dict(b=2)], seen)
+        self.assertEqual(dict(b=2), repo)
+        self.assertEqual(dict(b=2), jsonvc.JSONVC('async_other.jsonvc'))
+        self.assertEqual([dict(a=1), dict(), dict(b=2)], [entry.changes for entry in repo.entries])
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-22"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase, skipUnless, mock
+from importlib import reload, import_module
+from contextlib import redirect_stdout
+from io import StringIO
+import socket
+import jsonvc
+
+
+@skipUnless(hasattr(socket, 'AF_UNIX'), 'No unix domain sockets')
+class ServerTest(TestCase):
+    def setUp(self) -> None:
+        # other tests reload the repo module (pyfakefs), the daemon has to use the current one
+        self.server, self.cli, = reload(import_module('jsonvc.server')), reload(import_module('jsonvc.cli'))
+        self.directory = TemporaryDirectory()  # sockets need actual files
+        self.cwd = self.directory.name
+        self.socket = Path(self.cwd) / 'jsonvc.sock'
+        jsonvc.JSONVC(Path(self.cwd) / 'repo.jsonvc').update(dict(a=1))
+
+    def tearDown(self) -> None: self.directory.cleanup()
+
+    def request(self, *argv: str):
+        return self.server.request(['-ni', *argv], self.cwd, self.socket)
+
+    def test_server(self):
+        self.assertIsNone(self.request('log', 'repo.jsonvc'), 'No daemon running!')
+
+        server = self.server.Server(self.socket, self.cli.execute)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            self.assertRaises(RuntimeError, self.server.Server, self.socket, self.cli.execute)
+            self.assertEqual(0o600, self.socket.stat().st_mode & 0o777)
+            with mock.patch.object(self.server, 'UID', self.server.UID + 1):
+                self.assertIsNone(self.request('log', 'repo.jsonvc'), 'Talked to a daemon of another user!')
+            self.assertEqual((0, 'Repo updtated and committed.\n', '',),
+                             self.request('commit', 'repo.jsonvc', '{"b": 2}'))
+            repo = server.repos.open(Path(self.cwd) / 'repo.jsonvc')
+            self.assertEqual(dict(b=2), repo)
+
+            code, output, errors, = self.request('diff', 'repo.jsonvc', '--from', '0')
+            self.assertEqual(0, code)
+            self.assertIn('b: 2', output)
+            self.assertIs(repo, server.repos.open(Path(self.cwd) / 'repo.jsonvc'), 'Repo was not kept in memory!')
+
+            jsonvc.JSONVC(Path(self.cwd) / 'repo.jsonvc').update(dict(c=3))  # without the daemon
+            code, output, errors, = self.request('log', 'repo.jsonvc')
+            self.assertIn('3 entries', output)
+            self.assertEqual(1, self.request('reset', 'repo.jsonvc', '-i', '5')[0])
+            self.assertEqual(0, self.request('reset', 'repo.jsonvc', '-i', '1')[0])
+            self.assertEqual(dict(a=1), jsonvc.JSONVC(Path(self.cwd) / 'repo.jsonvc'))
+            self.assertEqual(2, self.request('init', 'other.jsonvc')[0])
+            self.assertEqual((1, '', f'No repo at {Path(self.cwd) / "missing.jsonvc"}!',),
+                             self.request('log', 'missing.jsonvc'))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        self.assertFalse(self.socket.exists())
+        self.assertIsNone(self.request('log', 'repo.jsonvc'))
+
+    def test_shared_directory(self):
+        shared = Path(self.cwd) / 'shared'
+        shared.mkdir()
+        shared.chmod(0o777)
+        self.assertRaises(RuntimeError, self.server.Server, shared / 'jsonvc.sock', self.cli.execute)
+
+    def test_run_output(self):
+        args = self.cli.command_parser().parse_args(['log', str(Path(self.cwd) / 'repo.jsonvc')])
+        with redirect_stdout(StringIO()) as output: self.assertEqual(0, self.cli.run(args))
+        self.assertIn('1 entries', output.getvalue())
+
+        timestamp = jsonvc.JSONVC(Path(self.cwd) / 'repo.jsonvc').entries[0].timestamp
+        args = self.cli.command_parser().parse_args(
+            ['diff', str(Path(self.cwd) / 'repo.jsonvc'), '--from-timestamp', '0', '--to-timestamp', str(timestamp)])
+        with redirect_stdout(StringIO()) as output: self.assertEqual(0, self.cli.run(args))
+        self.assertIn('a: 1', output.getvalue())
+
+
+if __name__ == '__main__': pass
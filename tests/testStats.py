@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-21"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import jsonvc
+import jsonvc.stats
+
+
+class StatsTest(TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()  # lazy repos map actual files
+        self.path = Path(self.directory.name) / 'repo.jsonvc'
+        repo = jsonvc.JSONVC(self.path, codec='zlib', checkpoint_interval=4)
+        for i in range(10): repo[str(i % 3)] = 'value' * i
+
+    def tearDown(self) -> None: self.directory.cleanup()
+
+    def test_disabled(self):
+        repo = jsonvc.JSONVC(self.path)
+        self.assertIsNone(repo.stats)
+        self.assertIsNone(jsonvc.stats.current())
+        repo['new'] = True  # nothing to report to
+
+    def test_stats(self):
+        reported = list()
+        stats = jsonvc.stats.Stats(lambda *measurement: reported.append(measurement))
+        repo = jsonvc.JSONVC(self.path, stats=stats)
+        self.assertIsNone(jsonvc.stats.current(), 'Stats stayed active!')
+        self.assertEqual({'load', 'build', 'read', 'decompress', 'decode'}, set(stats.timings))
+        self.assertEqual(1, stats.timings['load'].count)
+        self.assertEqual(self.path.stat().st_size, stats.counters['bytes_read'])
+        self.assertEqual(10, stats.counters['entries_read'])
+        self.assertGreater(stats.counters['raw_bytes_read'], stats.counters['bytes_read'] - 100)
+        self.assertEqual(1, stats.counters['entries_replayed'])  # from the checkpoint at 8
+
+        stats.reset()
+        size = self.path.stat().st_size
+        repo['new'] = 'value' * 100
+        self.assertEqual({'commit', 'encode', 'compress', 'write'}, set(stats.timings))
+        self.assertEqual(self.path.stat().st_size - size, stats.counters['bytes_written'])
+        self.assertGreater(stats.counters['raw_bytes_written'], stats.counters['bytes_written'])
+        self.assertEqual(1, stats.counters['entries_written'])
+        self.assertIn(('count', 'entries_written', 1), reported)
+        self.assertIn('timing', [kind for kind, name, value in reported if name == 'commit'])
+
+        stats.reset()
+        repo.state(2)
+        self.assertEqual(3, stats.counters['entries_replayed'])
+        self.assertEqual(['state'], list(stats.as_dict()['timings']))
+
+    def test_lazy(self):
+        stats = jsonvc.stats.Stats()
+        repo = jsonvc.JSONVC(self.path, lazy=True, stats=stats)
+        self.assertEqual(2, stats.counters['entries_read'])  # the checkpoint and the entry after it
+        repo.build(2)
+        self.assertEqual(2 + 3, stats.counters['entries_read'])
+        self.assertEqual(3, stats.timings['decode'].count - 2)
+        repo.close()
+
+    def test_write_behind(self):
+        stats = jsonvc.stats.Stats()
+        repo = jsonvc.JSONVC(self.path, write_behind=True, stats=stats)
+        stats.reset()
+        for i in range(5): repo[str(i)] = i
+        repo.flush()
+        self.assertEqual(5, stats.counters['entries_written'])
+        self.assertEqual(5, stats.timings['commit'].count)
+        repo.close()
+
+    def test_sqlite(self):
+        stats = jsonvc.stats.Stats()
+        path = self.path.with_suffix('.db')
+        repo = jsonvc.JSONVC(path, stats=stats)
+        repo['key'] = 'value'
+        self.assertEqual(1, stats.counters['entries_written'])
+        self.assertEqual(stats.counters['bytes_written'], stats.counters['raw_bytes_written'])
+        repo.close()
+        stats.reset()
+        jsonvc.JSONVC(path, stats=stats).close()
+        self.assertEqual(1, stats.counters['entries_read'])
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-17"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import jsonvc
+import jsonvc.locking
+import jsonvc.storage
+
+
+class StorageTest(TestCase):
+    def setUp(self) -> None:
+        self.directory = TemporaryDirectory()  # sqlite needs actual files
+        self.path = Path(self.directory.name) / 'repo.db'
+        self.repo = jsonvc.JSONVC(self.path, checkpoint_interval=4, checkpoint_size=0, track_nested=True)
+        self.versions = list()
+        for i in range(10):
+            with self.repo.transaction():
+                self.repo[str(i % 3)] = dict(value=[i])
+                if i % 2 and str((i + 1) % 3) in self.repo: self.repo[str((i + 1) % 3)]['value'].append(i)
+                if i % 4 == 3 and str((i + 2) % 3) in self.repo: del self.repo[str((i + 2) % 3)]
+            self.versions.append(dict(self.repo))
+
+    def tearDown(self) -> None:
+        self.repo.close()
+        self.directory.cleanup()
+
+    def count(self, storage: jsonvc.storage.SQLiteStorage) -> int:
+        return storage.execute('SELECT COUNT(*) FROM entries')[0][0]
+
+    def test_sqlite(self):
+        self.assertIsInstance(self.repo.storage, jsonvc.storage.SQLiteStorage)
+        self.assertEqual(10, self.count(self.repo.storage))
+        loaded = jsonvc.JSONVC(self.path)
+        self.assertEqual(self.versions[-1], loaded)
+        self.assertEqual([loaded.state(index) for index in range(10)], self.versions)
+        self.assertEqual(self.repo.key_history('1'), loaded.key_history('1'))
+        loaded.close()
+
+        self.repo.reset(6)
+        self.assertEqual(6, self.count(self.repo.storage))
+        self.assertEqual(self.versions[5], jsonvc.JSONVC(self.path))
+        self.repo['x'] = 1
+        self.assertEqual(dict(self.versions[5], x=1), jsonvc.JSONVC(self.path))
+        self.repo.strip(6)
+        self.assertEqual(1, self.count(self.repo.storage))
+        self.assertEqual(dict(x=1), jsonvc.JSONVC(self.path))
+
+    def test_lazy(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True, keys=['0'])
+        self.assertEqual(dict((key, value,) for key, value in self.versions[-1].items() if key == '0'), repo)
+        loaded = set(index for index, entry in enumerate(repo.entries) if entry.loaded)
+        self.assertLessEqual(loaded, set(self.repo.key_history('0')) | {4, 8}, 'Entries not touching it were decoded!')
+        for index in range(10):
+            if '1' in self.versions[index]: self.assertEqual(self.versions[index]['1'], repo.value_at('1', index))
+        self.assertEqual(self.repo.key_history('2'), repo.key_history('2'))
+
+    def test_write_behind(self):
+        repo = jsonvc.JSONVC(self.path, write_behind=True)
+        repo['x'] = 1
+        repo.reset(8)
+        repo['y'] = 2
+        repo.flush()
+        self.assertEqual(dict(self.versions[7], y=2), jsonvc.JSONVC(self.path))
+        repo.close()
+
+    def test_convert(self):
+        log = Path(self.directory.name) / 'repo.jsonvc'
+        self.assertEqual(10, jsonvc.storage.convert(self.path, log, 'zlib:1'))
+        self.assertIsInstance(jsonvc.storage.open_storage(log), jsonvc.storage.LogStorage)
+        self.assertEqual(self.versions[-1], jsonvc.JSONVC(log))
+        copy = Path(self.directory.name) / 'copy'
+        jsonvc.storage.convert(log, copy.with_suffix('.sqlite'))
+        copy = copy.with_suffix('.sqlite').rename(copy)  # detected by its content as well
+        self.assertIsInstance(jsonvc.storage.open_storage(copy), jsonvc.storage.SQLiteStorage)
+        self.assertEqual(self.versions[-1], jsonvc.JSONVC(copy))
+
+    def test_truncate_log(self):
+        log = Path(self.directory.name) / 'repo.jsonvc'
+        jsonvc.storage.convert(self.path, log)
+        repo = jsonvc.JSONVC(log)
+        size = log.stat().st_size
+        repo.reset(5)
+        self.assertLess(log.stat().st_size, size)
+        self.assertEqual(self.versions[4], jsonvc.JSONVC(log))
+        self.assertEqual(5, len(jsonvc.JSONVC(log, lazy=True).entries))
+
+    def test_lazy_truncated(self):
+        repo = jsonvc.JSONVC(self.path, lazy=True)
+        self.repo.reset(6)
+        self.repo['x'] = 1  # takes the position of a row the lazy repo did not decode yet
+        self.assertEqual(self.versions[5], repo.state(5))
+        self.assertRaises(jsonvc.locking.ConflictError, repo.state, 7)
+        repo.close()
+
+
+if __name__ == '__main__': pass
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-19"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+from threading import Thread, Barrier, Event
+from concurrent.futures import ThreadPoolExecutor
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+import jsonvc.threadsafe
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class ThreadSafeTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.repo, jsonvc.threadsafe, jsonvc])
+
+    def test_lock(self):
+        lock = jsonvc.threadsafe.RWLock()
+        barrier = Barrier(2, timeout=5)
+
+        def read() -> None:
+            lock.acquire_read()
+            try: barrier.wait()  # only passes if both threads read at once
+            finally: lock.release_read()
+
+        threads = [Thread(target=read) for _ in range(2)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertFalse(barrier.broken)
+
+        written = Event()
+        lock.acquire_read()
+        writer = Thread(target=lambda: (lock.acquire_write(), written.set(), lock.release_write()))
+        writer.start()
+        self.assertFalse(written.wait(0.1), 'Writing while reading!')
+        self.assertRaises(RuntimeError, lock.acquire_write)
+        lock.release_read()
+        writer.join()
+        self.assertTrue(written.is_set())
+
+        lock.acquire_write()
+        lock.acquire_write()
+        lock.acquire_read()  # the writer can read as well
+        lock.release_read()
+        lock.release_write()
+        lock.release_write()
+        self.assertIsNone(lock.writer)
+
+    def test_threads(self):
+        repo = jsonvc.threadsafe.ThreadSafeJSONVC('threads.jsonvc')
+        repo.update(dict(a=0, b=0))
+        mismatches = list()
+
+        def write(worker: int) -> None:
+            for i in range(20):
+                repo[f'{worker}-{i}'] = i
+                with repo.transaction():
+                    repo['a'] = worker * 100 + i
+                    repo['b'] = worker * 100 + i
+
+        def read() -> None:
+            for _ in range(200):
+                data = repo.snapshot()
+                if data['a'] != data['b']: mismatches.append(data)
+                items = dict(repo.items())
+                if items['a'] != items['b']: mismatches.append(items)
+
+        with ThreadPoolExecutor(8) as executor:
+            futures = [executor.submit(write, worker) for worker in range(4)] + \
+                      [executor.submit(read) for _ in range(4)]
+            for future in futures: future.result()
+        self.assertEqual([], mismatches, 'Readers saw half-applied transactions!')
+        self.assertEqual(1 + 4 * 20 * 2, len(repo.entries))
+        self.assertEqual(dict(repo), jsonvc.JSONVC('threads.jsonvc'))
+        self.assertEqual(2 + 4 * 20, len(repo))
+
+    def test_iter_versions(self):
+        repo = jsonvc.threadsafe.ThreadSafeJSONVC('versions.jsonvc')
+        for i in range(5): repo[str(i)] = i
+        versions = repo.iter_versions()
+        first = dict(next(versions)[2])
+        writer = Thread(target=repo.update, args=(dict(x=1),))
+        writer.start()
+        writer.join(5)
+        self.assertFalse(writer.is_alive(), 'Iterating blocked writers in between steps!')
+        self.assertEqual([repo.state(index) for index in range(5)], [first] + [dict(data) for _, _, data, in versions])
+
+
+if __name__ == '__main__': pass
@@ -71,6 +71,41 @@ class ToolsTest(TestCase):
                              'Failed to read file! Did you attempt to read a compressed file without decompression?')
         else: self.fail('Should have raised an Exception!')
 
+    def test_log(self):
+        path_compress = 'compressed_log.jsonvc'
+        path_uncompress = 'uncompressed_log.jsonvc'
+        data = [[1598787392, dict(a=1), list()], [1598787393, dict(), ['a']]]
+
+        for path, comp in ((path_compress, True,), (path_uncompress, False,),):
+            jsonvc.tools.dump_log(path, data[:1], comp=comp)
+            self.assertTrue(jsonvc.tools.is_log(path))
+            size = Path(path).stat().st_size
+            jsonvc.tools.append(path, data[1:])
+            self.assertEqual(
+                data,
+                jsonvc.tools.load(path),
+                'Appended log was not loaded properly!'
+            )
+            self.assertEqual(
+                size + len(jsonvc.tools.frame(data[1], comp)),
+                Path(path).stat().st_size,
+                'Log was not just appended to!'
+            )
+
+        self.assertEqual(
+            data[:1],
+            jsonvc.tools.load_log(Path(path_compress).read_bytes()[:-3]),
+            'Truncated record was not ignored!'
+        )
+
+        Path(path_compress).write_bytes(Path(path_compress).read_bytes()[:-3])  # crashed while appending
+        jsonvc.tools.append(path_compress, [[1598787394, dict(b=2), list()]])
+        self.assertEqual(
+            data[:1] + [[1598787394, dict(b=2), list()]],
+            jsonvc.tools.load(path_compress),
+            'Truncated record was not dropped before appending!'
+        )
+
     def test_diff(self):
         self.assertEqual(
             None,
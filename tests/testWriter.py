@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+__author__ = "Robin 'r0w' Weiland"
+__date__ = "2020-09-09"
+__version__ = "0.0.0"
+
+__all__ = ()
+
+import jsonvc
+import jsonvc.repo
+import jsonvc.tools
+import jsonvc.writer
+from pyfakefs.fake_filesystem_unittest import TestCase
+
+
+class WriterTest(TestCase):
+    def setUp(self) -> None:
+        self.setUpPyfakefs(modules_to_reload=[jsonvc.tools, jsonvc.writer, jsonvc.repo, jsonvc])
+
+    def test_write_behind(self):
+        repo = jsonvc.JSONVC('behind.jsonvc', write_behind=True)
+        for i in range(50):
+            repo[str(i)] = i
+            self.assertEqual(i, repo[str(i)])
+        for i in range(0, 50, 10): del repo[str(i)]
+        repo.flush()
+
+        self.assertEqual(dict((str(i), i) for i in range(50) if i % 10), jsonvc.JSONVC('behind.jsonvc'))
+        self.assertFalse(repo.commit().result(), 'Committing nothing returned a truthy future!')
+
+        repo.reset(10)
+        repo['x'] = 1
+        repo.close()
+        self.assertEqual(dict(((str(i), i) for i in range(10)), x=1), jsonvc.JSONVC('behind.jsonvc'))
+
+        repo['y'] = 2  # closed repos write directly
+        self.assertEqual(2, jsonvc.JSONVC('behind.jsonvc')['y'])
+
+    def test_future(self):
+        jsonvc.JSONVC.AUTO_COMMIT = False
+        try:
+            repo = jsonvc.JSONVC('future.jsonvc', write_behind=True)
+            repo['a'] = 1
+            repo.add()
+            self.assertTrue(repo.commit().result(timeout=5))
+            self.assertEqual(dict(a=1), jsonvc.JSONVC('future.jsonvc'))
+            repo.close()
+        finally: jsonvc.JSONVC.AUTO_COMMIT = True
+
+    def test_errors(self):
+        writer = jsonvc.writer.Writer()
+        future = writer.submit('missing.jsonvc', [[1598787392, dict(a=1), list()]])
+        self.assertIsInstance(future.exception(timeout=5), OSError)
+        self.assertRaises(OSError, writer.flush)
+        writer.flush()  # errors only get raised once
+        writer.close()
+        self.assertRaises(RuntimeError, writer.submit, 'missing.jsonvc', list())
+
+
+if __name__ == '__main__': pass